@@ -0,0 +1,145 @@
+"""Offline fixtures for the benchmarks.
+
+Recorded data comes from the repo (vluchten.json, src/data/*.json) and,
+when present, saved ticket_search_response.html files (plus an optional
+home.html with the booking page) in benchmarks/recorded/. Scaled-up versions are generated deterministically
+from a fixed seed so every run measures the same input.
+"""
+
+import copy
+import glob
+import json
+import os
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded")
+
+FORM_ID = "_ossportlet_WAR_ossliferay_:formSearchTravel"
+HOME_PAGE = "home.html"
+
+
+def load_json(relative_path):
+    with open(os.path.join(ROOT, relative_path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def recorded_flights():
+    """name -> SerpApi result dict for the dumps checked into the repo"""
+    fixtures = {}
+    for name, path in (
+        ("vluchten", "vluchten.json"),
+        ("vluchten_expanded", "src/data/vluchten_expanded.json"),
+    ):
+        if os.path.exists(os.path.join(ROOT, path)):
+            fixtures[name] = load_json(path)
+    return fixtures
+
+
+def recorded_ticket_responses():
+    """name -> raw partial-response text saved from sar.hhr.sa"""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(RECORDED_DIR, "*.html"))):
+        if os.path.basename(path) == HOME_PAGE:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            fixtures[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return fixtures
+
+
+def recorded_home_page():
+    """Saved sar.hhr.sa booking home page, or None"""
+    path = os.path.join(RECORDED_DIR, HOME_PAGE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def home_page(view_state):
+    """Minimal booking home page carrying the JSF ViewState input"""
+    return (
+        "<!DOCTYPE html><html><head><title>Booking</title></head><body>"
+        f'<form id="{FORM_ID}" method="post">'
+        f'<select name="{FORM_ID}:comboStationFrom"></select>'
+        f'<select name="{FORM_ID}:comboStationTo"></select>'
+        '<input type="hidden" name="javax.faces.ViewState" '
+        f'id="javax.faces.ViewState" value="{view_state}" autocomplete="off" />'
+        "</form></body></html>"
+    )
+
+
+def ticket_row(i, rng):
+    departure = rng.randrange(5 * 60, 23 * 60)
+    duration = rng.choice((108, 114, 120, 135))
+    arrival = (departure + duration) % (24 * 60)
+    stops = rng.choice(("Non-stop", "Non-stop", "1 Stop", "2 Stop"))
+    return (
+        f'<tr data-ri="{i}" class="ui-widget-content" role="row">'
+        f'<td role="gridcell"><span class="icon-train"></span></td>'
+        f'<td role="gridcell"><span>{departure // 60:02d}:{departure % 60:02d}</span></td>'
+        f'<td role="gridcell"><span>{arrival // 60:02d}:{arrival % 60:02d}</span></td>'
+        f'<td role="gridcell">{duration // 60}h {duration % 60}m</td>'
+        f'<td role="gridcell">Train {30000 + i % 70000} {stops}</td>'
+        f"</tr>"
+    )
+
+
+def result_table(table_id, rows, seed):
+    rng = random.Random(seed)
+    table = "".join(ticket_row(i, rng) for i in range(rows))
+    return (
+        f'<div id="{FORM_ID}:{table_id}" class="ui-datatable">'
+        f'<table role="grid"><tbody class="ui-datatable-data">{table}</tbody></table>'
+        "</div>"
+    )
+
+
+def ticket_response(rows, seed=0, return_seed=None):
+    """JSF partial response with a result table of `rows` trains.
+
+    With a return_seed it is a round-trip response: the whole form is
+    re-rendered, holding the outbound and the return table.
+    """
+    if return_seed is None:
+        update_id = f"{FORM_ID}:tableResult"
+        content = result_table("tableResult", rows, seed)
+    else:
+        update_id = FORM_ID
+        content = (
+            f'<form id="{FORM_ID}">'
+            f'{result_table("tableResult", rows, seed)}'
+            f'{result_table("tableResultReturn", rows, return_seed)}'
+            "</form>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><partial-response><changes>'
+        f'<update id="{update_id}"><![CDATA[{content}]]></update>'
+        '<update id="javax.faces.ViewState"><![CDATA[-1234567890:987654321]]></update>'
+        "</changes></partial-response>"
+    )
+
+
+def scaled_flights(template, count, seed=0):
+    """SerpApi result dict with `count` flights copied from `template`,
+    split 20/80 over best_flights/other_flights with jittered prices"""
+    rng = random.Random(seed)
+    pool = [
+        f
+        for key in ("best_flights", "other_flights", "cheapest_flights")
+        for f in template.get(key) or []
+    ]
+    flights = []
+    for i in range(count):
+        flight = copy.deepcopy(pool[i % len(pool)])
+        flight["price"] = max(1, flight.get("price", 1000) + rng.randint(-300, 300))
+        for leg in flight.get("flights", []):
+            leg["flight_number"] = f"{leg['flight_number'].split()[0]} {100 + i}"
+        flights.append(flight)
+    best = count // 5
+    data = {
+        key: value for key, value in template.items() if not key.endswith("_flights")
+    }
+    data["best_flights"] = flights[:best]
+    data["other_flights"] = flights[best:]
+    return data
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Load driver for the scraper stack against the local replay server.
+
+Starts replay_server.ReplayServer in-process (or uses --url), points the
+scrapers at it and runs end-to-end searches from `--concurrency` threads:
+
+- trains: SimpleTicketScraper.get_tickets (bootstrap, priming, search,
+  parse) on a shared HttpEngine, through the real rate limiter; with
+  --round-trip get_round_trip, returning a week later,
+- flights: flight_batch.search_many -> fetch_flights -> serpapi_get.
+
+Reports searches per second, p50/p95/p99 latency, failures and the
+server's and rate limiter's counters:
+
+    python benchmarks/load.py trains --searches 500 --concurrency 16 \\
+        --latency-ms 200 --jitter-ms 300 --error-rate 0.02 --view-state-uses 20
+    python benchmarks/load.py flights --searches 200 --flights 1000
+
+The limiter for the stand-in host starts from the real host's settings;
+--rate overrides it (e.g. a high value to measure the stack unthrottled).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit
+
+from fixtures import ROOT
+from replay_server import add_server_arguments, server_from_args
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "flights-scraper"))
+
+import index  # noqa: E402
+import rate_limit  # noqa: E402
+from flight_batch import FlightQuery, percentile, search_many  # noqa: E402
+from scraper_http import HttpEngine  # noqa: E402
+from serpapi import GoogleSearch  # noqa: E402
+from simple_ticket_scraper import (  # noqa: E402
+    SimpleTicketScraper,
+    season_queries,
+)
+
+UPSTREAMS = {"trains": "sar.hhr.sa", "flights": "serpapi.com"}
+
+
+def use_limits(url, upstream, rate=None):
+    """Give the stand-in host the upstream's limiter settings (or `rate`)"""
+    settings = dict(rate_limit.HOST_DEFAULTS.get(upstream, {}))
+    if rate:
+        settings.update(rate=rate, max_rate=rate, burst=max(1, int(rate)))
+    rate_limit.HOST_DEFAULTS[urlsplit(url).hostname] = settings
+
+
+def train_load(url, searches, concurrency, fast_path=False, round_trip=False):
+    """(ok, latency seconds) per search, and the SingleFlight stats"""
+    # distinct dates, so SingleFlight doesn't coalesce searches
+    queries = season_queries(date(2025, 9, 1), searches // 20 + 1)[:searches]
+    http = HttpEngine(max_connections_per_host=concurrency)
+    scraper = SimpleTicketScraper(http=http, fast_path=fast_path, base_url=url)
+
+    def run(query):
+        start = time.perf_counter()
+        try:
+            if round_trip:
+                back = datetime.strptime(query.travel_date, "%d/%m/%Y") + timedelta(7)
+                legs = scraper.get_round_trip(
+                    *query[:3], back.strftime("%d/%m/%Y"), *query[3:], debug_file=None
+                )
+                tickets = all(legs)
+            else:
+                tickets = scraper.get_tickets(*query, debug_file=None)
+        except Exception:
+            tickets = []
+        return bool(tickets), time.perf_counter() - start
+
+    with http, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run, query) for query in queries]
+        results = [future.result() for future in as_completed(futures)]
+    return results, scraper.inflight.stats()
+
+
+def flight_load(url, searches, concurrency):
+    """(ok, latency seconds) per search, and the SingleFlight stats"""
+    GoogleSearch.BACKEND = url
+    before = index.inflight.stats()
+    start = date(2025, 9, 1)
+    queries = [
+        FlightQuery(
+            "AMS",
+            "MED",
+            (start + timedelta(days=i)).isoformat(),
+            (start + timedelta(days=i + 10)).isoformat(),
+            2,
+        )
+        for i in range(searches)
+    ]
+    results = [
+        (report.error is None, report.latency_ms / 1000)
+        for report in search_many(queries, concurrency)
+    ]
+    after = index.inflight.stats()
+    # index.inflight is module-wide: report this run only
+    coalescing = {
+        name: after[name] - before[name] for name in ("calls", "upstream", "saved")
+    }
+    return results, {**coalescing, "in_flight": after["in_flight"]}
+
+
+def report(results, wall_seconds):
+    ok = [latency for success, latency in results if success]
+    latencies = [latency * 1000 for _, latency in results]
+    return {
+        "searches": len(results),
+        "failed": len(results) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "searches_per_s": round(len(ok) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "latency_ms_p99": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the scrapers offline")
+    parser.add_argument("target", choices=sorted(UPSTREAMS))
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--url", help="use a running replay_server.py instead")
+    parser.add_argument("--rate", type=float, help="limiter requests/s override")
+    parser.add_argument("--fast-path", action="store_true")
+    parser.add_argument("--round-trip", action="store_true", help="trains only")
+    parser.add_argument("--json", help="write the report to this file")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        server = None
+        url = args.url
+        if url is None:
+            server = stack.enter_context(server_from_args(args))
+            url = server.url
+        use_limits(url, UPSTREAMS[args.target], args.rate)
+        print(
+            f"=== {args.searches} {args.target} searches, {args.concurrency} at once, {url} ==="
+        )
+
+        started = time.perf_counter()
+        # the scrapers print every step; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            if args.target == "trains":
+                results, coalescing = train_load(
+                    url,
+                    args.searches,
+                    args.concurrency,
+                    args.fast_path,
+                    args.round_trip,
+                )
+            else:
+                results, coalescing = flight_load(url, args.searches, args.concurrency)
+        summary = report(results, time.perf_counter() - started)
+        summary["singleflight"] = coalescing
+        summary["limiter"] = rate_limit.limiter_for(urlsplit(url).hostname).stats()
+        if server is not None:
+            summary["server"] = server.snapshot()
+
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""Local stand-in for sar.hhr.sa and SerpApi.
+
+Replays recorded responses (see fixtures.py) so the scrapers can be
+load-tested without touching the real upstreams:
+
+- GET  /web/booking/home    booking page with a fresh JSESSIONID + ViewState
+- POST /web/booking/home?…  JSF partial/ajax: FROM/TO priming and the search,
+                            answered with a recorded or synthetic result table
+- GET  /search              SerpApi Google Flights JSON
+- GET  /__stats             request counters
+
+Faults are configurable: per-request latency with jitter, a 5xx error rate,
+a requests-per-second cap answered with 429 + Retry-After, and ViewState
+expiry after a session's age or number of searches.
+
+    python benchmarks/replay_server.py --port 8765 --latency-ms 300 --error-rate 0.02
+
+Point SimpleTicketScraper(base_url=...) and GoogleSearch.BACKEND at it, or
+use load.py, which does both.
+"""
+
+import argparse
+import functools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from fixtures import (
+    FORM_ID,
+    home_page,
+    recorded_flights,
+    recorded_home_page,
+    recorded_ticket_responses,
+    scaled_flights,
+    ticket_response,
+)
+
+VIEW_STATE_INPUT_RE = re.compile(
+    r"(<input[^>]*name=[\"']javax\.faces\.ViewState[\"'][^>]*value=[\"'])[^\"']*",
+    re.IGNORECASE,
+)
+VIEW_STATE_UPDATE_RE = re.compile(
+    r"(<update id=\"[^\"]*javax\.faces\.ViewState[^\"]*\"><!\[CDATA\[).*?(\]\]></update>)",
+    re.DOTALL,
+)
+
+EXPIRED_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><partial-response><error>'
+    "<error-name>javax.faces.application.ViewExpiredException</error-name>"
+    "<error-message><![CDATA[viewId could not be restored]]></error-message>"
+    "</error></partial-response>"
+)
+REJECTED_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><partial-response><changes>'
+    f'<update id="{FORM_ID}:messages"><![CDATA['
+    '<div class="ui-messages-error">Validation Error: destination required</div>'
+    "]]></update>"
+    f'<update id="{FORM_ID}:tableResult"><![CDATA['
+    f'<div id="{FORM_ID}:tableResult" class="ui-datatable"></div>]]></update>'
+    '<update id="javax.faces.ViewState"><![CDATA[{view_state}]]></update>'
+    "</changes></partial-response>"
+)
+PRIMING_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><partial-response><changes>'
+    f'<update id="{FORM_ID}:comboStationTo"><![CDATA[<select></select>]]></update>'
+    '<update id="javax.faces.ViewState"><![CDATA[{view_state}]]></update>'
+    "</changes></partial-response>"
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def synthetic_response(rows, seed, return_seed=None):
+    """ticket_response, cached: the same query always gets the same page"""
+    return ticket_response(rows, seed, return_seed)
+
+
+class ReplaySession:
+    def __init__(self, view_state):
+        self.view_state = view_state
+        self.created = time.monotonic()
+        self.searches = 0
+        self.primed = {}
+
+
+class ReplayServer:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency_ms=0.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        max_rps=None,
+        view_state_ttl=None,
+        view_state_uses=None,
+        require_priming=False,
+        rows=12,
+        flights=None,
+        seed=0,
+    ):
+        """
+        latency_ms, jitter_ms: each response is delayed by latency_ms plus a
+            uniform 0..jitter_ms.
+        error_rate: fraction of requests answered with 500/503.
+        max_rps: requests per second over all clients; extra requests get
+            429 with Retry-After.
+        view_state_ttl: seconds after which a session's view expires;
+            view_state_uses: searches a session serves before it expires.
+        require_priming: reject searches whose TO station wasn't primed
+            in the session, like the real form validation.
+        rows: trains per synthetic result table (recorded responses are
+            replayed instead when present).
+        flights: flights per SerpApi response, scaled from the recorded
+            dumps; None replays vluchten_expanded as-is.
+        """
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.view_state_ttl = view_state_ttl
+        self.view_state_uses = view_state_uses
+        self.require_priming = require_priming
+        self.rows = rows
+        self.random = random.Random(seed)
+        self.sessions = {}
+        self.stats = {
+            "home": 0,
+            "priming": 0,
+            "search": 0,
+            "serpapi": 0,
+            "errors": 0,
+            "throttled": 0,
+            "expired": 0,
+            "rejected": 0,
+            "round_trip": 0,
+        }
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (second, requests in it)
+
+        self.home_template = recorded_home_page()
+        self.recorded = list(recorded_ticket_responses().values())
+        dumps = recorded_flights()
+        template = dumps.get("vluchten_expanded") or next(iter(dumps.values()))
+        self.flights = scaled_flights(template, flights, seed) if flights else template
+
+        handler = functools.partial(ReplayHandler, self)
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "sessions": len(self.sessions)}
+
+    def fault(self):
+        """(status, retry_after) to fail this request with, or None"""
+        if self.max_rps:
+            with self._lock:
+                second = int(time.monotonic())
+                start, count = self._window
+                count = count + 1 if start == second else 1
+                self._window = (second, count)
+            if count > self.max_rps:
+                self.count("throttled")
+                return 429, 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.count("errors")
+            return self.random.choice((500, 503)), None
+        return None
+
+    def delay(self):
+        pause = self.latency + self.random.uniform(0, self.jitter)
+        if pause:
+            time.sleep(pause)
+
+    def new_session(self):
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self.sessions[session_id] = ReplaySession(self.next_view_state())
+        return session_id
+
+    def next_view_state(self):
+        return f"{self.random.getrandbits(63)}:{self.random.getrandbits(63)}"
+
+    def expired(self, session):
+        if (
+            self.view_state_ttl
+            and time.monotonic() - session.created > self.view_state_ttl
+        ):
+            return True
+        return bool(self.view_state_uses and session.searches >= self.view_state_uses)
+
+    def home(self, session_id):
+        view_state = self.sessions[session_id].view_state
+        if self.home_template is None:
+            return home_page(view_state)
+        return VIEW_STATE_INPUT_RE.sub(
+            lambda m: m.group(1) + view_state, self.home_template, count=1
+        )
+
+    def ajax(self, session_id, form):
+        """Partial response for one JSF AJAX post"""
+        with self._lock:
+            session = self.sessions.get(session_id)
+        if (
+            session is None
+            or form.get("javax.faces.ViewState") != session.view_state
+            or self.expired(session)
+        ):
+            self.count("expired")
+            if session is not None:
+                with self._lock:
+                    self.sessions.pop(session_id, None)
+            return EXPIRED_RESPONSE
+
+        session.view_state = self.next_view_state()
+        source = form.get("javax.faces.source", "")
+        from_station = form.get(f"{FORM_ID}:comboStationFrom", "")
+        to_station = form.get(f"{FORM_ID}:comboStationTo", "")
+        if source.endswith(":comboStationFrom") or source.endswith(":comboStationTo"):
+            self.count("priming")
+            session.primed[source.rsplit(":", 1)[1]] = (from_station, to_station)
+            return PRIMING_RESPONSE.format(view_state=session.view_state)
+
+        self.count("search")
+        session.searches += 1
+        if self.require_priming and session.primed.get("comboStationTo") != (
+            from_station,
+            to_station,
+        ):
+            self.count("rejected")
+            return REJECTED_RESPONSE.format(view_state=session.view_state)
+        query = (from_station, to_station, form.get(f"{FORM_ID}:calendar", ""))
+        return_query = None
+        if form.get(f"{FORM_ID}:choiceTravel") == "false":
+            self.count("round_trip")
+            return_query = (
+                to_station,
+                from_station,
+                form.get(f"{FORM_ID}:calendarReturn", ""),
+            )
+        return VIEW_STATE_UPDATE_RE.sub(
+            lambda m: m.group(1) + session.view_state + m.group(2),
+            self.search_response(query, return_query),
+            count=1,
+        )
+
+    def search_response(self, query, return_query=None):
+        seed = zlib.crc32("|".join(query).encode("utf-8"))
+        if return_query is not None:
+            # recorded dumps are one-way; round trips are always synthetic
+            return_seed = zlib.crc32("|".join(return_query).encode("utf-8"))
+            return synthetic_response(self.rows, seed, return_seed)
+        if self.recorded:
+            return self.recorded[seed % len(self.recorded)]
+        return synthetic_response(self.rows, seed)
+
+    def serpapi(self, params):
+        self.count("serpapi")
+        data = dict(self.flights)
+        data["search_parameters"] = {
+            **data.get("search_parameters", {}),
+            **{k: v for k, v in params.items() if k != "api_key"},
+        }
+        return data
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, replay, *args, **kwargs):
+        self.replay = replay
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/__stats":
+            return self.send(
+                200, json.dumps(self.replay.snapshot()), "application/json"
+            )
+        if self.failed():
+            return
+        if url.path == "/web/booking/home":
+            self.replay.count("home")
+            session_id = self.replay.new_session()
+            return self.send(
+                200,
+                self.replay.home(session_id),
+                "text/html;charset=UTF-8",
+                {"Set-Cookie": f"JSESSIONID={session_id}; Path=/; HttpOnly"},
+            )
+        if url.path == "/search":
+            data = self.replay.serpapi(dict(parse_qsl(url.query)))
+            return self.send(200, json.dumps(data), "application/json")
+        self.send(404, "not found", "text/plain")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8")
+        if self.failed():
+            return
+        if urlsplit(self.path).path != "/web/booking/home":
+            return self.send(404, "not found", "text/plain")
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        session_id = cookie["JSESSIONID"].value if "JSESSIONID" in cookie else None
+        response = self.replay.ajax(session_id, dict(parse_qsl(body)))
+        self.send(200, response, "text/xml;charset=UTF-8")
+
+    def failed(self):
+        """Delay the response and send an injected fault, if any"""
+        self.replay.delay()
+        fault = self.replay.fault()
+        if fault is None:
+            return False
+        status, retry_after = fault
+        headers = {"Retry-After": str(retry_after)} if retry_after else {}
+        self.send(
+            status, json.dumps({"error": "replay fault"}), "application/json", headers
+        )
+        return True
+
+    def send(self, status, text, content_type, headers=None):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=int, help="answer 429 above this rate")
+    parser.add_argument("--view-state-ttl", type=float, help="seconds")
+    parser.add_argument("--view-state-uses", type=int, help="searches per session")
+    parser.add_argument("--require-priming", action="store_true")
+    parser.add_argument("--rows", type=int, default=12, help="trains per result")
+    parser.add_argument("--flights", type=int, help="flights per SerpApi response")
+
+
+def server_from_args(args, host="127.0.0.1", port=0):
+    return ReplayServer(
+        host=host,
+        port=port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        max_rps=args.max_rps,
+        view_state_ttl=args.view_state_ttl,
+        view_state_uses=args.view_state_uses,
+        require_priming=args.require_priming,
+        rows=args.rows,
+        flights=args.flights,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sar.hhr.sa / SerpApi stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.host, args.port)
+    print(f"Replaying on {server.url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Offline benchmarks for the scrapers' parsers and renderers.
+
+Runs every benchmark against recorded fixtures and synthetic scaled-up
+inputs (see fixtures.py) and reports per benchmark:
+
+- p50 / p99 wall time per call,
+- throughput in items (train rows or flights) per second at p50,
+- peak traced memory (tracemalloc) of one call.
+
+With a baseline file the run fails (exit 1) when p50 or peak memory of any
+benchmark grew by more than --threshold:
+
+    python benchmarks/run.py --save-baseline          # record baseline.json
+    python benchmarks/run.py                          # compare against it
+    python benchmarks/run.py -k parse_tickets --scales 1000 10000
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from fixtures import (
+    ROOT,
+    recorded_flights,
+    recorded_ticket_responses,
+    scaled_flights,
+    ticket_response,
+)
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "flights-scraper"))
+
+import convert  # noqa: E402
+import index  # noqa: E402
+from flight_batch import percentile  # noqa: E402
+from simple_ticket_scraper import SimpleTicketScraper, etree  # noqa: E402
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# setup() -> zero-argument callable; items = rows/flights handled per call
+Benchmark = namedtuple("Benchmark", "name items setup")
+
+
+def ticket_benchmarks(scales):
+    parsers = ["soup"] + (["lxml"] if etree is not None else [])
+    inputs = [
+        (name, text.count("data-ri="), lambda text=text: text)
+        for name, text in recorded_ticket_responses().items()
+    ]
+    inputs += [(str(n), n, lambda n=n: ticket_response(n)) for n in scales]
+    for parser in parsers:
+        for name, rows, load in inputs:
+
+            def setup(parser=parser, load=load):
+                scraper = SimpleTicketScraper(parser=parser)
+                text = load()
+                return lambda: scraper.parse_tickets(text)
+
+            yield Benchmark(f"parse_tickets[{parser}]/{name}", rows, setup)
+
+
+def flight_benchmarks(scales, workdir):
+    recorded = recorded_flights()
+    template = recorded.get("vluchten_expanded") or next(iter(recorded.values()))
+    inputs = [
+        (name, count_flights(data), lambda data=data: data)
+        for name, data in recorded.items()
+    ]
+    inputs += [
+        (str(n), n, functools.cache(lambda n=n: scaled_flights(template, n)))
+        for n in scales
+    ]
+
+    for name, count, load in inputs:
+        source = os.path.join(workdir, f"flights-{name}.json")
+        target = os.path.join(workdir, f"flights-{name}.html")
+
+        def setup_layovers(load=load):
+            flights = all_flights(load())
+            return lambda: [index.describe_layovers(f) for f in flights]
+
+        def setup_build(load=load):
+            data = load()
+            arrival_id = data.get("search_parameters", {}).get("arrival_id", "MED")
+            return lambda: index.build_html(data, arrival_id)
+
+        def setup_convert(load=load, source=source, target=target, stream=False):
+            if not os.path.exists(source):
+                with open(source, "w", encoding="utf-8") as f:
+                    json.dump(load(), f)
+            return lambda: convert.generate_html(source, target, stream=stream)
+
+        yield Benchmark(f"describe_layovers/{name}", count, setup_layovers)
+        yield Benchmark(f"build_html/{name}", count, setup_build)
+        yield Benchmark(f"generate_html/{name}", count, setup_convert)
+        yield Benchmark(
+            f"generate_html[stream]/{name}",
+            count,
+            functools.partial(setup_convert, stream=True),
+        )
+
+
+def all_flights(data):
+    return [f for key in index.FLIGHT_CATEGORIES for f in data.get(key) or []]
+
+
+def count_flights(data):
+    return len(all_flights(data))
+
+
+def measure(fn, min_time, max_repeat, min_repeat=3):
+    """Per-call wall times: at least min_repeat calls, more until min_time
+    has passed or max_repeat calls were made"""
+    times = []
+    started = time.perf_counter()
+    while len(times) < min_repeat or (
+        len(times) < max_repeat and time.perf_counter() - started < min_time
+    ):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(benchmarks, min_time, max_repeat):
+    results = {}
+    for bench in benchmarks:
+        # the scrapers print progress; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn = bench.setup()
+            fn()  # warm-up
+            times = measure(fn, min_time, max_repeat)
+            peak = peak_memory(fn)
+        p50 = percentile(times, 50)
+        results[bench.name] = {
+            "items": bench.items,
+            "calls": len(times),
+            "p50_ms": p50 * 1000,
+            "p99_ms": percentile(times, 99) * 1000,
+            "items_per_s": bench.items / p50 if p50 else None,
+            "peak_kib": peak / 1024,
+        }
+        print(format_row(bench.name, results[bench.name]), flush=True)
+    return results
+
+
+def format_row(name, r):
+    throughput = f"{r['items_per_s']:>12,.0f}" if r["items_per_s"] else " " * 12
+    return (
+        f"{name:<42} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} "
+        f"{throughput} {r['peak_kib']:>11,.0f}"
+    )
+
+
+def compare(results, baseline, threshold):
+    """Regressions as (name, metric, baseline, current)"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "peak_kib"):
+            if current[metric] > previous[metric] * (1 + threshold):
+                regressions.append((name, metric, previous[metric], current[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parser/renderer benchmarks")
+    parser.add_argument("-k", help="only benchmarks whose name contains this")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds")
+    parser.add_argument("--max-repeat", type=int, default=50)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        benchmarks = [
+            bench
+            for bench in (
+                *ticket_benchmarks(args.scales),
+                *flight_benchmarks(args.scales, workdir),
+            )
+            if not args.k or args.k in bench.name
+        ]
+        print(
+            f"{'benchmark':<42} {'p50 ms':>10} {'p99 ms':>10} "
+            f"{'items/s':>12} {'peak KiB':>11}"
+        )
+        results = run(benchmarks, args.min_time, args.max_repeat)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline; run with --save-baseline to record one")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for name, metric, before, after in regressions:
+            print(f"  {name} {metric}: {before:.2f} -> {after:.2f}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
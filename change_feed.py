@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Change feed of train and flight availability.
+
+Each scraper run publishes its results as a snapshot for one search scope
+(route + date + party). The snapshot is keyed record by record:
+
+- trains: train_number@departure
+- flights: flight_number@departure date/time of every leg
+
+and compared with the previous snapshot of the same scope. Only the
+differences are appended to a JSON-lines log, one event per line:
+
+    {"seq": 41, "ts": ..., "source": "trains", "scope": "5|1|26/09/2025|2|0|0",
+     "op": "added", "key": "35012@08:00", "record": {...}}
+    {"seq": 42, ..., "op": "price", "key": "...", "price": [512, 489]}
+    {"seq": 43, ..., "op": "removed", "key": "..."}
+
+``op`` is added / removed / price (only the price moved) / changed (other
+fields, new record included). ``seq`` increases by one per event, so a
+consumer keeps the last seq it saw and reads on with ``read_feed(since=)``.
+The previous snapshots live in a sidecar state file next to the log; one
+process writes a given feed at a time.
+
+    python change_feed.py publish trains available_tickets.json --scope "5|1|26/09/2025|2|0|0"
+    python change_feed.py publish flights vluchten.json
+    python change_feed.py since 40
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+from records import Flight, Ticket, fmt_hhmm, from_cents
+from ticket_cache import cache_key
+
+FEED_PATH = "changes.jsonl"
+FLIGHT_CATEGORIES = ("cheapest_flights", "best_flights", "other_flights")
+
+
+def ticket_key(ticket):
+    departure = fmt_hhmm(ticket.departure) if ticket.departure is not None else "?"
+    return f"{ticket.train_number or '?'}@{departure}"
+
+
+def ticket_records(tickets):
+    """key -> JSON record for Ticket records or available_tickets.json dicts"""
+    records = {}
+    for ticket in tickets:
+        if isinstance(ticket, dict):
+            ticket = Ticket.from_dict(ticket)
+        records[ticket_key(ticket)] = ticket.to_dict()
+    return records
+
+
+def _leg_time(leg, which):
+    day = getattr(leg, f"{which}_date")
+    minutes = getattr(leg, which)
+    return f"{day} {fmt_hhmm(minutes)}" if minutes is not None else day
+
+
+def flight_key(flight):
+    return "+".join(
+        f"{leg.flight_number}@{_leg_time(leg, 'departure')}" for leg in flight.legs
+    )
+
+
+def flight_summary(flight):
+    """The fields consumers act on, not the whole SerpApi object"""
+    legs = flight.legs
+    return {
+        "flights": [leg.flight_number for leg in legs],
+        "departure": _leg_time(legs[0], "departure") if legs else None,
+        "arrival": _leg_time(legs[-1], "arrival") if legs else None,
+        "total_duration": flight.total_duration,
+        "stops": len(flight.layovers),
+        "price": from_cents(flight.price_cents),
+    }
+
+
+def flight_records(data):
+    """key -> summary for a SerpApi result; a flight listed in several
+    categories counts once, at its lowest price"""
+    records = {}
+    for category in FLIGHT_CATEGORIES:
+        for item in data.get(category) or []:
+            flight = Flight.from_dict(item)
+            key = flight_key(flight)
+            summary = flight_summary(flight)
+            previous = records.get(key)
+            if previous is None or (
+                summary["price"] is not None
+                and (previous["price"] is None or summary["price"] < previous["price"])
+            ):
+                records[key] = summary
+    return records
+
+
+def flight_scope(data):
+    """departure|arrival|outbound|return|adults from the result's search_parameters"""
+    params = data.get("search_parameters") or {}
+    return "|".join(
+        str(params.get(name, ""))
+        for name in (
+            "departure_id",
+            "arrival_id",
+            "outbound_date",
+            "return_date",
+            "adults",
+        )
+    )
+
+
+def diff(previous, current):
+    """(op, key, payload) for every record that differs"""
+    changes = []
+    for key, record in current.items():
+        old = previous.get(key)
+        if old is None:
+            changes.append(("added", key, {"record": record}))
+        elif old != record:
+            rest_old = {k: v for k, v in old.items() if k != "price"}
+            rest_new = {k: v for k, v in record.items() if k != "price"}
+            if rest_old == rest_new:
+                changes.append(
+                    ("price", key, {"price": [old.get("price"), record.get("price")]})
+                )
+            else:
+                changes.append(("changed", key, {"record": record}))
+    for key in previous:
+        if key not in current:
+            changes.append(("removed", key, {}))
+    return changes
+
+
+class ChangeFeed:
+    def __init__(self, path=FEED_PATH, state_path=None):
+        """
+        path: JSON-lines log the events are appended to.
+        state_path: last snapshot per scope; defaults to <path>.state.json
+            without the .jsonl.
+        """
+        self.path = path
+        self.state_path = state_path or os.path.splitext(path)[0] + ".state.json"
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self):
+        if self._state is None:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    self._state = json.load(f)
+            else:
+                self._state = {"seq": 0, "snapshots": {}}
+        return self._state
+
+    def _save(self):
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def publish(self, source, scope, records):
+        """Diff `records` (key -> record) against the scope's last snapshot,
+        append the events and return them"""
+        with self._lock:
+            state = self._load()
+            snapshot_id = f"{source}:{scope}"
+            previous = state["snapshots"].get(snapshot_id, {})
+            changes = diff(previous, records)
+            if not changes:
+                return []
+
+            now = round(time.time(), 3)
+            events = []
+            for op, key, payload in changes:
+                state["seq"] += 1
+                events.append(
+                    {
+                        "seq": state["seq"],
+                        "ts": now,
+                        "source": source,
+                        "scope": scope,
+                        "op": op,
+                        "key": key,
+                        **payload,
+                    }
+                )
+            with open(self.path, "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            state["snapshots"][snapshot_id] = records
+            self._save()
+            return events
+
+    def publish_tickets(self, tickets, *query):
+        """publish() for one get_tickets result; `query` as for cache_key"""
+        return self.publish("trains", cache_key(*query), ticket_records(tickets))
+
+    def publish_flights(self, data):
+        """publish() for one SerpApi result dict"""
+        return self.publish("flights", flight_scope(data), flight_records(data))
+
+
+def read_feed(path=FEED_PATH, since=0):
+    """Events with seq > `since`, oldest first"""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["seq"] > since:
+                yield event
+
+
+def summarize(events):
+    ops = {}
+    for event in events:
+        ops[event["op"]] = ops.get(event["op"], 0) + 1
+    return ", ".join(f"{n} {op}" for op, n in sorted(ops.items())) or "no changes"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Availability change feed")
+    parser.add_argument("--feed", default=FEED_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="diff a scraper output file")
+    publish.add_argument("source", choices=["trains", "flights"])
+    publish.add_argument("file")
+    publish.add_argument("--scope", help="trains: from|to|date|adults|children|infants")
+    since = commands.add_parser("since", help="print events after a seq")
+    since.add_argument("seq", type=int, nargs="?", default=0)
+    args = parser.parse_args()
+
+    if args.command == "since":
+        for event in read_feed(args.feed, args.seq):
+            print(json.dumps(event, ensure_ascii=False))
+        return
+
+    with open(args.file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    feed = ChangeFeed(args.feed)
+    if args.source == "trains":
+        if not args.scope:
+            parser.error("trains need --scope")
+        events = feed.publish("trains", args.scope, ticket_records(data))
+    else:
+        events = feed.publish(
+            "flights", args.scope or flight_scope(data), flight_records(data)
+        )
+    print(summarize(events))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,10 @@
+import heapq
 import json
+import tempfile
 
+CHUNK_SIZE = 1 << 16
 
-def generate_html(json_file, output_file="vluchten.html"):
-    with open(json_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    def render_flights(category_name, flights):
-        flights_sorted = sorted(flights, key=lambda x: x.get("price", 999999))
-        html = f"<h2>{category_name}</h2>\n<ul>\n"
-        for f in flights_sorted:
-            prijs = f.get("price", "Onbekend")
-            totaal_duur = f.get("total_duration", "Onbekend")
-            airline_logo = f.get("airline_logo", "")
-            vlucht_type = f.get("type", "")
-            legs = []
-            for leg in f.get("flights", []):
-                legs.append(
-                    f"<li>{leg['airline']} ({leg['flight_number']})<br>"
-                    f"{leg['departure_airport']['name']} ({leg['departure_airport']['id']}) "
-                    f"{leg['departure_airport']['time']} → "
-                    f"{leg['arrival_airport']['name']} ({leg['arrival_airport']['id']}) "
-                    f"{leg['arrival_airport']['time']}<br>"
-                    f"Duur: {leg['duration']} min | Vliegtuig: {leg['airplane']} | "
-                    f"Klasse: {leg['travel_class']} | Beenruimte: {leg.get('legroom','-')}</li>"
-                )
-            legs_html = "<ul>" + "".join(legs) + "</ul>"
-            html += (
-                f"<li>"
-                f"<img src='{airline_logo}' alt='logo' style='height:20px;'> "
-                f"<b>Prijs:</b> €{prijs} | <b>Totale duur:</b> {totaal_duur} min | {vlucht_type}"
-                f"{legs_html}"
-                f"</li>\n"
-            )
-        html += "</ul>\n"
-        return html
-
-    html_content = """
+HTML_HEAD = """
     <html>
     <head>
       <meta charset="utf-8">
@@ -53,18 +22,230 @@ def generate_html(json_file, output_file="vluchten.html"):
       <h1>Vluchten Overzicht</h1>
     """
 
-    if "best_flights" in data:
-        html_content += render_flights("Best Flights", data["best_flights"])
-    if "other_flights" in data:
-        html_content += render_flights("Other Flights", data["other_flights"])
+CATEGORIES = (("best_flights", "Best Flights"), ("other_flights", "Other Flights"))
+
+
+def render_flight(f):
+    prijs = f.get("price", "Onbekend")
+    totaal_duur = f.get("total_duration", "Onbekend")
+    airline_logo = f.get("airline_logo", "")
+    vlucht_type = f.get("type", "")
+    legs = []
+    for leg in f.get("flights", []):
+        legs.append(
+            f"<li>{leg['airline']} ({leg['flight_number']})<br>"
+            f"{leg['departure_airport']['name']} ({leg['departure_airport']['id']}) "
+            f"{leg['departure_airport']['time']} → "
+            f"{leg['arrival_airport']['name']} ({leg['arrival_airport']['id']}) "
+            f"{leg['arrival_airport']['time']}<br>"
+            f"Duur: {leg['duration']} min | Vliegtuig: {leg['airplane']} | "
+            f"Klasse: {leg['travel_class']} | Beenruimte: {leg.get('legroom','-')}</li>"
+        )
+    legs_html = "<ul>" + "".join(legs) + "</ul>"
+    return (
+        f"<li>"
+        f"<img src='{airline_logo}' alt='logo' style='height:20px;'> "
+        f"<b>Prijs:</b> €{prijs} | <b>Totale duur:</b> {totaal_duur} min | {vlucht_type}"
+        f"{legs_html}"
+        f"</li>\n"
+    )
+
+
+def render_flights(category_name, flights):
+    flights_sorted = sorted(flights, key=lambda x: x.get("price", 999999))
+    html = [f"<h2>{category_name}</h2>\n<ul>\n"]
+    html.extend(render_flight(f) for f in flights_sorted)
+    html.append("</ul>\n")
+    return "".join(html)
+
+
+def generate_html(json_file, output_file="vluchten.html", stream=False, limit=None):
+    """Zet een SerpApi-dump om naar HTML.
+
+    stream=True leest de dump in één keer door (zie iter_json_arrays): elke
+    <li> gaat direct na het renderen naar een tijdelijk bestand, en in het
+    geheugen blijft per vlucht alleen (prijs, volgorde, offset, lengte) om op
+    prijs te kunnen sorteren. De uitvoer is gelijk aan die zonder stream.
+    """
+    if stream:
+        return _generate_html_streaming(json_file, output_file, limit)
 
-    html_content += "</body></html>"
+    with open(json_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
 
     with open(output_file, "w", encoding="utf-8") as f:
-        f.write(html_content)
+        f.write(HTML_HEAD)
+        for key, title in CATEGORIES:
+            if key in data:
+                flights = data[key]
+                if limit is not None:
+                    flights = sorted(flights, key=lambda x: x.get("price", 999999))
+                    flights = flights[:limit]
+                f.write(render_flights(title, flights))
+        f.write("</body></html>")
+
+    print(f"✅ HTML bestand gegenereerd: {output_file}")
+
+
+def _generate_html_streaming(json_file, output_file, limit):
+    found = {}
+    with open(json_file, "r", encoding="utf-8") as f, tempfile.TemporaryFile() as spill:
+        for key, flights in iter_json_arrays(f, [key for key, _ in CATEGORIES]):
+            found[key] = _spill(flights, spill, limit)
+
+        with open(output_file, "w", encoding="utf-8") as out:
+            out.write(HTML_HEAD)
+            for key, title in CATEGORIES:
+                if key not in found:
+                    continue
+                out.write(f"<h2>{title}</h2>\n<ul>\n")
+                for _, _, offset, size in found[key]:
+                    spill.seek(offset)
+                    out.write(spill.read(size).decode("utf-8"))
+                out.write("</ul>\n")
+            out.write("</body></html>")
 
     print(f"✅ HTML bestand gegenereerd: {output_file}")
 
 
+def _spill(flights, spill, limit):
+    """Rendert `flights` naar `spill`; geeft (prijs, volgorde, offset, lengte) gesorteerd terug.
+
+    Met `limit` houdt een max-heap alleen de goedkoopste bij, en wordt een
+    vlucht die er toch niet in komt ook niet gerenderd.
+    """
+    heap = []
+    for seq, flight in enumerate(flights):
+        price = flight.get("price", 999999)
+        if limit is not None and len(heap) >= limit:
+            if not heap or (-price, -seq) <= heap[0][:2]:
+                continue
+        li = render_flight(flight).encode("utf-8")
+        item = (-price, -seq, spill.tell(), len(li))
+        spill.write(li)
+        if limit is None or len(heap) < limit:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heapreplace(heap, item)
+    return [(-p, -s, offset, size) for p, s, offset, size in sorted(heap, reverse=True)]
+
+
+class _Reader:
+    """Buffer over een tekstbestand dat in stukken wordt ingelezen."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def more(self):
+        # minstens zoveel als er nog ongelezen in de buffer staat, zodat een
+        # waarde die niet in één stuk past in lineaire tijd binnenkomt
+        chunk = self.fp.read(max(CHUNK_SIZE, len(self.buf) - self.pos))
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Volgende teken dat geen whitespace is (None aan het eind)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return None
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f"verwacht {ch!r} op positie {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decodeert de JSON-waarde die op pos begint."""
+        self.peek()
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(self.buf, self.pos)
+                # een getal aan het eind van de buffer kan nog doorlopen
+                if end < len(self.buf) or not self.more():
+                    break
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+        self.pos = end
+        return item
+
+    def items(self):
+        """De items van de array die op pos begint, één voor één."""
+        self.expect("[")
+        while True:
+            ch = self.peek()
+            if ch == ",":
+                self.pos += 1
+                continue
+            if ch == "]":
+                self.pos += 1
+                return
+            if ch is None:
+                raise ValueError("onverwacht einde van JSON in lijst")
+            yield self.value()
+
+    def skip(self):
+        """Slaat de waarde op pos over; een lijst item voor item, zodat het
+        geheugen niet meegroeit met lange lijsten die we niet nodig hebben."""
+        if self.peek() == "[":
+            for _ in self.items():
+                pass
+        else:
+            self.value()
+
+
+def iter_json_arrays(fp, keys):
+    """Levert (key, items) voor elke top-level array in `keys`, in bestandsvolgorde.
+
+    `items` levert de items één voor één en moet leeg zijn voordat de volgende
+    key komt; alleen het huidige item staat als dict in het geheugen. Andere
+    waarden worden per item (lijsten) of in één keer gedecodeerd en weggegooid.
+    """
+    reader = _Reader(fp)
+    reader.expect("{")
+    while True:
+        ch = reader.peek()
+        if ch == ",":
+            reader.pos += 1
+            continue
+        if ch == "}":
+            return
+        if ch is None:
+            raise ValueError("onverwacht einde van JSON in object")
+        key = reader.value()
+        reader.expect(":")
+        if key not in keys:
+            reader.skip()
+            continue
+        if reader.peek() != "[":
+            raise ValueError(f"{key} is geen lijst")
+        items = reader.items()
+        yield key, items
+        # wat de aanroeper liet liggen alsnog overslaan
+        for _ in items:
+            pass
+
+
+def iter_json_array(fp, key):
+    """Levert de items van de top-level array `key` één voor één.
+
+    KeyError (na afloop) als `key` niet bestaat.
+    """
+    for _, items in iter_json_arrays(fp, (key,)):
+        yield from items
+        return
+    raise KeyError(key)
+
+
 if __name__ == "__main__":
     generate_html("vluchten.json")
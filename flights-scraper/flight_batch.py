@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from index import fetch_flights, flight_params, parse_flights, save_json
+from records import from_cents
+from serpapi_cache import SerpApiCache
+
+FlightQuery = namedtuple(
+    "FlightQuery", "origin destination outbound_date return_date adults"
+)
+
+# per query: latency in ms, of het uit de cache kwam, goedkoopste prijs en eventuele fout
+QueryReport = namedtuple(
+    "QueryReport", "query results latency_ms cached min_price error"
+)
+
+
+def query_grid(origins, destinations, date_pairs, adults=2):
+    """Alle combinaties (origin, destination, heen/terug-datum)."""
+    return [
+        FlightQuery(origin, destination, outbound, ret, adults)
+        for origin in origins
+        for destination in destinations
+        for outbound, ret in date_pairs
+    ]
+
+
+def date_pairs(first_outbound: str, days: int, stays):
+    """Heen/terug-paren: `days` vertrekdata vanaf first_outbound × verblijfsduren."""
+    start = date.fromisoformat(first_outbound)
+    pairs = []
+    for i in range(days):
+        outbound = start + timedelta(days=i)
+        for stay in stays:
+            pairs.append(
+                (outbound.isoformat(), (outbound + timedelta(days=stay)).isoformat())
+            )
+    return pairs
+
+
+def _run_query(query: FlightQuery, cache):
+    params = flight_params(
+        query.origin,
+        query.destination,
+        query.adults,
+        query.outbound_date,
+        query.return_date,
+    )
+    start = time.perf_counter()
+    try:
+        results = cache.get(params) if cache is not None else None
+        cached = results is not None
+        if not cached:
+            results = fetch_flights(
+                query.origin,
+                query.destination,
+                query.adults,
+                query.outbound_date,
+                query.return_date,
+            )
+            if cache is not None:
+                cache.put(params, results)
+        error = results.get("error")
+    except Exception as e:
+        results, cached, error = None, False, str(e)
+
+    prices = [
+        f.price_cents
+        for flights in parse_flights(results or {}).values()
+        for f in flights
+        if f.price_cents is not None
+    ]
+    return QueryReport(
+        query,
+        results,
+        (time.perf_counter() - start) * 1000,
+        cached,
+        from_cents(min(prices, default=None)),
+        error,
+    )
+
+
+def search_many(queries, workers: int = 8, cache=None):
+    """Voert alle queries parallel uit (max `workers` tegelijk) en levert een
+    QueryReport per query zodra die klaar is."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_query, q, cache) for q in queries]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(reports, wall_seconds=None):
+    latencies = [r.latency_ms for r in reports]
+    fetched = [r.latency_ms for r in reports if not r.cached]
+    return {
+        "queries": len(reports),
+        "errors": sum(1 for r in reports if r.error),
+        "cache_hits": sum(1 for r in reports if r.cached),
+        "cache_hit_rate": (
+            sum(1 for r in reports if r.cached) / len(reports) if reports else 0.0
+        ),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "fetch_latency_ms_p50": percentile(fetched, 50),
+        "wall_seconds": wall_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prijs een grid van vluchten")
+    parser.add_argument("--origins", nargs="+", default=["CMN", "AMS", "BRU"])
+    parser.add_argument("--destinations", nargs="+", default=["MED", "JED"])
+    parser.add_argument("--outbound", default="2025-09-10", help="eerste vertrekdatum")
+    parser.add_argument("--days", type=int, default=7, help="aantal vertrekdata")
+    parser.add_argument("--stays", type=int, nargs="+", default=[10])
+    parser.add_argument("--adults", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--cache-dir", default=".serpapi_cache")
+    parser.add_argument("--ttl", type=float, default=6 * 60 * 60)
+    parser.add_argument("--out-dir", help="bewaar elke response als JSON")
+    args = parser.parse_args()
+
+    cache = SerpApiCache(args.cache_dir, args.ttl)
+    queries = query_grid(
+        args.origins,
+        args.destinations,
+        date_pairs(args.outbound, args.days, args.stays),
+        args.adults,
+    )
+    print(f"=== {len(queries)} zoekopdrachten, {args.workers} tegelijk ===")
+
+    start = time.perf_counter()
+    reports = []
+    for report in search_many(queries, args.workers, cache):
+        reports.append(report)
+        q = report.query
+        status = report.error or (
+            f"€{report.min_price}" if report.min_price is not None else "geen prijs"
+        )
+        print(
+            f"{q.origin}->{q.destination} {q.outbound_date}/{q.return_date}: "
+            f"{status} ({report.latency_ms:.0f} ms{', cache' if report.cached else ''})"
+        )
+        if args.out_dir and report.results and not report.error:
+            os.makedirs(args.out_dir, exist_ok=True)
+            save_json(
+                report.results,
+                os.path.join(
+                    args.out_dir,
+                    f"{q.origin}-{q.destination}-{q.outbound_date}-{q.return_date}.json",
+                ),
+            )
+
+    summary = summarize(reports, time.perf_counter() - start)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
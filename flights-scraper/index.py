@@ -1,40 +1,127 @@
 import os
+import sys
 import json
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import urlsplit
+import requests
 from serpapi import GoogleSearch
 from html import escape
 
+# gedeelde modules (records, ...) staan in de repo-root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics
+from change_feed import ChangeFeed, summarize
+from price_history import PriceHistory, record_flights
+from rate_limit import call_with_retry, classify_response, limiter_for
+from records import Flight, from_cents
+from singleflight import SingleFlight
+
 # ====== CONFIG ======
 API_KEY = os.getenv("SERPAPI_KEY", "VUL_HIER_DESNOODS_TEMPORAR__KEY_IN")
 OUT_JSON = "vluchten.json"
 OUT_HTML = "vluchten.html"
+FRAGMENT_CACHE = ".vluchten_fragments.json"
 
 # Hardcoded demo-data (zoals besproken)
 OUTBOUND_DATE = "2025-09-10"
 RETURN_DATE = "2025-09-20"
 CURRENCY = "EUR"
 
+FLIGHT_CATEGORIES = ("cheapest_flights", "best_flights", "other_flights")
+
+# gelijktijdige identieke zoekopdrachten delen één SerpApi-call
+inflight = SingleFlight()
+
 
-def fetch_flights(departure_id: str, arrival_id: str, adults: int = 2):
-    """Haalt Google Flights via SerpApi op en retourneert de dict."""
-    params = {
+def flight_params(
+    departure_id: str,
+    arrival_id: str,
+    adults: int = 2,
+    outbound_date: str = OUTBOUND_DATE,
+    return_date: str = RETURN_DATE,
+) -> dict:
+    return {
         "api_key": API_KEY,
         "engine": "google_flights",
         "hl": "en",
         "gl": "nl",  # zoals in Playground
         "departure_id": departure_id,
         "arrival_id": arrival_id,
-        "outbound_date": OUTBOUND_DATE,
-        "return_date": RETURN_DATE,
+        "outbound_date": outbound_date,
+        "return_date": return_date,
         "currency": CURRENCY,
         "adults": str(adults),  # Playground gaf string
         "type": "1",  # 1 = round-trip in Playground output
         "sort_by": "2",  # 2 = prijs (goedkoopst eerst) in Playground
     }
 
+
+def fetch_flights(
+    departure_id: str,
+    arrival_id: str,
+    adults: int = 2,
+    outbound_date: str = OUTBOUND_DATE,
+    return_date: str = RETURN_DATE,
+    cache=None,
+):
+    """Haalt Google Flights via SerpApi op en retourneert de dict.
+
+    Met een serpapi_cache.SerpApiCache wordt een verse gecachte response
+    hergebruikt en elke nieuwe response opgeslagen.
+    """
+    params = flight_params(departure_id, arrival_id, adults, outbound_date, return_date)
+
+    def fetch():
+        if cache is not None:
+            cached = cache.get(params)
+            metrics.count(
+                "serpapi_cache", scraper="flights", hit=str(cached is not None).lower()
+            )
+            if cached is not None:
+                return cached
+        results = serpapi_get(params)
+        if cache is not None:
+            cache.put(params, results)
+        return results
+
+    key = (
+        departure_id.strip().upper(),
+        arrival_id.strip().upper(),
+        int(adults),
+        outbound_date,
+        return_date,
+    )
+    return inflight.do(key, fetch)
+
+
+def serpapi_get(params: dict) -> dict:
+    """Eén SerpApi-call via de gedeelde rate limiter, met retries bij 429/5xx."""
+    return json.loads(serpapi_get_raw(params))
+
+
+def serpapi_get_raw(params: dict) -> bytes:
+    """Als serpapi_get, maar de ruwe JSON-bytes (om elders te parsen)."""
     search = GoogleSearch(params)
-    results = search.get_dict()
-    return results
+    search.params_dict["output"] = "json"
+    with metrics.span("fetch", scraper="flights"):
+        response = call_with_retry(
+            limiter_for(urlsplit(search.BACKEND).hostname),
+            search.get_response,
+            classify=classify_response,
+            retry_on=(requests.ConnectionError, requests.Timeout),
+        )
+        return response.content
+
+
+def parse_flights(data: dict) -> dict:
+    """Zet SerpApi-resultaten om naar Flight-records per categorie."""
+    return {
+        key: [Flight.from_dict(f) for f in data[key]]
+        for key in FLIGHT_CATEGORIES
+        if data.get(key)
+    }
 
 
 def save_json(data: dict, path: str = OUT_JSON):
@@ -149,60 +236,150 @@ def render_leg_li(leg: dict) -> str:
     )
 
 
-def render_category(title: str, items: list, arrival_id: str) -> str:
+def render_card(fobj: dict, arrival_id: str) -> str:
+    price = fobj.get("price", "Onbekend")
+    total_minutes = fobj.get("total_duration")
+    total_dur = mins_to_hhmm(total_minutes) if total_minutes is not None else "Onbekend"
+    stops = describe_layovers(fobj)
+    logo = fobj.get("airline_logo", "")
+    trip_type = escape(fobj.get("type", ""))
+    legs = fobj.get("flights", []) or []
+    outbound, ret = split_outbound_return(legs, arrival_id)
+
+    # bouw legs html
+    out_html = (
+        "<ul>" + "".join(render_leg_li(l) for l in outbound) + "</ul>"
+        if outbound
+        else "<p><i>Niet gevonden</i></p>"
+    )
+    ret_html = (
+        "<ul>" + "".join(render_leg_li(l) for l in ret) + "</ul>"
+        if ret
+        else "<p><i>Niet gevonden (SerpApi levert soms alleen heen mee)</i></p>"
+    )
+
+    img_tag = f"<img class='logo' src='{logo}' alt='logo'>" if logo else ""
+    return (
+        "<article class='card'>"
+        f"{img_tag}"
+        f"<div class='head'><span class='price'>€{price}</span>"
+        f"<span class='meta'>{trip_type} • Totale duur: {total_dur} • {escape(stops)}</span>"
+        f"{co2_badge(fobj)}</div>"
+        "<div class='legs'>"
+        "<div class='legcol'><h3>Heenweg</h3>" + out_html + "</div>"
+        "<div class='legcol'><h3>Terugweg</h3>" + ret_html + "</div>"
+        "</div>"
+        "</article>"
+    )
+
+
+class FragmentCache:
+    """Gerenderde kaarten per content-hash van de vlucht-dict (+ arrival_id).
+
+    Alleen kaarten waarvan de onderliggende dict veranderd is worden opnieuw
+    gerenderd. Wordt als JSON op schijf bewaard; de minst recent gebruikte
+    kaarten vallen eruit boven `max_entries`.
+    """
+
+    # ophogen als render_card verandert, zodat oude fragmenten vervallen
+    VERSION = "1"
+
+    def __init__(self, path: str | None = None, max_entries: int = 20_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.fragments = OrderedDict()
+        self.manifests = {}  # output-pad -> hash van de laatst geschreven pagina
+        self.hits = 0
+        self.rendered = 0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") == self.VERSION:
+                self.fragments.update(saved["fragments"])
+                self.manifests = saved.get("manifests", {})
+
+    @staticmethod
+    def key(fobj: dict, arrival_id: str) -> str:
+        blob = json.dumps(fobj, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(f"{arrival_id}\0{blob}".encode("utf-8")).hexdigest()
+
+    def card(self, fobj: dict, arrival_id: str, key: str | None = None) -> tuple:
+        """(key, html) voor een vlucht; rendert alleen bij een cache-miss.
+
+        `key` mag al berekend meegegeven worden (zie write_html).
+        """
+        if key is None:
+            key = self.key(fobj, arrival_id)
+        card = self.fragments.get(key)
+        if card is None:
+            card = self.fragments[key] = render_card(fobj, arrival_id)
+            self.rendered += 1
+            if len(self.fragments) > self.max_entries:
+                self.fragments.popitem(last=False)
+        else:
+            self.fragments.move_to_end(key)
+            self.hits += 1
+        return key, card
+
+    def save(self):
+        if not self.path:
+            return
+        # eigen tmp-bestand per proces: gelijktijdige runs schrijven elk een
+        # compleet bestand en de laatste os.replace wint
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "fragments": self.fragments,
+                    "manifests": self.manifests,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, self.path)
+
+
+def by_price(items: list) -> list:
     # sorteer op prijs ASC
-    items_sorted = sorted(items, key=lambda x: x.get("price", 10**12))
-    html = [f"<section><h2>{escape(title)}</h2>"]
+    return sorted(items, key=lambda x: x.get("price", 10**12))
+
+
+def iter_category(
+    title: str,
+    items: list,
+    arrival_id: str,
+    fragments: FragmentCache | None = None,
+    keys: list | None = None,
+):
+    """HTML-stukken van één categorie; kaarten komen uit `fragments` indien gegeven.
+
+    `keys` zijn de FragmentCache-keys van by_price(items), als die al bekend zijn.
+    """
+    items_sorted = by_price(items)
+    yield f"<section><h2>{escape(title)}</h2>"
     if not items_sorted:
-        html.append("<p><i>Geen resultaten.</i></p></section>")
-        return "".join(html)
-
-    html.append("<div class='cards'>")
-    for fobj in items_sorted:
-        price = fobj.get("price", "Onbekend")
-        total_minutes = fobj.get("total_duration")
-        total_dur = (
-            mins_to_hhmm(total_minutes) if total_minutes is not None else "Onbekend"
-        )
-        stops = describe_layovers(fobj)
-        logo = fobj.get("airline_logo", "")
-        trip_type = escape(fobj.get("type", ""))
-        legs = fobj.get("flights", []) or []
-        outbound, ret = split_outbound_return(legs, arrival_id)
-
-        # bouw legs html
-        out_html = (
-            "<ul>" + "".join(render_leg_li(l) for l in outbound) + "</ul>"
-            if outbound
-            else "<p><i>Niet gevonden</i></p>"
-        )
-        ret_html = (
-            "<ul>" + "".join(render_leg_li(l) for l in ret) + "</ul>"
-            if ret
-            else "<p><i>Niet gevonden (SerpApi levert soms alleen heen mee)</i></p>"
-        )
+        yield "<p><i>Geen resultaten.</i></p></section>"
+        return
+
+    yield "<div class='cards'>"
+    for i, fobj in enumerate(items_sorted):
+        if fragments is None:
+            yield render_card(fobj, arrival_id)
+        else:
+            yield fragments.card(fobj, arrival_id, keys[i] if keys else None)[1]
+    yield "</div></section>"
 
-        img_tag = f"<img class='logo' src='{logo}' alt='logo'>" if logo else ""
-        card = (
-            "<article class='card'>"
-            f"{img_tag}"
-            f"<div class='head'><span class='price'>€{price}</span>"
-            f"<span class='meta'>{trip_type} • Totale duur: {total_dur} • {escape(stops)}</span>"
-            f"{co2_badge(fobj)}</div>"
-            "<div class='legs'>"
-            "<div class='legcol'><h3>Heenweg</h3>" + out_html + "</div>"
-            "<div class='legcol'><h3>Terugweg</h3>" + ret_html + "</div>"
-            "</div>"
-            "</article>"
-        )
-        html.append(card)
-    html.append("</div></section>")
-    return "".join(html)
 
+def render_category(
+    title: str, items: list, arrival_id: str, fragments: FragmentCache | None = None
+) -> str:
+    return "".join(iter_category(title, items, arrival_id, fragments))
 
-def build_html(data: dict, arrival_id: str):
+
+def html_head() -> str:
     title = "Vluchten Overzicht — SerpApi (Google Flights)"
-    head = f"""
+    return f"""
 <!DOCTYPE html>
 <html lang="nl">
 <head>
@@ -243,25 +420,84 @@ def build_html(data: dict, arrival_id: str):
   <span class="pill">Demo • {escape(OUTBOUND_DATE)} → {escape(RETURN_DATE)}</span>
 </header>
 """
-    body = []
 
-    if "cheapest_flights" in data and data["cheapest_flights"]:
-        body.append(
-            render_category("Cheapest Flights", data["cheapest_flights"], arrival_id)
-        )
-    if "best_flights" in data and data["best_flights"]:
-        body.append(render_category("Best Flights", data["best_flights"], arrival_id))
-    if "other_flights" in data and data["other_flights"]:
-        body.append(render_category("Other Flights", data["other_flights"], arrival_id))
 
-    footer = """
+HTML_FOOTER = """
 <footer>
   Bron: SerpApi → Google Flights (alleen voor demo/prototyping; resultaten en beschikbaarheid kunnen afwijken).
 </footer>
 </body>
 </html>
 """
-    return head + "".join(body) + footer
+
+HTML_CATEGORIES = (
+    ("cheapest_flights", "Cheapest Flights"),
+    ("best_flights", "Best Flights"),
+    ("other_flights", "Other Flights"),
+)
+
+
+def iter_html(
+    data: dict,
+    arrival_id: str,
+    fragments: FragmentCache | None = None,
+    keys: dict | None = None,
+):
+    """De volledige pagina als opeenvolgende HTML-stukken."""
+    yield html_head()
+    for key, title in HTML_CATEGORIES:
+        if key in data and data[key]:
+            yield from iter_category(
+                title, data[key], arrival_id, fragments, (keys or {}).get(key)
+            )
+    yield HTML_FOOTER
+
+
+def build_html(data: dict, arrival_id: str, fragments: FragmentCache | None = None):
+    return "".join(iter_html(data, arrival_id, fragments))
+
+
+def write_html(
+    data: dict,
+    arrival_id: str,
+    path: str = OUT_HTML,
+    fragments: FragmentCache | None = None,
+) -> bool:
+    """Schrijft de pagina stuk voor stuk naar `path`.
+
+    Met een FragmentCache worden alleen gewijzigde kaarten opnieuw gerenderd,
+    en wordt het bestand niet herschreven als de pagina identiek is aan de
+    vorige keer. Geeft True terug als er geschreven is.
+    """
+    keys = None
+    if fragments is not None:
+        # keys één keer berekenen: voor het manifest én voor de kaarten
+        keys = {
+            key: [FragmentCache.key(fobj, arrival_id) for fobj in by_price(data[key])]
+            for key, _ in HTML_CATEGORIES
+            if data.get(key)
+        }
+        manifest = hashlib.sha1()
+        manifest.update(html_head().encode("utf-8"))
+        for key, _ in HTML_CATEGORIES:
+            manifest.update(key.encode("utf-8"))
+            for card_key in keys.get(key, ()):
+                manifest.update(card_key.encode("ascii"))
+        digest = manifest.hexdigest()
+        if fragments.manifests.get(path) == digest and os.path.exists(path):
+            return False
+
+    with metrics.span("render", scraper="flights"):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for chunk in iter_html(data, arrival_id, fragments, keys):
+                f.write(chunk)
+        os.replace(tmp, path)
+
+    if fragments is not None:
+        fragments.manifests[path] = digest
+        fragments.save()
+    return True
 
 
 def save_html(html: str, path: str = OUT_HTML):
@@ -283,19 +519,30 @@ def main():
     results = fetch_flights(departure, arrival, adults)
     save_json(results, OUT_JSON)
     print(f"✅ JSON opgeslagen in {OUT_JSON}")
-
-    html = build_html(results, arrival_id=arrival.upper())
-    save_html(html, OUT_HTML)
-    print(f"✅ HTML gegenereerd in {OUT_HTML}")
+    if "error" not in results:
+        # alleen de verschillen met de vorige run naar de change feed
+        events = ChangeFeed().publish_flights(results)
+        print(f"📰 Change feed: {summarize(events)}")
+        with PriceHistory() as history:
+            record_flights(history, results)
+
+    fragments = FragmentCache(FRAGMENT_CACHE)
+    if write_html(results, arrival.upper(), OUT_HTML, fragments):
+        print(
+            f"✅ HTML gegenereerd in {OUT_HTML} "
+            f"({fragments.rendered} kaarten gerenderd, {fragments.hits} uit cache)"
+        )
+    else:
+        print(f"✅ {OUT_HTML} is al actueel")
 
     # Klein console-overzicht
-    for key in ("cheapest_flights", "best_flights", "other_flights"):
-        lst = results.get(key) or []
-        if not lst:
-            continue
-        cheapest = sorted(lst, key=lambda x: x.get("price", 10**12))[0]
+    for key, flights in parse_flights(results).items():
+        cheapest = min(
+            flights,
+            key=lambda f: f.price_cents if f.price_cents is not None else 10**14,
+        )
         print(
-            f"- {key}: min prijs €{cheapest.get('price')} (totale duur: {mins_to_hhmm(cheapest.get('total_duration'))})"
+            f"- {key}: min prijs €{from_cents(cheapest.price_cents)} (totale duur: {mins_to_hhmm(cheapest.total_duration)})"
         )
 
 
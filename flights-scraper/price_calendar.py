@@ -0,0 +1,177 @@
+import argparse
+import json
+from datetime import date, datetime, timedelta
+
+from flight_batch import FlightQuery, search_many
+from index import CURRENCY, flight_params, parse_flights
+from records import from_cents
+from serpapi_cache import SerpApiCache
+
+try:
+    import numpy as np
+except ImportError:  # as_array() is dan niet beschikbaar
+    np = None
+
+
+def min_price(results: dict):
+    """Laagste prijs (centen) over alle categorieën, of None."""
+    prices = [
+        f.price_cents
+        for flights in parse_flights(results).values()
+        for f in flights
+        if f.price_cents is not None
+    ]
+    return min(prices, default=None)
+
+
+class PriceCalendar:
+    """Matrix met minimumprijs per (heen, terug); rijen = heendata, kolommen = terugdata.
+
+    Cellen buiten [min_stay, max_stay] of zonder resultaat zijn None.
+    """
+
+    def __init__(self, origin, destination, outbound_dates, return_dates, adults):
+        self.origin = origin
+        self.destination = destination
+        self.outbound_dates = outbound_dates
+        self.return_dates = return_dates
+        self.adults = adults
+        self.prices = [[None] * len(return_dates) for _ in outbound_dates]
+        self.cached_cells = 0
+        self.fetched_cells = 0
+
+    def cells(self, min_stay, max_stay):
+        """(rij, kolom, heen, terug) van alle cellen binnen de verblijfsduur."""
+        for i, outbound in enumerate(self.outbound_dates):
+            for j, ret in enumerate(self.return_dates):
+                stay = (date.fromisoformat(ret) - date.fromisoformat(outbound)).days
+                if min_stay <= stay <= max_stay:
+                    yield i, j, outbound, ret
+
+    def cheapest(self, n: int = 5):
+        filled = [
+            (price, self.outbound_dates[i], self.return_dates[j])
+            for i, row in enumerate(self.prices)
+            for j, price in enumerate(row)
+            if price is not None
+        ]
+        return [
+            {"outbound_date": out, "return_date": ret, "price": from_cents(price)}
+            for price, out, ret in sorted(filled)[:n]
+        ]
+
+    def as_array(self):
+        """NumPy-matrix in euro's, NaN voor lege cellen."""
+        if np is None:
+            raise RuntimeError("numpy is niet geïnstalleerd")
+        return np.array(
+            [[np.nan if p is None else p / 100 for p in row] for row in self.prices],
+            dtype=np.float64,
+        )
+
+    def to_json(self) -> dict:
+        """Kolomgeoriënteerde JSON voor de package builder (prijzen in euro's)."""
+        return {
+            "origin": self.origin,
+            "destination": self.destination,
+            "adults": self.adults,
+            "currency": CURRENCY,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "outbound_dates": self.outbound_dates,
+            "return_dates": self.return_dates,
+            "prices": [[from_cents(p) for p in row] for row in self.prices],
+            "cheapest": self.cheapest(),
+            "cached_cells": self.cached_cells,
+            "fetched_cells": self.fetched_cells,
+        }
+
+
+def build_price_calendar(
+    origin: str,
+    destination: str,
+    first_outbound: str,
+    last_outbound: str,
+    min_stay: int,
+    max_stay: int,
+    adults: int = 2,
+    cache: SerpApiCache | None = None,
+    workers: int = 8,
+    fetch_missing: bool = True,
+) -> PriceCalendar:
+    """Vult de kalender uit de cache en haalt alleen ontbrekende cellen op."""
+    start = date.fromisoformat(first_outbound)
+    end = date.fromisoformat(last_outbound)
+    outbound_dates = [
+        (start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)
+    ]
+    return_dates = [
+        (start + timedelta(days=i)).isoformat()
+        for i in range(min_stay, (end - start).days + max_stay + 1)
+    ]
+    calendar = PriceCalendar(origin, destination, outbound_dates, return_dates, adults)
+    cache = cache or SerpApiCache()
+
+    missing = {}
+    for i, j, outbound, ret in calendar.cells(min_stay, max_stay):
+        params = flight_params(origin, destination, adults, outbound, ret)
+        cached = cache.get(params)
+        if cached is not None:
+            calendar.prices[i][j] = min_price(cached)
+            calendar.cached_cells += 1
+        else:
+            missing[FlightQuery(origin, destination, outbound, ret, adults)] = (i, j)
+
+    if fetch_missing and missing:
+        for report in search_many(list(missing), workers):
+            if report.results is None or report.error:
+                continue
+            q = report.query
+            cache.put(
+                flight_params(
+                    q.origin, q.destination, q.adults, q.outbound_date, q.return_date
+                ),
+                report.results,
+            )
+            i, j = missing[q]
+            calendar.prices[i][j] = min_price(report.results)
+            calendar.fetched_cells += 1
+    return calendar
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Goedkoopste heen/terug per datum")
+    parser.add_argument("--origin", default="CMN")
+    parser.add_argument("--destination", default="MED")
+    parser.add_argument("--first", required=True, help="eerste vertrekdatum (ISO)")
+    parser.add_argument("--last", required=True, help="laatste vertrekdatum (ISO)")
+    parser.add_argument("--min-stay", type=int, default=7)
+    parser.add_argument("--max-stay", type=int, default=14)
+    parser.add_argument("--adults", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--cache-only", action="store_true")
+    parser.add_argument("--out", default="price_calendar.json")
+    args = parser.parse_args()
+
+    calendar = build_price_calendar(
+        args.origin,
+        args.destination,
+        args.first,
+        args.last,
+        args.min_stay,
+        args.max_stay,
+        args.adults,
+        workers=args.workers,
+        fetch_missing=not args.cache_only,
+    )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(calendar.to_json(), f, ensure_ascii=False)
+    print(
+        f"✅ Kalender opgeslagen in {args.out} "
+        f"({calendar.cached_cells} uit cache, {calendar.fetched_cells} opgehaald)"
+    )
+    for cell in calendar.cheapest():
+        print(f"- {cell['outbound_date']} → {cell['return_date']}: €{cell['price']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# params die niets aan het resultaat veranderen
+IGNORED_PARAMS = ("api_key", "source", "output")
+
+
+def params_key(params: dict) -> str:
+    """Stabiele sleutel voor een SerpApi-zoekopdracht (zonder api_key)."""
+    relevant = {k: str(v) for k, v in params.items() if k not in IGNORED_PARAMS}
+    blob = json.dumps(relevant, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class SerpApiCache:
+    """Ruwe SerpApi-responses op schijf, één JSON-bestand per params-dict, met TTL."""
+
+    def __init__(self, directory: str = ".serpapi_cache", ttl: float = 6 * 60 * 60):
+        self.directory = directory
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, params: dict) -> str:
+        return os.path.join(self.directory, params_key(params) + ".json")
+
+    def get(self, params: dict, max_age: float | None = None):
+        """Gecachte response of None als die ontbreekt of verlopen is."""
+        path = self._path(params)
+        raw = self._read(path, max_age)
+        data = None
+        if raw is not None:
+            try:
+                data = json.loads(raw)
+            except json.JSONDecodeError:
+                # kapot bestand (bv. half geschreven): weg ermee, telt als miss
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self._count(data is not None)
+        return data
+
+    def get_raw(self, params: dict, max_age: float | None = None):
+        """Als get, maar de ruwe JSON-bytes zoals opgeslagen (niet gecontroleerd)."""
+        raw = self._read(self._path(params), max_age)
+        self._count(raw is not None)
+        return raw
+
+    def _read(self, path: str, max_age: float | None):
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > (self.ttl if max_age is None else max_age):
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, params: dict, data: dict):
+        # fouten (quota, ongeldige params) niet cachen
+        if "error" in data:
+            return
+        path = self._path(params)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Hotel proximity to Masjid al-Haram and Masjid an-Nabawi.
+
+``HotelIndex`` buckets hotels into a grid of ``cell_deg`` degree cells once;
+radius and k-nearest queries only compute (vectorized) haversine distances
+for hotels in the cells around the query point instead of scanning and
+string-parsing every ``distance_from_center``.
+
+Distances from every hotel to every landmark are precomputed into a sidecar
+next to the hotel data (hotels_mecca_medina.distances.json) and rebuilt when
+the hotel file changes:
+
+    python hotel_geo.py                      # nearest hotels per landmark
+    python hotel_geo.py --landmark haram --radius 1000
+"""
+
+import argparse
+import json
+import math
+import os
+from collections import defaultdict
+
+from records import load_hotels
+
+try:
+    import numpy as np
+except ImportError:  # plain-Python haversine
+    np = None
+
+EARTH_RADIUS = 6371008.8  # metres
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+# key -> (name, city, latitude, longitude)
+LANDMARKS = {
+    "haram": ("Masjid al-Haram", "Mecca", 21.4225, 39.8262),
+    "nabawi": ("Masjid an-Nabawi", "Medina", 24.4672, 39.6111),
+}
+
+
+def haversine(lat, lon, lats, lons):
+    """Metres from (lat, lon) to each of `lats`/`lons`, as a list"""
+    if np is not None:
+        lat1, lon1 = np.radians(lat), np.radians(lon)
+        lat2, lon2 = np.radians(np.asarray(lats)), np.radians(np.asarray(lons))
+        a = (
+            np.sin((lat2 - lat1) / 2) ** 2
+            + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        )
+        return (2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))).tolist()
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    result = []
+    for lat2, lon2 in zip(lats, lons):
+        lat2, lon2 = math.radians(lat2), math.radians(lon2)
+        a = (
+            math.sin((lat2 - lat1) / 2) ** 2
+            + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        )
+        result.append(2 * EARTH_RADIUS * math.asin(math.sqrt(a)))
+    return result
+
+
+class HotelIndex:
+    def __init__(self, hotels, cell_deg=0.01):
+        """
+        hotels: records.Hotel list; hotels without coordinates are left out
+        cell_deg: grid cell size in degrees (0.01 is about 1.1 km)
+        """
+        self.hotels = [
+            h for h in hotels if h.latitude is not None and h.longitude is not None
+        ]
+        self.cell_deg = cell_deg
+        self.lats = [h.latitude for h in self.hotels]
+        self.lons = [h.longitude for h in self.hotels]
+        self.cells = defaultdict(list)
+        for i, hotel in enumerate(self.hotels):
+            self.cells[self._cell(hotel.latitude, hotel.longitude)].append(i)
+        if self.cells:
+            rows = [cell[0] for cell in self.cells]
+            cols = [cell[1] for cell in self.cells]
+            self._bounds = (min(rows), max(rows), min(cols), max(cols))
+            max_lat = max(abs(lat) for lat in self.lats) + cell_deg
+            # shortest side of any cell, to bound distances per ring
+            self._cell_metres = (
+                cell_deg * METRES_PER_DEGREE * math.cos(math.radians(min(max_lat, 89)))
+            )
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _ring(self, center, r):
+        """Indices of hotels in the cells exactly `r` cells away from center"""
+        row, col = center
+        if r == 0:
+            return list(self.cells.get(center, ()))
+        # only the square's edge: top and bottom rows, then the side columns
+        edge = [(i, j) for i in (row - r, row + r) for j in range(col - r, col + r + 1)]
+        edge += [
+            (i, j) for j in (col - r, col + r) for i in range(row - r + 1, row + r)
+        ]
+        found = []
+        for cell in edge:
+            found.extend(self.cells.get(cell, ()))
+        return found
+
+    def _max_ring(self, center):
+        top, bottom, left, right = self._bounds
+        row, col = center
+        return max(abs(row - top), abs(row - bottom), abs(col - left), abs(col - right))
+
+    def _distances(self, lat, lon, indices):
+        return haversine(
+            lat, lon, [self.lats[i] for i in indices], [self.lons[i] for i in indices]
+        )
+
+    def within(self, lat, lon, radius):
+        """(metres, hotel) for hotels within `radius` metres, nearest first"""
+        if not self.hotels:
+            return []
+        center = self._cell(lat, lon)
+        rings = min(math.ceil(radius / self._cell_metres), self._max_ring(center))
+        indices = [i for r in range(rings + 1) for i in self._ring(center, r)]
+        hits = [
+            (d, i)
+            for d, i in zip(self._distances(lat, lon, indices), indices)
+            if d <= radius
+        ]
+        return [(d, self.hotels[i]) for d, i in sorted(hits)]
+
+    def nearest(self, lat, lon, k=5):
+        """(metres, hotel) for the `k` nearest hotels, nearest first"""
+        if not self.hotels or k < 1:
+            return []
+        k = min(k, len(self.hotels))
+        center = self._cell(lat, lon)
+        last_ring = self._max_ring(center)
+        found = []
+        for r in range(last_ring + 1):
+            indices = self._ring(center, r)
+            if not indices:
+                continue
+            found.extend(zip(self._distances(lat, lon, indices), indices))
+            found.sort()
+            if len(found) == len(self.hotels):
+                break  # every hotel seen
+            # anything in ring r+1 or beyond is at least r cell widths away
+            if len(found) >= k and found[k - 1][0] <= r * self._cell_metres:
+                break
+        return [(d, self.hotels[i]) for d, i in found[:k]]
+
+    def near_landmark(self, landmark, k=5, radius=None):
+        """Hotels in the landmark's city, nearest first; `radius` or `k`"""
+        _, city, lat, lon = LANDMARKS[landmark]
+        if radius is not None:
+            hits = self.within(lat, lon, radius)
+        else:
+            # other-city hotels are hundreds of km away, so never in the top k
+            hits = self.nearest(lat, lon, k)
+        return [(d, h) for d, h in hits if h.city == city]
+
+
+def distances_path(hotels_path):
+    return os.path.splitext(hotels_path)[0] + ".distances.json"
+
+
+def landmark_distances(hotels_path="hotels_mecca_medina.json"):
+    """hotel_id -> {landmark: metres}, from the sidecar when it is current"""
+    sidecar = distances_path(hotels_path)
+    mtime = os.path.getmtime(hotels_path)
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["source_mtime"] == mtime and cached["landmarks"] == list(LANDMARKS):
+            return cached["distances"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    hotels = [h for h in load_hotels(hotels_path) if h.latitude is not None]
+    lats = [h.latitude for h in hotels]
+    lons = [h.longitude for h in hotels]
+    distances = {h.hotel_id: {} for h in hotels}
+    for key, (_, _, lat, lon) in LANDMARKS.items():
+        for hotel, d in zip(hotels, haversine(lat, lon, lats, lons)):
+            distances[hotel.hotel_id][key] = round(d)
+
+    with open(sidecar + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "source_mtime": mtime,
+                "landmarks": list(LANDMARKS),
+                "distances": distances,
+            },
+            f,
+            indent=2,
+        )
+    os.replace(sidecar + ".tmp", sidecar)
+    return distances
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hotels nearest to the Haram")
+    parser.add_argument("--hotels", default="hotels_mecca_medina.json")
+    parser.add_argument("--landmark", choices=list(LANDMARKS))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius", type=float, help="metres")
+    args = parser.parse_args()
+
+    landmark_distances(args.hotels)
+    index = HotelIndex(load_hotels(args.hotels))
+    for key in [args.landmark] if args.landmark else LANDMARKS:
+        print(f"\n{LANDMARKS[key][0]}:")
+        for d, hotel in index.near_landmark(key, args.k, args.radius):
+            print(f"  {d / 1000:5.2f} km  {hotel.name} ({hotel.hotel_id})")
+
+
+if __name__ == "__main__":
+    main()
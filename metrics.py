@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Stage timers and counters for the scrapers' hot paths.
+
+Off by default: ``span()`` then returns one shared no-op context manager and
+``count()`` returns straight away, so instrumented code costs a global
+lookup and a call. ``enable()`` (or SCRAPER_METRICS=1 / =path.jsonl in the
+environment) turns collection on:
+
+- spans are timed with perf_counter and aggregated per (name, labels) into
+  a count, a sum and latency buckets,
+- counters are plain per (name, labels) totals,
+- with a JSON-lines path every span and counter increment is also appended
+  as one line, for shipping to a log pipeline.
+
+``prometheus_text()`` renders the aggregates in the Prometheus text format;
+``snapshot()`` returns them as a dict.
+
+    with metrics.span("parse", scraper="trains"):
+        tickets = ...
+    metrics.count("parse_method", method="text")
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# seconds; covers a regex pass up to a slow upstream round trip
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "scraper"
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.seconds = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        labels = self.labels
+        if exc_type is not None:
+            labels = {**labels, "error": exc_type.__name__}
+        self.registry.observe(self.name, self.seconds, labels)
+        return False
+
+
+class Registry:
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self.spans = {}  # (name, labels) -> [count, sum, bucket counts]
+        self.counters = {}  # (name, labels) -> total
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, labels):
+        key = self._key(name, labels)
+        with self._lock:
+            entry = self.spans.get(key)
+            if entry is None:
+                entry = self.spans[key] = [0, 0.0, [0] * (len(BUCKETS) + 1)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2][bisect_left(BUCKETS, seconds)] += 1
+        self._log("span", name, labels, seconds=round(seconds, 6))
+
+    def count(self, name, value, labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._log("counter", name, labels, value=value)
+
+    def _log(self, kind, name, labels, **fields):
+        if not self.jsonl_path:
+            return
+        line = json.dumps(
+            {
+                "ts": round(time.time(), 6),
+                "type": kind,
+                "name": name,
+                **labels,
+                **fields,
+            }
+        )
+        with self._lock:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "spans": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": count,
+                        "seconds": total,
+                        "buckets": dict(zip((*BUCKETS, "+Inf"), buckets)),
+                    }
+                    for (name, labels), (count, total, buckets) in self.spans.items()
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def prometheus_text(self):
+        lines = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+        snap = self.snapshot()
+        for span in snap["spans"]:
+            labels = {"stage": span["name"], **span["labels"]}
+            cumulative = 0
+            for bound, n in span["buckets"].items():
+                cumulative += n
+                lines.append(
+                    f"{PREFIX}_stage_seconds_bucket"
+                    f"{_labels({**labels, 'le': bound})} {cumulative}"
+                )
+            lines.append(
+                f"{PREFIX}_stage_seconds_sum{_labels(labels)} {span['seconds']}"
+            )
+            lines.append(
+                f"{PREFIX}_stage_seconds_count{_labels(labels)} {span['count']}"
+            )
+        names = sorted({c["name"] for c in snap["counters"]})
+        for name in names:
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for counter in snap["counters"]:
+                if counter["name"] == name:
+                    lines.append(
+                        f"{PREFIX}_{name}_total{_labels(counter['labels'])} {counter['value']}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+_registry = None
+
+
+def enable(jsonl_path=None):
+    """Start collecting (again, from zero); returns the Registry"""
+    global _registry
+    _registry = Registry(jsonl_path)
+    return _registry
+
+
+def disable():
+    global _registry
+    _registry = None
+
+
+def enabled():
+    return _registry is not None
+
+
+def span(name, **labels):
+    """Context manager timing one stage; no-op while disabled"""
+    if _registry is None:
+        return NULL_SPAN
+    return Span(_registry, name, labels)
+
+
+def count(name, value=1, **labels):
+    if _registry is not None:
+        _registry.count(name, value, labels)
+
+
+def snapshot():
+    return (
+        _registry.snapshot() if _registry is not None else {"spans": [], "counters": []}
+    )
+
+
+def prometheus_text():
+    return _registry.prometheus_text() if _registry is not None else ""
+
+
+_env = os.getenv("SCRAPER_METRICS")
+if _env:
+    enable(None if _env == "1" else _env)
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""Columnar store for flight, hotel and train offers.
+
+The three scraper outputs (vluchten.json, hotels_mecca_medina.json,
+available_tickets.json) are ingested once into one table each, stored
+column by column as ``.npy`` files plus a ``meta.json``:
+
+    offer_store/
+        meta.json            row counts, dtypes and string tables
+        hotels/price_per_night_cents.npy
+        hotels/star_rating.npy
+        ...
+
+``OfferStore.load`` memory-maps the columns, so opening the store is cheap
+and a query only pages in the columns it touches. Numbers follow records.py
+(cents, minutes, metres); missing values are ``MISSING`` (-1, NaN for
+floats). String columns hold codes into the table's string list.
+
+Queries are vectorized over whole columns:
+
+    store = OfferStore.load()
+    idx = store.hotels.query(
+        city="Mecca",
+        star_rating=(4, None),
+        price_per_night_cents=(None, 30000),
+        order_by="distance_from_center",
+    )
+    store.hotels.rows(idx)
+
+    python offer_store.py build
+    python offer_store.py hotels city=Mecca star_rating=4: --order-by distance_from_center
+    python offer_store.py hotels city!=Mecca
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from records import Flight, Hotel, Ticket
+
+MISSING = -1
+
+FLIGHT_CATEGORIES = ("cheapest_flights", "best_flights", "other_flights")
+
+
+class Not:
+    """Negated equality/membership condition for Table.mask: city=Not("Mecca")"""
+
+    def __init__(self, condition):
+        self.condition = condition
+
+
+# column name -> dtype; "str" columns are stored as int32 codes
+HOTEL_COLUMNS = {
+    "hotel_id": "str",
+    "name": "str",
+    "city": "str",
+    "latitude": "float64",
+    "longitude": "float64",
+    "star_rating": "int8",
+    "review_score": "float64",
+    "review_count": "int32",
+    "price_per_night_cents": "int64",
+    "price_total_cents": "int64",
+    "nights": "int16",
+    "currency": "str",
+    "distance_from_center": "int32",
+    "max_room_capacity": "int16",
+}
+
+FLIGHT_COLUMNS = {
+    "category": "str",
+    "flight_numbers": "str",
+    "airline": "str",
+    "origin": "str",
+    "destination": "str",
+    "departure_date": "str",
+    "departure": "int16",
+    "arrival_date": "str",
+    "arrival": "int16",
+    "total_duration": "int32",
+    "stops": "int8",
+    "price_cents": "int64",
+}
+
+TRAIN_COLUMNS = {
+    "from_station": "str",
+    "to_station": "str",
+    "travel_date": "str",
+    "train_number": "str",
+    "departure": "int16",
+    "arrival": "int16",
+    "duration": "int16",
+    "stops": "int8",
+    "price_cents": "int64",
+}
+
+
+def hotel_rows(hotels):
+    for hotel in hotels:
+        yield {
+            "hotel_id": hotel.hotel_id,
+            "name": hotel.name,
+            "city": hotel.city,
+            "latitude": hotel.latitude,
+            "longitude": hotel.longitude,
+            "star_rating": hotel.star_rating,
+            "review_score": hotel.review_score,
+            "review_count": hotel.review_count,
+            "price_per_night_cents": hotel.price_per_night_cents,
+            "price_total_cents": hotel.price_total_cents,
+            "nights": hotel.nights,
+            "currency": hotel.currency,
+            "distance_from_center": hotel.distance_from_center,
+            "max_room_capacity": max(
+                (room.capacity for room in hotel.rooms), default=None
+            ),
+        }
+
+
+def flight_rows(results):
+    """One row per offer in a SerpApi result dict"""
+    for category in FLIGHT_CATEGORIES:
+        for flight in map(Flight.from_dict, results.get(category) or []):
+            if not flight.legs:
+                continue
+            first, last = flight.legs[0], flight.legs[-1]
+            yield {
+                "category": category,
+                "flight_numbers": "/".join(flight.flight_numbers),
+                "airline": first.airline,
+                "origin": first.departure_id,
+                "destination": last.arrival_id,
+                "departure_date": first.departure_date,
+                "departure": first.departure,
+                "arrival_date": last.arrival_date,
+                "arrival": last.arrival,
+                "total_duration": flight.total_duration,
+                "stops": len(flight.legs) - 1,
+                "price_cents": flight.price_cents,
+            }
+
+
+def train_rows(tickets, from_station=None, to_station=None, travel_date=None):
+    for ticket in tickets:
+        yield {
+            "from_station": from_station,
+            "to_station": to_station,
+            "travel_date": travel_date,
+            "train_number": ticket.train_number,
+            "departure": ticket.departure,
+            "arrival": ticket.arrival,
+            "duration": ticket.duration,
+            "stops": ticket.stops,
+            "price_cents": ticket.price_cents,
+        }
+
+
+class Table:
+    def __init__(self, name, columns, strings, schema):
+        """
+        columns: column name -> 1-d array, all the same length
+        strings: column name -> list of strings the codes index into
+        """
+        self.name = name
+        self.columns = columns
+        self.strings = strings
+        self.schema = schema
+        self._codes = {}
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @classmethod
+    def from_rows(cls, name, schema, rows):
+        values = {column: [] for column in schema}
+        for row in rows:
+            for column in schema:
+                values[column].append(row.get(column))
+
+        columns, strings = {}, {}
+        for column, dtype in schema.items():
+            if dtype == "str":
+                table = {}
+                codes = [
+                    MISSING if v is None else table.setdefault(v, len(table))
+                    for v in values[column]
+                ]
+                columns[column] = np.array(codes, dtype=np.int32)
+                strings[column] = list(table)
+            else:
+                missing = np.nan if dtype.startswith("float") else MISSING
+                columns[column] = np.array(
+                    [missing if v is None else v for v in values[column]], dtype=dtype
+                )
+        return cls(name, columns, strings, schema)
+
+    def code(self, column, value):
+        """Code of string `value` in `column`, MISSING when it never occurs"""
+        codes = self._codes.get(column)
+        if codes is None:
+            codes = self._codes[column] = {
+                s: i for i, s in enumerate(self.strings[column])
+            }
+        return codes.get(value, MISSING)
+
+    def mask(self, **conditions):
+        """Boolean mask of rows matching every condition.
+
+        Per column:
+        - a string or number: equality
+        - a set/frozenset: membership
+        - a (lo, hi) tuple: inclusive range, None for an open end; rows with
+          a missing value never match a range
+        - Not(value or set): rows with a value that isn't (one of) them;
+          rows with a missing value never match
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for column, condition in conditions.items():
+            values = self.columns[column]
+            is_str = self.schema[column] == "str"
+            present = (
+                ~np.isnan(values) if values.dtype.kind == "f" else values != MISSING
+            )
+            if isinstance(condition, tuple):
+                lo, hi = condition
+                if is_str:
+                    raise ValueError(f"range condition on string column {column}")
+                mask &= present
+                if lo is not None:
+                    mask &= values >= lo
+                if hi is not None:
+                    mask &= values <= hi
+            elif isinstance(condition, Not):
+                mask &= present & ~np.isin(
+                    values, self._wanted(column, condition.condition)
+                )
+            else:
+                mask &= np.isin(values, self._wanted(column, condition))
+        return mask
+
+    def _wanted(self, column, condition):
+        """Codes/values an equality or membership condition matches.
+
+        Strings the column never holds are left out rather than mapped to
+        MISSING, so they can't match rows whose value is missing.
+        """
+        if not isinstance(condition, (set, frozenset)):
+            condition = (condition,)
+        if self.schema[column] != "str":
+            return list(condition)
+        codes = [self.code(column, str(v)) for v in condition]
+        return [code for code in codes if code != MISSING]
+
+    def query(self, order_by=None, descending=False, limit=None, **conditions):
+        """Row indices matching `conditions` (see mask), optionally sorted.
+
+        Rows missing `order_by` sort last either way.
+        """
+        index = np.flatnonzero(self.mask(**conditions))
+        if order_by is not None:
+            keys = self.columns[order_by][index]
+            if keys.dtype.kind == "f":
+                missing = np.isnan(keys)
+            else:
+                missing = keys == MISSING
+                keys = keys.astype(np.float64)
+            if descending:
+                keys = -keys
+            keys[missing] = np.inf
+            index = index[np.argsort(keys, kind="stable")]
+        return index[:limit] if limit is not None else index
+
+    def rows(self, index):
+        """Rows as dicts with strings decoded and missing values as None"""
+        result = []
+        for i in np.asarray(index).tolist():
+            row = {}
+            for column, values in self.columns.items():
+                value = values[i].item()
+                if self.schema[column] == "str":
+                    value = None if value == MISSING else self.strings[column][value]
+                elif value == MISSING or value != value:
+                    value = None
+                row[column] = value
+            result.append(row)
+        return result
+
+    def save(self, directory):
+        os.makedirs(os.path.join(directory, self.name), exist_ok=True)
+        for column, values in self.columns.items():
+            path = os.path.join(directory, self.name, column + ".npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, values)
+            os.replace(path + ".tmp", path)
+        return {"rows": len(self), "schema": self.schema, "strings": self.strings}
+
+    @classmethod
+    def load(cls, directory, name, meta, mmap=True):
+        columns = {
+            column: np.load(
+                os.path.join(directory, name, column + ".npy"),
+                mmap_mode="r" if mmap else None,
+            )
+            for column in meta["schema"]
+        }
+        return cls(name, columns, meta["strings"], meta["schema"])
+
+
+class OfferStore:
+    TABLES = ("flights", "hotels", "trains")
+
+    def __init__(self, flights, hotels, trains):
+        self.flights = flights
+        self.hotels = hotels
+        self.trains = trains
+
+    @classmethod
+    def build(
+        cls,
+        flights_path="vluchten.json",
+        hotels_path="hotels_mecca_medina.json",
+        tickets_path="available_tickets.json",
+        route=(None, None, None),
+    ):
+        """Ingest the scraper outputs; a missing file gives an empty table.
+
+        route: (from_station, to_station, travel_date) of the tickets file,
+        which doesn't record its own search.
+        """
+        flights = _read_json(flights_path, {})
+        hotels = _read_json(hotels_path, {}).get("hotels", [])
+        tickets = _read_json(tickets_path, [])
+        return cls(
+            Table.from_rows("flights", FLIGHT_COLUMNS, flight_rows(flights)),
+            Table.from_rows(
+                "hotels", HOTEL_COLUMNS, hotel_rows(map(Hotel.from_dict, hotels))
+            ),
+            Table.from_rows(
+                "trains",
+                TRAIN_COLUMNS,
+                train_rows(map(Ticket.from_dict, tickets), *route),
+            ),
+        )
+
+    def save(self, directory="offer_store"):
+        meta = {name: getattr(self, name).save(directory) for name in self.TABLES}
+        path = os.path.join(directory, "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory="offer_store", mmap=True):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            *(Table.load(directory, name, meta[name], mmap) for name in cls.TABLES)
+        )
+
+
+def _read_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def parse_condition(text):
+    """'city=Mecca' / 'star_rating=4:' / 'price_per_night_cents=:30000'"""
+    column, _, value = text.partition("=")
+    if column.endswith("!"):
+        column, condition = parse_condition(f"{column[:-1]}={value}")
+        return column, Not(condition)
+
+    def number(v):
+        if not v:
+            return None
+        return float(v) if "." in v else int(v)
+
+    if ":" in value:
+        lo, _, hi = value.partition(":")
+        return column, (number(lo), number(hi))
+    try:
+        return column, number(value)
+    except ValueError:
+        return column, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offer store")
+    parser.add_argument("table", choices=("build",) + OfferStore.TABLES)
+    parser.add_argument(
+        "conditions", nargs="*", help="column=value, column!=value or column=lo:hi"
+    )
+    parser.add_argument("--dir", default="offer_store")
+    parser.add_argument("--order-by")
+    parser.add_argument("--desc", action="store_true")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--flights", default="vluchten.json")
+    parser.add_argument("--hotels", default="hotels_mecca_medina.json")
+    parser.add_argument("--tickets", default="available_tickets.json")
+    args = parser.parse_args()
+
+    if args.table == "build":
+        store = OfferStore.build(args.flights, args.hotels, args.tickets)
+        store.save(args.dir)
+        print(
+            f"Stored {len(store.flights)} flights, {len(store.hotels)} hotels, "
+            f"{len(store.trains)} trains in {args.dir}/"
+        )
+        return
+
+    table = getattr(OfferStore.load(args.dir), args.table)
+    conditions = dict(map(parse_condition, args.conditions))
+    index = table.query(args.order_by, args.desc, args.limit, **conditions)
+    print(json.dumps(table.rows(index), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""Find the best Umrah packages: flight + Medina hotel + train + Mecca hotel.
+
+A package is feasible when
+
+- the stay fits the dates: Medina check-in on the flight's arrival day,
+  ``medina_nights`` later the train to Mecca, then ``mecca_nights`` in Mecca,
+  all inside the hotel search window and before the return flight,
+- the train leaves at least ``transfer_buffer`` minutes after the flight lands
+  (only bites when ``medina_nights`` is 0, i.e. straight from the airport),
+- both rooms sleep the whole party (``capacity >= party_size``).
+
+Packages are ranked by total price or by a weighted score (price plus
+euro penalties for flight hours and hotel distance, minus a bonus per review
+point). Both are sums of per-component costs, so the search is a
+branch-and-bound over the components sorted by cost: a branch is cut as soon
+as its cost plus the cheapest possible remainder can't beat the K-th best
+package found so far (or exceeds the budget).
+
+    python package_optimizer.py --party 2 --medina-nights 4 --mecca-nights 3
+"""
+
+import argparse
+import heapq
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from records import Flight, Hotel, Room, Ticket, fmt_hhmm, from_cents, load_hotels
+
+FLIGHT_CATEGORIES = ("cheapest_flights", "best_flights", "other_flights")
+
+# euro-equivalents per unit, used by objective="score"
+DEFAULT_WEIGHTS = {
+    "flight_hour": 20.0,  # per hour of total flight duration
+    "distance_km": 30.0,  # per km between hotel and city centre
+    "review_point": 50.0,  # bonus per review point (0-10)
+}
+
+
+@dataclass(slots=True)
+class Package:
+    flight: Flight
+    medina_hotel: Hotel
+    medina_room: Room
+    train: Ticket
+    mecca_hotel: Hotel
+    mecca_room: Room
+    arrival_date: str
+    train_date: str
+    medina_nights: int
+    mecca_nights: int
+    price_cents: int
+    score: float
+
+    def to_dict(self):
+        return {
+            "price": from_cents(self.price_cents),
+            "score": round(self.score / 100, 2),
+            "flight": {
+                "flight_numbers": list(self.flight.flight_numbers),
+                "arrival": f"{self.arrival_date} {fmt_hhmm(self.flight.legs[-1].arrival)}",
+                "price": from_cents(self.flight.price_cents),
+            },
+            "medina_hotel": _stay_dict(
+                self.medina_hotel,
+                self.medina_room,
+                self.arrival_date,
+                self.medina_nights,
+            ),
+            "train": {"date": self.train_date, **self.train.to_dict()},
+            "mecca_hotel": _stay_dict(
+                self.mecca_hotel, self.mecca_room, self.train_date, self.mecca_nights
+            ),
+        }
+
+
+def _stay_dict(hotel, room, checkin, nights):
+    return {
+        "hotel_id": hotel.hotel_id,
+        "name": hotel.name,
+        "room_id": room.room_id,
+        "room": room.name,
+        "checkin": checkin,
+        "nights": nights,
+        "price": from_cents(room.price_per_night_cents * nights),
+    }
+
+
+class _Option:
+    """One choice for one component: its price, its objective cost and the
+    record(s) it stands for"""
+
+    __slots__ = ("price", "cost", "item")
+
+    def __init__(self, price, cost, item):
+        self.price = price
+        self.cost = cost
+        self.item = item
+
+
+def load_flights(path="vluchten.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [
+        Flight.from_dict(flight)
+        for category in FLIGHT_CATEGORIES
+        for flight in data.get(category) or []
+    ]
+
+
+def load_tickets(path="available_tickets.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        return [Ticket.from_dict(ticket) for ticket in json.load(f)]
+
+
+def optimize_packages(
+    flights,
+    hotels,
+    tickets,
+    party_size=2,
+    medina_nights=4,
+    mecca_nights=3,
+    transfer_buffer=180,
+    top_k=5,
+    objective="price",
+    weights=None,
+    budget=None,
+    hotel_window=None,
+    return_date=None,
+    train_price_cents=None,
+    stats=None,
+):
+    """Top-`top_k` feasible packages, best first.
+
+    flights: records.Flight list (prices are for the whole party)
+    hotels: records.Hotel list, both cities
+    tickets: records.Ticket list for the Medina -> Mecca train; ticket prices
+        are per person, `train_price_cents` stands in for tickets without one
+    budget: maximum total price in cents
+    hotel_window: (checkin, checkout) ISO dates the hotel prices are valid for
+    return_date: ISO date of the return flight
+    stats: optional dict, filled with "candidates" (size of the cross
+        product) and "visited" (search nodes expanded)
+    """
+    if objective not in ("price", "score"):
+        raise ValueError(f"unknown objective {objective!r}")
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    use_score = objective == "score"
+
+    def hotel_options(city, nights):
+        options = []
+        for hotel in hotels:
+            if hotel.city != city:
+                continue
+            penalty = 0.0
+            if use_score:
+                penalty += (
+                    weights["distance_km"] * (hotel.distance_from_center or 0) / 1000
+                    - weights["review_point"] * hotel.review_score
+                ) * 100
+            for room in hotel.rooms:
+                if room.capacity < party_size or room.price_per_night_cents is None:
+                    continue
+                price = room.price_per_night_cents * nights
+                options.append(_Option(price, price + penalty, (hotel, room)))
+        return options
+
+    # flights: the dates of the whole trip hang off the arrival day
+    flight_options = []
+    for flight in flights:
+        if not flight.legs or flight.price_cents is None:
+            continue
+        last = flight.legs[-1]
+        if last.arrival is None or not last.arrival_date:
+            continue
+        arrival_day = date.fromisoformat(last.arrival_date)
+        end = arrival_day + timedelta(days=medina_nights + mecca_nights)
+        if hotel_window is not None and not (
+            date.fromisoformat(hotel_window[0]) <= arrival_day
+            and end <= date.fromisoformat(hotel_window[1])
+        ):
+            continue
+        if return_date is not None and end > date.fromisoformat(return_date):
+            continue
+        arrival = datetime.combine(arrival_day, datetime.min.time()) + timedelta(
+            minutes=last.arrival
+        )
+        cost = flight.price_cents
+        if use_score and flight.total_duration is not None:
+            cost += weights["flight_hour"] * flight.total_duration / 60 * 100
+        flight_options.append(_Option(flight.price_cents, cost, (flight, arrival)))
+
+    train_options = []
+    for ticket in tickets:
+        per_person = (
+            ticket.price_cents if ticket.price_cents is not None else train_price_cents
+        )
+        if ticket.departure is None or per_person is None:
+            continue
+        price = per_person * party_size
+        train_options.append(_Option(price, price, ticket))
+
+    stages = [
+        flight_options,
+        train_options,
+        hotel_options("Medina", medina_nights),
+        hotel_options("Mecca", mecca_nights),
+    ]
+    for options in stages:
+        options.sort(key=lambda o: o.cost)
+    if stats is not None:
+        stats["candidates"] = 1
+        for options in stages:
+            stats["candidates"] *= len(options)
+        stats["visited"] = 0
+    if not all(stages):
+        return []
+
+    # cheapest possible completion from each stage on
+    rest_cost = [0.0] * (len(stages) + 1)
+    rest_price = [0] * (len(stages) + 1)
+    for i in range(len(stages) - 1, -1, -1):
+        rest_cost[i] = rest_cost[i + 1] + stages[i][0].cost
+        rest_price[i] = rest_price[i + 1] + min(o.price for o in stages[i])
+
+    def train_fits(flight_option, ticket):
+        _, arrival = flight_option.item
+        departs = datetime.combine(
+            arrival.date() + timedelta(days=medina_nights), datetime.min.time()
+        ) + timedelta(minutes=ticket.departure)
+        return departs >= arrival + timedelta(minutes=transfer_buffer)
+
+    best = []  # max-heap on cost via (-cost, seq, choice)
+    counter = [0]
+
+    def search(stage, chosen, cost, price):
+        for option in stages[stage]:
+            # options are sorted by cost: once one can't win, none after it can
+            if (
+                len(best) == top_k
+                and cost + option.cost + rest_cost[stage + 1] >= -best[0][0]
+            ):
+                break
+            if (
+                budget is not None
+                and price + option.price + rest_price[stage + 1] > budget
+            ):
+                continue
+            if stage == 1 and not train_fits(chosen[0], option.item):
+                continue
+            if stats is not None:
+                stats["visited"] += 1
+            path = chosen + [option]
+            if stage + 1 < len(stages):
+                search(stage + 1, path, cost + option.cost, price + option.price)
+                continue
+            counter[0] += 1
+            entry = (-(cost + option.cost), -counter[0], path)
+            if len(best) < top_k:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heapreplace(best, entry)
+
+    search(0, [], 0.0, 0)
+
+    packages = []
+    for neg_cost, _, (flight_opt, train_opt, medina_opt, mecca_opt) in sorted(
+        best, reverse=True
+    ):
+        flight, arrival = flight_opt.item
+        train_day = arrival.date() + timedelta(days=medina_nights)
+        packages.append(
+            Package(
+                flight=flight,
+                medina_hotel=medina_opt.item[0],
+                medina_room=medina_opt.item[1],
+                train=train_opt.item,
+                mecca_hotel=mecca_opt.item[0],
+                mecca_room=mecca_opt.item[1],
+                arrival_date=arrival.date().isoformat(),
+                train_date=train_day.isoformat(),
+                medina_nights=medina_nights,
+                mecca_nights=mecca_nights,
+                price_cents=sum(
+                    o.price for o in (flight_opt, train_opt, medina_opt, mecca_opt)
+                ),
+                score=-neg_cost,
+            )
+        )
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Best flight + hotels + train")
+    parser.add_argument("--flights", default="vluchten.json")
+    parser.add_argument("--hotels", default="hotels_mecca_medina.json")
+    parser.add_argument("--tickets", default="available_tickets.json")
+    parser.add_argument("--party", type=int, default=2)
+    parser.add_argument("--medina-nights", type=int, default=4)
+    parser.add_argument("--mecca-nights", type=int, default=3)
+    parser.add_argument("--buffer", type=int, default=180, help="minutes")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--objective", choices=("price", "score"), default="price")
+    parser.add_argument("--budget", type=float, help="EUR")
+    parser.add_argument(
+        "--train-price", type=float, default=45, help="EUR p.p. when unknown"
+    )
+    args = parser.parse_args()
+
+    with open(args.hotels, "r", encoding="utf-8") as f:
+        search = json.load(f).get("search_parameters", {})
+    window = (
+        (search["checkin_date"], search["checkout_date"])
+        if "checkin_date" in search and "checkout_date" in search
+        else None
+    )
+    stats = {}
+    packages = optimize_packages(
+        load_flights(args.flights),
+        load_hotels(args.hotels),
+        load_tickets(args.tickets),
+        party_size=args.party,
+        medina_nights=args.medina_nights,
+        mecca_nights=args.mecca_nights,
+        transfer_buffer=args.buffer,
+        top_k=args.top,
+        objective=args.objective,
+        budget=round(args.budget * 100) if args.budget is not None else None,
+        hotel_window=window,
+        train_price_cents=round(args.train_price * 100),
+        stats=stats,
+    )
+    print(json.dumps([p.to_dict() for p in packages], indent=2, ensure_ascii=False))
+    print(
+        f"{len(packages)} packages, {stats['visited']} of {stats['candidates']} "
+        f"combinations visited"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Pipelined fetch -> parse/render for batches of searches.
+
+Fetching is I/O-bound and runs on `fetch_workers` threads. Parsing and
+rendering are CPU-bound and run in a pool of `cpu_workers` processes, so
+they overlap with network waits and use every core. Between the stages
+there is a bounded queue: a fetch thread that finds `queue_size` responses
+already waiting for a CPU worker blocks until one is taken, so memory stays
+bounded when the network outpaces the CPUs. The raw response body goes to
+the worker as-is; it is parsed there, never re-serialized in between.
+
+    for result in run_pipeline(queries, fetch, process):
+        ...  # StageResult per query, in completion order
+
+Ready-made batches:
+
+    python pipeline.py trains --days 7                     # all station pairs
+    python pipeline.py flights --origins AMS BRU --destinations MED JED \\
+        --outbound 2025-09-10 --days 7 --out-dir out
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from queue import Queue
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "flights-scraper")
+)
+
+# value is the CPU stage's result, or None with error set
+StageResult = namedtuple("StageResult", "item value error fetch_seconds cpu_seconds")
+
+
+def _quiet_worker():
+    # the scrapers print progress per call; keep worker output out of the report
+    sys.stdout = open(os.devnull, "w")
+
+
+def _timed(process, raw, item):
+    start = time.process_time()
+    value = process(raw, item)
+    return value, time.process_time() - start
+
+
+def _error(e):
+    return str(e) or type(e).__name__
+
+
+def run_pipeline(
+    items,
+    fetch,
+    process,
+    fetch_workers=8,
+    cpu_workers=None,
+    queue_size=None,
+):
+    """Yield a StageResult per item as soon as its CPU stage is done.
+
+    fetch(item) -> raw body (runs on a thread; None counts as failed).
+    process(raw, item) -> value (runs in a worker process, so it and its
+        result must be picklable: a module-level function).
+    queue_size: fetched responses allowed to wait for a CPU worker
+        (default twice the number of CPU workers).
+    """
+    cpu_workers = cpu_workers or os.cpu_count() or 1
+    waiting = threading.BoundedSemaphore(queue_size or 2 * cpu_workers)
+    results = Queue()
+    broken = threading.Event()  # skip the remaining fetches once a worker died
+
+    with ProcessPoolExecutor(
+        max_workers=cpu_workers, initializer=_quiet_worker
+    ) as cpu, ThreadPoolExecutor(max_workers=fetch_workers) as io:
+
+        def fetch_one(item):
+            if broken.is_set():
+                results.put(StageResult(item, None, "process pool broken", 0.0, 0.0))
+                return
+            start = time.perf_counter()
+            try:
+                raw = fetch(item)
+            except Exception as e:
+                raw, error = None, str(e)
+            else:
+                error = None if raw is not None else "fetch failed"
+            fetch_seconds = time.perf_counter() - start
+            if raw is None:
+                results.put(StageResult(item, None, error, fetch_seconds, 0.0))
+                return
+
+            waiting.acquire()  # backpressure: wait for room in the CPU queue
+            try:
+                future = cpu.submit(_timed, process, raw, item)
+            except Exception as e:
+                # a worker died earlier: the pool takes no more work
+                waiting.release()
+                broken.set()
+                results.put(StageResult(item, None, _error(e), fetch_seconds, 0.0))
+                return
+
+            def done(future):
+                waiting.release()
+                try:
+                    value, cpu_seconds = future.result()
+                    results.put(
+                        StageResult(item, value, None, fetch_seconds, cpu_seconds)
+                    )
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        broken.set()
+                    results.put(StageResult(item, None, _error(e), fetch_seconds, 0.0))
+
+            future.add_done_callback(done)
+
+        count = 0
+        for item in items:
+            io.submit(fetch_one, item)
+            count += 1
+        for _ in range(count):
+            yield results.get()
+
+
+def summarize(results, wall_seconds):
+    ok = [r for r in results if r.error is None]
+    return {
+        "items": len(results),
+        "failed": len(results) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "items_per_s": round(len(ok) / wall_seconds, 2) if wall_seconds else None,
+        "fetch_seconds": round(sum(r.fetch_seconds for r in results), 3),
+        "cpu_seconds": round(sum(r.cpu_seconds for r in results), 3),
+    }
+
+
+# ---- trains: fetch the JSF search, parse_tickets in a worker ----
+
+_parsers = {}
+
+
+def parse_ticket_response(raw, query, parser="auto"):
+    """CPU stage: Ticket records from one raw search response"""
+    from simple_ticket_scraper import SimpleTicketScraper
+
+    scraper = _parsers.get(parser)
+    if scraper is None:
+        scraper = _parsers[parser] = SimpleTicketScraper(parser=parser)
+    return scraper.parse_tickets(raw)
+
+
+def train_pipeline(scraper, queries, **options):
+    """StageResult per TicketQuery; value is the Ticket list"""
+    return run_pipeline(
+        queries,
+        lambda query: scraper.fetch_response(*query),
+        parse_ticket_response,
+        **options,
+    )
+
+
+# ---- flights: fetch SerpApi JSON, parse + render HTML in a worker ----
+
+FlightJob = namedtuple("FlightJob", "query params out_dir renderer cache_dir")
+
+
+def render_flight_response(fetched, job):
+    """CPU stage: save the raw JSON and render its HTML page.
+
+    Returns (html path, flights, cheapest price).
+    """
+    import convert
+    from index import FLIGHT_CATEGORIES, build_html, parse_flights
+    from records import from_cents
+    from serpapi_cache import SerpApiCache
+
+    raw, cached = fetched
+    data = json.loads(raw)
+    if "error" in data:
+        raise RuntimeError(data["error"])
+    if job.cache_dir and not cached:
+        SerpApiCache(job.cache_dir).put(job.params, data)
+
+    query = job.query
+    name = "-".join(
+        (query.origin, query.destination, query.outbound_date, query.return_date)
+    )
+    json_path = os.path.join(job.out_dir, f"{name}.json")
+    html_path = os.path.join(job.out_dir, f"{name}.html")
+    with open(json_path, "wb") as f:
+        f.write(raw)
+    if job.renderer == "convert":
+        convert.generate_html(json_path, html_path, stream=True)
+    else:
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(build_html(data, query.destination))
+
+    prices = [
+        f.price_cents
+        for flights in parse_flights(data).values()
+        for f in flights
+        if f.price_cents is not None
+    ]
+    count = sum(len(data.get(key) or []) for key in FLIGHT_CATEGORIES)
+    return html_path, count, from_cents(min(prices, default=None))
+
+
+def flight_pipeline(queries, out_dir, renderer="index", cache=None, **options):
+    """StageResult per flight_batch.FlightQuery; item is a FlightJob and
+    value (html path, flights, cheapest price).
+
+    renderer: "index" (index.build_html cards) or "convert"
+    (convert.generate_html list).
+    """
+    from index import flight_params, serpapi_get_raw
+
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [
+        FlightJob(
+            query,
+            flight_params(
+                query.origin,
+                query.destination,
+                query.adults,
+                query.outbound_date,
+                query.return_date,
+            ),
+            out_dir,
+            renderer,
+            cache.directory if cache is not None else None,
+        )
+        for query in queries
+    ]
+
+    def fetch(job):
+        raw = cache.get_raw(job.params) if cache is not None else None
+        if raw is not None:
+            return raw, True
+        return serpapi_get_raw(job.params), False
+
+    return run_pipeline(jobs, fetch, render_flight_response, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelined batch searches")
+    parser.add_argument("target", choices=["trains", "flights"])
+    parser.add_argument("--fetch-workers", type=int, default=8)
+    parser.add_argument("--cpu-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--queue-size", type=int)
+    parser.add_argument("--days", type=int, default=7)
+    # trains
+    parser.add_argument("--start", help="first travel date, dd/mm/yyyy")
+    parser.add_argument("--parser", default="auto", choices=["auto", "lxml", "soup"])
+    # flights
+    parser.add_argument("--origins", nargs="+", default=["CMN", "AMS", "BRU"])
+    parser.add_argument("--destinations", nargs="+", default=["MED", "JED"])
+    parser.add_argument("--outbound", default="2025-09-10")
+    parser.add_argument("--stays", type=int, nargs="+", default=[10])
+    parser.add_argument("--adults", type=int, default=2)
+    parser.add_argument("--out-dir", default="pipeline_out")
+    parser.add_argument("--renderer", default="index", choices=["index", "convert"])
+    parser.add_argument("--cache-dir", default=".serpapi_cache")
+    args = parser.parse_args()
+
+    options = {
+        "fetch_workers": args.fetch_workers,
+        "cpu_workers": args.cpu_workers,
+        "queue_size": args.queue_size,
+    }
+    started = time.perf_counter()
+    results = []
+    if args.target == "trains":
+        from scraper_http import HttpEngine
+        from simple_ticket_scraper import (
+            STATIONS,
+            SimpleTicketScraper,
+            season_queries,
+        )
+
+        start = (
+            datetime.strptime(args.start, "%d/%m/%Y").date()
+            if args.start
+            else datetime.now().date()
+        )
+        scraper = SimpleTicketScraper(
+            http=HttpEngine(max_connections_per_host=args.fetch_workers),
+            parser=args.parser,
+        )
+        queries = season_queries(start, args.days, adults=args.adults)
+        out = sys.stdout
+        # fetch threads print per-request progress; keep it off the report
+        with contextlib.redirect_stdout(sys.stderr):
+            for result in train_pipeline(scraper, queries, **options):
+                results.append(result)
+                q = result.item
+                route = f"{STATIONS[q.from_station]}->{STATIONS[q.to_station]}"
+                status = result.error or f"{len(result.value)} trains"
+                print(f"{route} {q.travel_date}: {status}", file=out, flush=True)
+    else:
+        from flight_batch import date_pairs, query_grid
+        from serpapi_cache import SerpApiCache
+
+        queries = query_grid(
+            args.origins,
+            args.destinations,
+            date_pairs(args.outbound, args.days, args.stays),
+            args.adults,
+        )
+        cache = SerpApiCache(args.cache_dir)
+        for result in flight_pipeline(
+            queries, args.out_dir, args.renderer, cache, **options
+        ):
+            results.append(result)
+            q = result.item.query
+            if result.error:
+                status = result.error
+            else:
+                path, count, price = result.value
+                status = f"{count} vluchten, vanaf €{price} -> {path}"
+            print(
+                f"{q.origin}->{q.destination} {q.outbound_date}/{q.return_date}: {status}"
+            )
+
+    print(json.dumps(summarize(results, time.perf_counter() - started), indent=2))
+
+
+if __name__ == "__main__":
+    main()
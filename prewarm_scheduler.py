@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""Background pre-warming of train availability.
+
+Keeps every station pair fresh for the next ``days`` travel dates by
+refreshing them into the TicketCache (and optionally one JSON file per
+route/date, with the same ticket records as available_tickets.json;
+/api/trains does not read these files, it asks scraper_daemon.py or falls
+back to its bundled data).
+
+- Near-term dates and popular routes are refreshed more often and go first
+  when several refreshes are due at once.
+- All upstream searches share one global rate budget (``rate`` searches per
+  second) and at most ``workers`` run at once.
+- ``metrics()`` reports queue depth, per (route, date) lag and throughput.
+
+    python prewarm_scheduler.py --days 30 --rate 0.5 --export-dir train_data
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import permutations
+
+from simple_ticket_scraper import STATIONS, SimpleTicketScraper, TicketQuery
+from ticket_cache import TicketCache
+
+# Relative weight of routes our packages use most
+POPULAR_ROUTES = {
+    ("5", "1"): 3,  # Madinah -> Makkah
+    ("1", "5"): 3,
+    ("3", "5"): 2,  # Airport - Jeddah -> Madinah
+    ("3", "1"): 2,
+    ("1", "3"): 2,
+    ("5", "3"): 2,
+}
+
+# (max days out, refresh interval in seconds)
+REFRESH_INTERVALS = (
+    (2, 15 * 60),
+    (7, 60 * 60),
+    (30, 6 * 60 * 60),
+)
+DEFAULT_INTERVAL = 24 * 60 * 60
+# entries stay fresh a quarter interval past their next refresh, for dispatch lag
+TTL_SLACK = 1.25
+
+
+def refresh_interval(days_out, weight=1):
+    for max_days, interval in REFRESH_INTERVALS:
+        if days_out <= max_days:
+            return interval / weight
+    return DEFAULT_INTERVAL / weight
+
+
+def travel_day(query):
+    return datetime.strptime(query.travel_date, "%d/%m/%Y").date()
+
+
+class PrewarmScheduler:
+    def __init__(
+        self,
+        scraper=None,
+        cache=None,
+        days=30,
+        pairs=None,
+        popular=POPULAR_ROUTES,
+        rate=0.5,
+        workers=4,
+        adults=2,
+        export_dir=None,
+    ):
+        self.scraper = scraper or SimpleTicketScraper(fast_path=True)
+        self.cache = cache or TicketCache()
+        self.days = days
+        self.pairs = pairs or list(permutations(STATIONS, 2))
+        self.popular = popular
+        self.rate = rate
+        self.workers = workers
+        self.adults = adults
+        self.export_dir = export_dir
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._seq = itertools.count()
+        self._waiting = []  # (due_at, seq, query)
+        self._ready = []  # (-priority, due_at, seq, query)
+        self._scheduled = set()
+        self._running = 0
+        self._next_slot = time.monotonic()
+
+        self.lag = {}  # query -> seconds between due and dispatch
+        self.last_refresh = {}  # query -> wall time of last completed refresh
+        self.failures = 0
+        self._completed = deque()  # monotonic completion times, last 5 minutes
+
+    def priority(self, query, today=None):
+        days_out = (travel_day(query) - (today or date.today())).days
+        weight = self.popular.get((query.from_station, query.to_station), 1)
+        return weight / (1 + max(days_out, 0))
+
+    def _schedule_horizon(self):
+        """Make sure every (pair, date) in the window is queued"""
+        today = date.today()
+        now = time.monotonic()
+        with self._lock:
+            for i in range(self.days):
+                travel_date = (today + timedelta(days=i)).strftime("%d/%m/%Y")
+                for from_station, to_station in self.pairs:
+                    query = TicketQuery(
+                        from_station, to_station, travel_date, self.adults
+                    )
+                    if query not in self._scheduled:
+                        self._scheduled.add(query)
+                        heapq.heappush(self._waiting, (now, next(self._seq), query))
+
+    def _promote_due(self, now):
+        today = date.today()
+        with self._lock:
+            while self._waiting and self._waiting[0][0] <= now:
+                due_at, seq, query = heapq.heappop(self._waiting)
+                if travel_day(query) < today:
+                    # date has passed; drop it for good
+                    self._scheduled.discard(query)
+                    self.lag.pop(query, None)
+                    self.last_refresh.pop(query, None)
+                    continue
+                heapq.heappush(
+                    self._ready, (-self.priority(query, today), due_at, seq, query)
+                )
+
+    def _next_wakeup(self, now):
+        with self._lock:
+            if self._ready and self._running < self.workers:
+                return max(self._next_slot - now, 0)
+            if self._waiting:
+                return min(max(self._waiting[0][0] - now, 0), 1.0)
+        return 1.0
+
+    def run_forever(self):
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        last_horizon = None
+        try:
+            while not self._stop.is_set():
+                if last_horizon != date.today():
+                    self._schedule_horizon()
+                    last_horizon = date.today()
+
+                now = time.monotonic()
+                self._promote_due(now)
+                with self._lock:
+                    dispatch = (
+                        self._ready
+                        and self._running < self.workers
+                        and now >= self._next_slot
+                    )
+                    if dispatch:
+                        _, due_at, _, query = heapq.heappop(self._ready)
+                        self._running += 1
+                        # global rate budget
+                        self._next_slot = max(self._next_slot, now) + 1 / self.rate
+                        self.lag[query] = now - due_at
+                if dispatch:
+                    executor.submit(self._refresh, query)
+                else:
+                    self._wake.wait(self._next_wakeup(now))
+                    self._wake.clear()
+        finally:
+            executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _refresh(self, query):
+        days_out = (travel_day(query) - date.today()).days
+        weight = self.popular.get((query.from_station, query.to_station), 1)
+        interval = refresh_interval(days_out, weight)
+        try:
+            tickets = self.scraper.get_tickets(*query, debug_file=None)
+            if tickets:
+                # fresh until the next refresh is due, not just the cache's ttl
+                ttl = max(self.cache.ttl, interval * TTL_SLACK)
+                self.cache.put(query, tickets, ttl=ttl)
+                if self.export_dir:
+                    self._export(query, tickets)
+            else:
+                with self._lock:
+                    self.failures += 1
+        except Exception as e:
+            print(f"Refresh {query} failed: {e}")
+            with self._lock:
+                self.failures += 1
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                self._running -= 1
+                self.last_refresh[query] = time.time()
+                self._completed.append(now)
+                heapq.heappush(
+                    self._waiting,
+                    (now + interval, next(self._seq), query),
+                )
+            self._wake.set()
+
+    def _export(self, query, tickets):
+        """One JSON file per route/date, written atomically"""
+        os.makedirs(self.export_dir, exist_ok=True)
+        name = f"{query.from_station}-{query.to_station}-{travel_day(query).isoformat()}.json"
+        path = os.path.join(self.export_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump([t.to_dict() for t in tickets], f, indent=2, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._completed and now - self._completed[0] > 300:
+                self._completed.popleft()
+            overdue = [now - due_at for _, due_at, _, _ in self._ready]
+            return {
+                "queue_depth": len(self._ready),
+                "scheduled": len(self._scheduled),
+                "running": self._running,
+                "max_overdue_seconds": max(overdue, default=0.0),
+                "refreshes_per_minute": len(self._completed) / 5,
+                "failures": self.failures,
+                "lag_seconds": {
+                    f"{q.from_station}-{q.to_station} {q.travel_date}": round(lag, 1)
+                    for q, lag in self.lag.items()
+                },
+                "cache": self.cache.stats(),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep train availability warm")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rate", type=float, default=0.5, help="searches per second")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--db", default="ticket_cache.sqlite3")
+    parser.add_argument("--export-dir")
+    parser.add_argument("--metrics-file", help="JSON metrics, rewritten every 30s")
+    args = parser.parse_args()
+
+    scheduler = PrewarmScheduler(
+        cache=TicketCache(args.db),
+        days=args.days,
+        rate=args.rate,
+        workers=args.workers,
+        export_dir=args.export_dir,
+    )
+    thread = threading.Thread(target=scheduler.run_forever, daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            time.sleep(30)
+            metrics = scheduler.metrics()
+            print(
+                f"queue={metrics['queue_depth']} running={metrics['running']} "
+                f"refreshes/min={metrics['refreshes_per_minute']:.1f} "
+                f"max_overdue={metrics['max_overdue_seconds']:.0f}s"
+            )
+            if args.metrics_file:
+                with open(args.metrics_file, "w", encoding="utf-8") as f:
+                    json.dump(metrics, f, indent=2)
+    except KeyboardInterrupt:
+        scheduler.stop()
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
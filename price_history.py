@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""Price history for scraped flights.
+
+Every observed price is a point (series, ts, price_cents). A series is
+(source, scope, product): scope is the search (route + dates + party, as in
+change_feed.py) and product one flight in it; product "*" tracks the
+cheapest offer of the whole scope per observation. Train results carry no
+fares (the search page lists departures only), so only flights are recorded.
+
+On disk, under ``price_history/``:
+
+    blocks.bin     append-only log of zlib-compressed blocks; each block has
+                   a header (magic, length, crc32, first/last ts) so readers
+                   can skip blocks by time without decompressing them
+    rollups.jsonl  hourly and daily min/max/sum/count and the last observed
+                   point per series, plus the log offset they cover: a
+                   snapshot line followed by one delta line per flush
+
+New points sit in an in-memory buffer until ``flush()`` (automatic every
+``block_size`` points and on close) writes them as one block and appends
+their rollup delta, so a flush costs the size of the block, not of the
+history. Every ``compact_every`` flushes the rollups are rewritten as one
+snapshot; hourly buckets older than ``hourly_retention`` are dropped then
+(daily buckets are kept). Points from the last ``recent_window`` seconds are
+also kept in memory for ``recent()``. Trend queries (``history()``,
+``hint()``) read only the rollups and the buffer, never the raw log. On
+open, torn writes at the end of either file are cut off, and blocks the
+rollups haven't seen yet are replayed.
+
+    python price_history.py history flights "CMN|MED|2025-09-10|2025-09-20|2"
+    python price_history.py hint flights "CMN|MED|2025-09-10|2025-09-20|2"
+"""
+
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+
+from change_feed import flight_records, flight_scope
+from records import from_cents, to_cents
+
+HISTORY_DIR = "price_history"
+BLOCK_MAGIC = b"PHB1"
+BLOCK_HEADER = struct.Struct("<4sIIdd")  # magic, length, crc32, first ts, last ts
+RESOLUTIONS = {"hourly": 3600, "daily": 86400}
+ROLLUP_LOG = "rollups.jsonl"
+CHEAPEST = "*"
+SEP = "\t"
+
+
+def series_id(source, scope, product):
+    return SEP.join((source, scope, product))
+
+
+def encode_block(points):
+    """points: [(series, ts, price_cents)] -> header + compressed payload"""
+    series = sorted({p[0] for p in points})
+    index = {name: i for i, name in enumerate(series)}
+    payload = zlib.compress(
+        json.dumps(
+            {
+                "series": series,
+                "points": [[index[s], round(ts, 3), price] for s, ts, price in points],
+            },
+            separators=(",", ":"),
+        ).encode("utf-8"),
+        6,
+    )
+    header = BLOCK_HEADER.pack(
+        BLOCK_MAGIC,
+        len(payload),
+        zlib.crc32(payload),
+        min(p[1] for p in points),
+        max(p[1] for p in points),
+    )
+    return header + payload
+
+
+def decode_block(payload):
+    block = json.loads(zlib.decompress(payload))
+    series = block["series"]
+    return [(series[i], ts, price) for i, ts, price in block["points"]]
+
+
+def iter_blocks(f, offset=0):
+    """(offset, end, first_ts, last_ts, payload-reader) per intact block"""
+    f.seek(offset)
+    while True:
+        header = f.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return
+        magic, length, crc, first, last = BLOCK_HEADER.unpack(header)
+        if magic != BLOCK_MAGIC:
+            return
+        start = offset + BLOCK_HEADER.size
+        end = start + length
+
+        def read(start=start, length=length, crc=crc):
+            f.seek(start)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return None
+            return payload
+
+        yield offset, end, first, last, read
+        offset = end
+        f.seek(offset)
+
+
+def bucket_start(ts, seconds):
+    return int(ts // seconds * seconds)
+
+
+def empty_rollups():
+    return {"offset": 0, "latest": {}, **{name: {} for name in RESOLUTIONS}}
+
+
+def note_latest(latest, points):
+    for series, ts, price in points:
+        seen = latest.get(series)
+        if seen is None or ts >= seen[0]:
+            latest[series] = [ts, price]
+
+
+def fold(rollups, points):
+    """Add points to a rollups dict (the whole state or one delta)"""
+    note_latest(rollups["latest"], points)
+    for name, seconds in RESOLUTIONS.items():
+        table = rollups[name]
+        for series, ts, price in points:
+            buckets = table.setdefault(series, {})
+            key = str(bucket_start(ts, seconds))
+            entry = buckets.get(key)
+            if entry is None:
+                buckets[key] = [price, price, price, 1]
+            else:
+                entry[0] = min(entry[0], price)
+                entry[1] = max(entry[1], price)
+                entry[2] += price
+                entry[3] += 1
+    return rollups
+
+
+def merge(rollups, delta):
+    """Fold a delta written by fold() into the rollups"""
+    for name in RESOLUTIONS:
+        table = rollups[name]
+        for series, buckets in delta[name].items():
+            into = table.setdefault(series, {})
+            for key, (low, high, total, n) in buckets.items():
+                entry = into.get(key)
+                if entry is None:
+                    into[key] = [low, high, total, n]
+                else:
+                    entry[0] = min(entry[0], low)
+                    entry[1] = max(entry[1], high)
+                    entry[2] += total
+                    entry[3] += n
+    latest = rollups["latest"]
+    for series, (ts, price) in delta["latest"].items():
+        seen = latest.get(series)
+        if seen is None or ts >= seen[0]:
+            latest[series] = [ts, price]
+
+
+class PriceHistory:
+    def __init__(
+        self,
+        directory=HISTORY_DIR,
+        block_size=4096,
+        recent_window=2 * 24 * 60 * 60,
+        hourly_retention=30 * 24 * 60 * 60,
+        compact_every=100,
+    ):
+        """
+        block_size: buffered points per compressed block.
+        recent_window: seconds of raw points kept in memory for recent().
+        hourly_retention: seconds of hourly buckets kept; daily ones stay.
+        compact_every: rollup deltas appended before a snapshot rewrite.
+        """
+        self.directory = directory
+        self.block_size = block_size
+        self.recent_window = recent_window
+        self.hourly_retention = hourly_retention
+        self.compact_every = compact_every
+        self.blocks_path = os.path.join(directory, "blocks.bin")
+        self.rollups_path = os.path.join(directory, ROLLUP_LOG)
+        # single-file rollups written by earlier versions
+        self._legacy_path = os.path.join(directory, "rollups.json")
+        self._deltas = 0
+        self.buffer = []
+        self.recent_points = deque()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        self.rollups = empty_rollups()
+        legacy = False
+        rebuild_latest = False
+        if os.path.exists(self.rollups_path):
+            self._load_rollups()
+        elif os.path.exists(self._legacy_path):
+            with open(self._legacy_path, "r", encoding="utf-8") as f:
+                self.rollups = json.load(f)
+            legacy = True
+            # files from before "latest" existed: rebuild it from the whole log
+            rebuild_latest = "latest" not in self.rollups
+            self.rollups.setdefault("latest", {})
+
+        if not os.path.exists(self.blocks_path):
+            open(self.blocks_path, "wb").close()
+        horizon = time.time() - self.recent_window
+        good = 0
+        replayed = False
+        with open(self.blocks_path, "rb") as f:
+            for offset, end, _, last, read in iter_blocks(f):
+                needs_replay = offset >= self.rollups["offset"]
+                if not needs_replay and not rebuild_latest and last < horizon:
+                    good = end
+                    continue
+                payload = read()
+                if payload is None:
+                    break
+                points = decode_block(payload)
+                if needs_replay:
+                    self._roll(points)
+                    replayed = True
+                elif rebuild_latest:
+                    note_latest(self.rollups["latest"], points)
+                self.recent_points.extend(p for p in points if p[1] >= horizon)
+                good = end
+        if os.path.getsize(self.blocks_path) > good:
+            # torn write at the end of the log: drop it so appends stay readable
+            with open(self.blocks_path, "r+b") as f:
+                f.truncate(good)
+        if replayed or legacy or self.rollups["offset"] != good:
+            self.rollups["offset"] = good
+            self._compact()
+            if legacy:
+                os.remove(self._legacy_path)
+        else:
+            self._prune()
+
+    def _roll(self, points):
+        fold(self.rollups, points)
+
+    def _load_rollups(self):
+        good = 0
+        with open(self.rollups_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if "snapshot" in entry:
+                    self.rollups = entry["snapshot"]
+                    self._deltas = 0
+                else:
+                    merge(self.rollups, entry)
+                    self.rollups["offset"] = entry["offset"]
+                    self._deltas += 1
+                good += len(line)
+        if os.path.getsize(self.rollups_path) > good:
+            # torn append: cut it off; blocks past the offset get replayed
+            with open(self.rollups_path, "r+b") as f:
+                f.truncate(good)
+
+    def _append_rollups(self, delta):
+        if self._deltas >= self.compact_every:
+            self._compact()
+            return
+        with open(self.rollups_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(delta, separators=(",", ":")) + "\n")
+        self._deltas += 1
+
+    def _compact(self):
+        """Rewrite the rollups as a single snapshot line"""
+        self._prune()
+        with open(self.rollups_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(json.dumps({"snapshot": self.rollups}, separators=(",", ":")))
+            f.write("\n")
+        os.replace(self.rollups_path + ".tmp", self.rollups_path)
+        self._deltas = 0
+
+    def _prune(self):
+        cutoff = time.time() - self.hourly_retention
+        table = self.rollups["hourly"]
+        for series in list(table):
+            buckets = table[series]
+            for key in [k for k in buckets if int(k) + 3600 <= cutoff]:
+                del buckets[key]
+            if not buckets:
+                del table[series]
+
+    def record(self, source, scope, prices, ts=None):
+        """Record one observation of a scope: product -> price_cents.
+
+        Products without a price are skipped; the cheapest price also goes
+        to the scope's "*" series.
+        """
+        ts = time.time() if ts is None else ts
+        points = [
+            (series_id(source, scope, product), ts, price)
+            for product, price in prices.items()
+            if price is not None
+        ]
+        if not points:
+            return 0
+        cheapest = min(price for _, _, price in points)
+        points.append((series_id(source, scope, CHEAPEST), ts, cheapest))
+        with self._lock:
+            self.buffer.extend(points)
+            self.recent_points.extend(points)
+            horizon = ts - self.recent_window
+            while self.recent_points and self.recent_points[0][1] < horizon:
+                self.recent_points.popleft()
+            if len(self.buffer) >= self.block_size:
+                self._flush()
+        return len(points)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        block = encode_block(self.buffer)
+        with open(self.blocks_path, "ab") as f:
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        delta = fold({"latest": {}, **{name: {} for name in RESOLUTIONS}}, self.buffer)
+        merge(self.rollups, delta)
+        self.rollups["offset"] += len(block)
+        delta["offset"] = self.rollups["offset"]
+        self._append_rollups(delta)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def history(
+        self,
+        source,
+        scope,
+        product=CHEAPEST,
+        resolution="daily",
+        start=None,
+        end=None,
+    ):
+        """[(bucket start ts, min, avg, max, count)] in cents, oldest first,
+        from the rollups plus any unflushed points; hourly buckets only
+        reach back `hourly_retention` seconds"""
+        seconds = RESOLUTIONS[resolution]
+        series = series_id(source, scope, product)
+        with self._lock:
+            buckets = {
+                int(k): list(v)
+                for k, v in self.rollups[resolution].get(series, {}).items()
+            }
+            for name, ts, price in self.buffer:
+                if name != series:
+                    continue
+                entry = buckets.setdefault(
+                    bucket_start(ts, seconds), [price, price, 0, 0]
+                )
+                entry[0] = min(entry[0], price)
+                entry[1] = max(entry[1], price)
+                entry[2] += price
+                entry[3] += 1
+        return [
+            (bucket, low, round(total / n), high, n)
+            for bucket, (low, high, total, n) in sorted(buckets.items())
+            if (start is None or bucket + seconds > start)
+            and (end is None or bucket < end)
+        ]
+
+    def recent(self, source, scope, product=CHEAPEST):
+        """Raw (ts, price_cents) points within the recent window"""
+        series = series_id(source, scope, product)
+        with self._lock:
+            return [
+                (ts, price) for name, ts, price in self.recent_points if name == series
+            ]
+
+    def raw(self, start=None, end=None):
+        """All points between start and end, read from the block log"""
+        points = []
+        with self._lock:
+            self._flush()
+            with open(self.blocks_path, "rb") as f:
+                for _, _, first, last, read in iter_blocks(f):
+                    if (start is not None and last < start) or (
+                        end is not None and first >= end
+                    ):
+                        continue
+                    payload = read()
+                    if payload is None:
+                        break  # damaged block: nothing after it is trusted
+                    points.extend(
+                        point
+                        for point in decode_block(payload)
+                        if (start is None or point[1] >= start)
+                        and (end is None or point[1] < end)
+                    )
+        return points
+
+    def latest(self, source, scope, product=CHEAPEST):
+        """Last observed (ts, price_cents) of a series, or None"""
+        series = series_id(source, scope, product)
+        with self._lock:
+            seen = self.rollups["latest"].get(series)
+            for name, ts, price in self.buffer:
+                if name == series and (seen is None or ts >= seen[0]):
+                    seen = [ts, price]
+        return tuple(seen) if seen is not None else None
+
+    def hint(self, source, scope, product=CHEAPEST, days=30):
+        """Latest price against the last `days` of daily rollups.
+
+        advice is "book" when the latest price is within 5% of the period's
+        low, "wait" when it is above the period's average, else "watch".
+        """
+        last_seen = self.latest(source, scope, product)
+        days_back = self.history(
+            source, scope, product, "daily", start=time.time() - days * 86400
+        )
+        if last_seen is None:
+            return None
+        latest = last_seen[1]
+        low = min(row[1] for row in days_back) if days_back else latest
+        count = sum(row[4] for row in days_back)
+        avg = sum(row[2] * row[4] for row in days_back) / count if count else latest
+        if latest <= low * 1.05:
+            advice = "book"
+        elif latest > avg:
+            advice = "wait"
+        else:
+            advice = "watch"
+        return {
+            "latest": from_cents(latest),
+            "low": from_cents(low),
+            "avg": from_cents(round(avg)),
+            "days": days,
+            "advice": advice,
+        }
+
+
+def record_flights(history, data, ts=None):
+    """Record every priced flight of one SerpApi result"""
+    prices = {
+        key: to_cents(summary["price"]) for key, summary in flight_records(data).items()
+    }
+    return history.record("flights", flight_scope(data), prices, ts)
+
+
+def fmt_bucket(ts, resolution):
+    moment = datetime.fromtimestamp(ts, timezone.utc)
+    return moment.strftime("%Y-%m-%d %H:00" if resolution == "hourly" else "%Y-%m-%d")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price history queries")
+    parser.add_argument("--dir", default=HISTORY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("history", "hint"):
+        command = commands.add_parser(name)
+        command.add_argument("source", choices=["flights"])
+        command.add_argument("scope")
+        command.add_argument("--product", default=CHEAPEST)
+    commands.choices["history"].add_argument(
+        "--resolution", choices=sorted(RESOLUTIONS), default="daily"
+    )
+    commands.choices["hint"].add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    history = PriceHistory(args.dir)
+    if args.command == "hint":
+        print(
+            json.dumps(history.hint(args.source, args.scope, args.product, args.days))
+        )
+        return
+    for bucket, low, avg, high, n in history.history(
+        args.source, args.scope, args.product, args.resolution
+    ):
+        print(
+            f"{fmt_bucket(bucket, args.resolution)}  min €{from_cents(low)}  "
+            f"avg €{from_cents(avg)}  max €{from_cents(high)}  ({n}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Per-host rate limiting, retries and circuit breaking for all scrapers.
+
+Every upstream host (sar.hhr.sa, serpapi.com) gets one shared HostLimiter
+from ``limiter_for(host)``:
+
+- a token bucket caps the request rate,
+- the rate adapts AIMD-style: it creeps up while responses are fast and
+  successful, and is cut multiplicatively on errors, throttling (429) or
+  latency above the host's target, at most once per ``decrease_window``,
+- a circuit breaker fails calls fast after repeated failures and lets a
+  single probe through once ``reset_timeout`` has passed.
+
+``call_with_retry`` wraps one upstream call with the limiter and jittered
+exponential backoff.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit is open"""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go through"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("circuit open")
+                # let exactly one probe through
+                self.state = "half-open"
+                return
+            raise CircuitOpenError("circuit half-open, probe in flight")
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state = "closed"
+                self._failures = 0
+                return
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class HostLimiter:
+    def __init__(
+        self,
+        host,
+        rate=2.0,
+        burst=4,
+        min_rate=0.1,
+        max_rate=10.0,
+        target_latency=2.0,
+        increase=0.1,
+        decrease=0.5,
+        decrease_window=None,
+        failure_threshold=5,
+        reset_timeout=30.0,
+    ):
+        """
+        rate: starting requests per second; adjusted between min_rate and
+            max_rate by `increase` (additive) and `decrease` (multiplicative).
+        target_latency: seconds; slower responses count as congestion.
+        decrease_window: seconds after a cut during which further bad
+            responses don't cut again, so a burst of concurrent failures
+            counts once (default: target_latency).
+        """
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.decrease_window = (
+            target_latency if decrease_window is None else decrease_window
+        )
+        self._last_decrease = None
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.latency = None  # EWMA, seconds
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        self.breaker.check()
+        self.bucket.acquire()
+
+    def record(self, latency, outcome):
+        """outcome: "ok", "error" or "throttled" """
+        with self._lock:
+            self.requests += 1
+            self.latency = (
+                latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            )
+            rate = self.bucket.rate
+            if outcome == "ok" and latency <= self.target_latency:
+                rate += self.increase
+            else:
+                now = time.monotonic()
+                if (
+                    self._last_decrease is None
+                    or now - self._last_decrease >= self.decrease_window
+                ):
+                    rate *= self.decrease
+                    self._last_decrease = now
+                if outcome == "throttled":
+                    self.throttled += 1
+                elif outcome == "error":
+                    self.errors += 1
+            self.bucket.rate = min(self.max_rate, max(self.min_rate, rate))
+        self.breaker.record(outcome == "ok")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "host": self.host,
+                "rate": round(self.bucket.rate, 3),
+                "circuit": self.breaker.state,
+                "requests": self.requests,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "latency": self.latency,
+            }
+
+
+class RetryPolicy:
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=20.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, at least `retry_after`"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return max(backoff, retry_after or 0)
+
+
+HOST_DEFAULTS = {
+    "sar.hhr.sa": {"rate": 2.0, "max_rate": 5.0, "target_latency": 3.0},
+    "serpapi.com": {"rate": 1.0, "max_rate": 5.0, "target_latency": 15.0},
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(host):
+    """The shared HostLimiter for `host`"""
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = HostLimiter(host, **HOST_DEFAULTS.get(host, {}))
+        return limiter
+
+
+def all_stats():
+    with _limiters_lock:
+        return [limiter.stats() for limiter in _limiters.values()]
+
+
+def classify_response(response):
+    """Outcome and Retry-After seconds for a requests.Response"""
+    if response.status_code == 429:
+        return "throttled", parse_retry_after(response.headers.get("Retry-After"))
+    if response.status_code >= 500:
+        return "error", parse_retry_after(response.headers.get("Retry-After"))
+    return "ok", None
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retry(
+    limiter, fn, classify=lambda result: ("ok", None), retry_on=(), policy=None
+):
+    """Call `fn()` through `limiter`, retrying failed attempts.
+
+    classify(result) -> (outcome, retry_after) judges a returned result;
+    exceptions in `retry_on` count as errors. Any other exception (also from
+    classify) is recorded as an error and re-raised at once. After the last
+    attempt a bad result is returned as-is and an exception is re-raised.
+    CircuitOpenError is never retried.
+    """
+    policy = policy or RetryPolicy()
+    for attempt in range(policy.attempts):
+        last = attempt == policy.attempts - 1
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            result = fn()
+        except retry_on:
+            limiter.record(time.monotonic() - start, "error")
+            if last:
+                raise
+            retry_after = None
+        except BaseException:
+            # still record it: a half-open circuit only closes or reopens on record()
+            limiter.record(time.monotonic() - start, "error")
+            raise
+        else:
+            try:
+                outcome, retry_after = classify(result)
+            except BaseException:
+                limiter.record(time.monotonic() - start, "error")
+                raise
+            limiter.record(time.monotonic() - start, outcome)
+            if outcome == "ok" or last:
+                return result
+        time.sleep(policy.delay(attempt, retry_after))
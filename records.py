@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""Compact typed records for scraped trains, flights and hotels.
+
+Times are minutes since midnight, durations are minutes and prices are
+integer cents, so filtering and sorting never touch strings. ``to_dict()``
+turns a record back into the JSON shape the scrapers always produced
+(available_tickets.json, SerpApi results, hotels_mecca_medina.json).
+SerpApi keys a Leg or Flight doesn't model are kept as-is in its ``extra``
+dict, so ``Flight.from_dict(f).to_dict() == f``; likewise a Ticket keeps
+the scraped strings its formatters wouldn't reproduce in ``raw``.
+"""
+
+import json
+import re
+import sys
+from dataclasses import dataclass
+
+DURATION_RE = re.compile(
+    r"(?:(\d+)\s*h(?:ours?|rs?)?)?\s*(?:(\d+)\s*m(?:in(?:utes?|s)?)?)?", re.IGNORECASE
+)
+TIME_RE = re.compile(r"\b\d{1,2}:\d{2}\b")
+DISTANCE_RE = re.compile(r"([\d.]+)\s*(km|m)\b", re.IGNORECASE)
+
+# SerpApi keys with a field of their own; the rest goes to `extra`
+LEG_KEYS = frozenset(
+    (
+        "departure_airport",
+        "arrival_airport",
+        "duration",
+        "airplane",
+        "airline",
+        "travel_class",
+        "flight_number",
+        "legroom",
+        "overnight",
+    )
+)
+# Ticket fields parsed from scraped text; kept in `raw` when lossy
+TICKET_TEXT_KEYS = frozenset(("departure", "arrival", "duration", "stops"))
+FLIGHT_KEYS = frozenset(
+    (
+        "flights",
+        "total_duration",
+        "price",
+        "type",
+        "airline_logo",
+        "layovers",
+        "carbon_emissions",
+        "departure_token",
+    )
+)
+
+
+def parse_hhmm(value):
+    """'08:05' -> 485, None when it isn't a time"""
+    try:
+        hours, minutes = value.strip().split(":")
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return None
+
+
+def find_hhmm(text):
+    """First 'H:MM' in a scraped cell text -> minutes, None when there is none"""
+    match = TIME_RE.search(text or "")
+    return parse_hhmm(match.group()) if match else None
+
+
+def fmt_hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_duration(value):
+    """'1h 48m' / '1h48min' / '01:48' / 108 -> 108, None when unknown"""
+    if isinstance(value, int):
+        return value
+    if not value:
+        return None
+    if ":" in value:
+        return parse_hhmm(value)
+    match = DURATION_RE.fullmatch(value.strip())
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes = match.groups()
+    return int(hours or 0) * 60 + int(minutes or 0)
+
+
+def fmt_duration(minutes):
+    return f"{minutes // 60}h {minutes % 60}m"
+
+
+def parse_distance(value):
+    """'4.7 km' -> 4700 (metres), None when missing"""
+    match = DISTANCE_RE.search(value or "")
+    if not match:
+        return None
+    amount, unit = match.groups()
+    return round(float(amount) * (1000 if unit.lower() == "km" else 1))
+
+
+def to_cents(amount):
+    return None if amount is None else round(amount * 100)
+
+
+def from_cents(cents):
+    """Back to the euros the JSON used (int when whole)"""
+    if cents is None:
+        return None
+    return cents // 100 if cents % 100 == 0 else cents / 100
+
+
+def split_datetime(value):
+    """'2025-09-10 02:40' -> ('2025-09-10', 160)"""
+    day, _, clock = (value or "").partition(" ")
+    return sys.intern(day), parse_hhmm(clock)
+
+
+@dataclass(slots=True)
+class Ticket:
+    departure: int | None = None
+    arrival: int | None = None
+    duration: int | None = None
+    train_number: str | None = None
+    stops: int | None = None  # 0 = non-stop
+    price_cents: int | None = None
+
+    raw: dict | None = None  # scraped strings the formatters don't reproduce
+
+    def to_dict(self):
+        fields = {
+            "departure": None if self.departure is None else fmt_hhmm(self.departure),
+            "arrival": None if self.arrival is None else fmt_hhmm(self.arrival),
+            "duration": None if self.duration is None else fmt_duration(self.duration),
+            "train_number": self.train_number,
+            "stops": (
+                None
+                if self.stops is None
+                else "Non-stop" if self.stops == 0 else f"{self.stops} Stop"
+            ),
+            "price": from_cents(self.price_cents),
+        }
+        raw = self.raw or {}
+        return {
+            key: raw.get(key, value)
+            for key, value in fields.items()
+            if value is not None or key in raw
+        }
+
+    @classmethod
+    def from_dict(cls, ticket):
+        stops = ticket.get("stops")
+        stops_match = re.match(r"\d+", stops or "")
+        parsed = cls(
+            departure=find_hhmm(ticket.get("departure")),
+            arrival=find_hhmm(ticket.get("arrival")),
+            duration=parse_duration(ticket.get("duration")),
+            train_number=ticket.get("train_number"),
+            stops=(
+                0
+                if stops == "Non-stop"
+                else int(stops_match.group()) if stops_match else None
+            ),
+            price_cents=to_cents(ticket.get("price")),
+        )
+        formatted = parsed.to_dict()
+        raw = {
+            key: value
+            for key, value in ticket.items()
+            if key in TICKET_TEXT_KEYS and formatted.get(key) != value
+        }
+        parsed.raw = raw or None
+        return parsed
+
+
+@dataclass(slots=True)
+class Leg:
+    airline: str
+    flight_number: str
+    departure_id: str
+    departure_name: str
+    departure_date: str
+    departure: int | None
+    arrival_id: str
+    arrival_name: str
+    arrival_date: str
+    arrival: int | None
+    duration: int | None
+    airplane: str | None = None
+    travel_class: str | None = None
+    legroom: str | None = None
+    overnight: bool = False
+    extra: dict | None = None
+
+    def to_dict(self):
+        leg = {
+            "departure_airport": {
+                "name": self.departure_name,
+                "id": self.departure_id,
+                "time": _join_datetime(self.departure_date, self.departure),
+            },
+            "arrival_airport": {
+                "name": self.arrival_name,
+                "id": self.arrival_id,
+                "time": _join_datetime(self.arrival_date, self.arrival),
+            },
+            "duration": self.duration,
+            "airplane": self.airplane,
+            "airline": self.airline,
+            "travel_class": self.travel_class,
+            "flight_number": self.flight_number,
+        }
+        if self.legroom is not None:
+            leg["legroom"] = self.legroom
+        if self.overnight:
+            leg["overnight"] = True
+        if self.extra:
+            leg.update(self.extra)
+        return leg
+
+    @classmethod
+    def from_dict(cls, leg):
+        dep = leg.get("departure_airport", {})
+        arr = leg.get("arrival_airport", {})
+        departure_date, departure = split_datetime(dep.get("time"))
+        arrival_date, arrival = split_datetime(arr.get("time"))
+        return cls(
+            airline=sys.intern(leg.get("airline", "")),
+            flight_number=leg.get("flight_number", ""),
+            departure_id=sys.intern(dep.get("id", "")),
+            departure_name=sys.intern(dep.get("name", "")),
+            departure_date=departure_date,
+            departure=departure,
+            arrival_id=sys.intern(arr.get("id", "")),
+            arrival_name=sys.intern(arr.get("name", "")),
+            arrival_date=arrival_date,
+            arrival=arrival,
+            duration=leg.get("duration"),
+            airplane=leg.get("airplane"),
+            travel_class=leg.get("travel_class"),
+            legroom=leg.get("legroom"),
+            overnight=bool(leg.get("overnight")),
+            extra=_extra(leg, LEG_KEYS),
+        )
+
+
+def _extra(obj, known):
+    return {key: value for key, value in obj.items() if key not in known} or None
+
+
+def _join_datetime(day, minutes):
+    return f"{day} {fmt_hhmm(minutes)}" if minutes is not None else day
+
+
+@dataclass(slots=True)
+class Flight:
+    legs: tuple
+    price_cents: int | None
+    total_duration: int | None
+    type: str = ""
+    airline_logo: str = ""
+    layovers: tuple = ()  # (name, id, duration minutes, overnight)
+    carbon_difference_percent: int | None = None
+    departure_token: str | None = None
+    extra: dict | None = None
+
+    @property
+    def flight_numbers(self):
+        return tuple(leg.flight_number for leg in self.legs)
+
+    def to_dict(self):
+        flight = {
+            "flights": [leg.to_dict() for leg in self.legs],
+            "total_duration": self.total_duration,
+            "price": from_cents(self.price_cents),
+            "type": self.type,
+            "airline_logo": self.airline_logo,
+        }
+        if self.layovers:
+            flight["layovers"] = [
+                {"name": name, "id": layover_id, "duration": duration}
+                | ({"overnight": True} if overnight else {})
+                for name, layover_id, duration, overnight in self.layovers
+            ]
+        extra = dict(self.extra or {})
+        carbon = extra.pop("carbon_emissions", {})
+        if self.carbon_difference_percent is not None:
+            carbon = {**carbon, "difference_percent": self.carbon_difference_percent}
+        if carbon:
+            flight["carbon_emissions"] = carbon
+        if self.departure_token is not None:
+            flight["departure_token"] = self.departure_token
+        flight.update(extra)
+        return flight
+
+    @classmethod
+    def from_dict(cls, flight):
+        carbon = flight.get("carbon_emissions") or {}
+        extra = _extra(flight, FLIGHT_KEYS) or {}
+        carbon_rest = _extra(carbon, ("difference_percent",))
+        if carbon_rest:
+            extra["carbon_emissions"] = carbon_rest
+        return cls(
+            legs=tuple(Leg.from_dict(leg) for leg in flight.get("flights") or []),
+            price_cents=to_cents(flight.get("price")),
+            total_duration=flight.get("total_duration"),
+            type=sys.intern(flight.get("type", "")),
+            airline_logo=sys.intern(flight.get("airline_logo", "")),
+            layovers=tuple(
+                (
+                    lay.get("name"),
+                    lay.get("id"),
+                    lay.get("duration"),
+                    bool(lay.get("overnight")),
+                )
+                for lay in flight.get("layovers") or []
+            ),
+            carbon_difference_percent=carbon.get("difference_percent"),
+            departure_token=flight.get("departure_token"),
+            extra=extra or None,
+        )
+
+
+@dataclass(slots=True)
+class Room:
+    room_id: str
+    name: str
+    capacity: int
+    bed_type: str
+    price_per_night_cents: int
+    currency: str
+    amenities: tuple = ()
+    cancellation_policy: str | None = None
+
+    def to_dict(self):
+        return {
+            "room_id": self.room_id,
+            "name": self.name,
+            "capacity": self.capacity,
+            "bed_type": self.bed_type,
+            "price_per_night": from_cents(self.price_per_night_cents),
+            "currency": self.currency,
+            "amenities": list(self.amenities),
+            "cancellation_policy": self.cancellation_policy,
+        }
+
+    @classmethod
+    def from_dict(cls, room):
+        return cls(
+            room_id=room["room_id"],
+            name=sys.intern(room.get("name", "")),
+            capacity=room.get("capacity", 0),
+            bed_type=sys.intern(room.get("bed_type", "")),
+            price_per_night_cents=to_cents(room.get("price_per_night")),
+            currency=sys.intern(room.get("currency", "")),
+            amenities=tuple(sys.intern(a) for a in room.get("amenities", [])),
+            cancellation_policy=room.get("cancellation_policy"),
+        )
+
+
+@dataclass(slots=True)
+class Hotel:
+    hotel_id: str
+    name: str
+    city: str
+    latitude: float
+    longitude: float
+    star_rating: int
+    review_score: float
+    review_count: int
+    price_per_night_cents: int | None
+    price_total_cents: int | None
+    nights: int | None
+    currency: str
+    distance_from_center: int | None  # metres
+    tax_included: bool | None = None
+    rooms: tuple = ()
+    chain: str | None = None
+    address: str | None = None
+    country: str | None = None
+    facilities: tuple = ()
+    photos: tuple = ()
+    policies: dict | None = None
+
+    def to_dict(self):
+        return {
+            "hotel_id": self.hotel_id,
+            "name": self.name,
+            "chain": self.chain,
+            "address": self.address,
+            "city": self.city,
+            "country": self.country,
+            "coordinates": {"latitude": self.latitude, "longitude": self.longitude},
+            "star_rating": self.star_rating,
+            "review_score": self.review_score,
+            "review_count": self.review_count,
+            "price": {
+                "total": from_cents(self.price_total_cents),
+                "per_night": from_cents(self.price_per_night_cents),
+                "currency": self.currency,
+                "nights": self.nights,
+                "tax_included": self.tax_included,
+            },
+            "rooms": [room.to_dict() for room in self.rooms],
+            "photos": list(self.photos),
+            "facilities": list(self.facilities),
+            "distance_from_center": (
+                f"{self.distance_from_center / 1000:g} km"
+                if self.distance_from_center is not None
+                else None
+            ),
+            "policies": self.policies,
+        }
+
+    @classmethod
+    def from_dict(cls, hotel):
+        coordinates = hotel.get("coordinates", {})
+        price = hotel.get("price", {})
+        return cls(
+            hotel_id=hotel["hotel_id"],
+            name=hotel.get("name", ""),
+            city=sys.intern(hotel.get("city", "")),
+            latitude=coordinates.get("latitude"),
+            longitude=coordinates.get("longitude"),
+            star_rating=hotel.get("star_rating", 0),
+            review_score=hotel.get("review_score", 0.0),
+            review_count=hotel.get("review_count", 0),
+            price_per_night_cents=to_cents(price.get("per_night")),
+            price_total_cents=to_cents(price.get("total")),
+            nights=price.get("nights"),
+            currency=sys.intern(price.get("currency", "")),
+            distance_from_center=parse_distance(hotel.get("distance_from_center")),
+            tax_included=price.get("tax_included"),
+            rooms=tuple(Room.from_dict(room) for room in hotel.get("rooms", [])),
+            chain=hotel.get("chain"),
+            address=hotel.get("address"),
+            country=hotel.get("country"),
+            facilities=tuple(sys.intern(f) for f in hotel.get("facilities", [])),
+            photos=tuple(hotel.get("photos", [])),
+            policies=hotel.get("policies"),
+        )
+
+
+def load_hotels(path="hotels_mecca_medina.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [Hotel.from_dict(hotel) for hotel in data.get("hotels", [])]
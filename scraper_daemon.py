@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""Resident scraper process with a small local JSON API.
+
+Starting Python, importing BeautifulSoup and bootstrapping a JSF session
+for every web request is slower than the search itself. The daemon starts
+once and keeps warm state in memory:
+
+- one SimpleTicketScraper (pooled keep-alive connections, warm JSF
+  sessions, learned priming plans) in front of the SQLite TicketCache,
+- the SerpApi response cache for flights,
+- the parsed hotel list and its HotelIndex.
+
+Upstream searches run on `workers` threads. Up to `max_queue` more wait for
+a slot; beyond that, requests are refused at once with 503 + Retry-After
+instead of piling up. Hotel queries are answered in memory.
+
+    GET /trains?from=medina&to=mecca&date=2025-09-26[&return=2025-10-03]
+                [&adults=2&children=0&infants=0]
+    GET /flights?from=CMN&to=MED&outbound=2025-09-10&return=2025-09-20[&adults=2]
+    GET /hotels?city=Mecca[&near=haram&radius=1000&k=10&max_price=300&min_stars=4]
+    GET /health
+    GET /metrics                Prometheus text (stage timers, queue, limiters)
+
+    python scraper_daemon.py --port 8787
+    python scraper_daemon.py --unix /tmp/scraper.sock
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+
+import metrics
+import rate_limit
+from hotel_geo import LANDMARKS, HotelIndex
+from records import load_hotels, to_cents
+from scraper_http import HttpEngine
+from simple_ticket_scraper import STATIONS, SimpleTicketScraper
+from ticket_cache import TicketCache
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "flights-scraper")
+)
+
+from index import FLIGHT_CATEGORIES, fetch_flights, inflight  # noqa: E402
+from serpapi_cache import SerpApiCache  # noqa: E402
+
+STATION_ALIASES = {
+    "mecca": "1",
+    "makkah": "1",
+    "jeddah": "2",
+    "airport": "3",
+    "jeddah-airport": "3",
+    "kaec": "4",
+    "medina": "5",
+    "madinah": "5",
+}
+
+ROUTES = ("/health", "/metrics", "/trains", "/flights", "/hotels")
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Overloaded(Exception):
+    pass
+
+
+def station_id(value):
+    value = (value or "").strip().lower()
+    if value in STATIONS:
+        return value
+    if value in STATION_ALIASES:
+        return STATION_ALIASES[value]
+    raise BadRequest(f"unknown station {value!r}")
+
+
+def form_date(value):
+    """'2025-09-26' or '26/09/2025' -> '26/09/2025' (the booking form's format)"""
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%d/%m/%Y")
+        except (TypeError, ValueError):
+            pass
+    raise BadRequest(f"bad date {value!r}")
+
+
+def int_param(params, name, default, minimum=None):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        raise BadRequest(f"{name} must be at least {minimum}")
+    return value
+
+
+def float_param(params, name, default=None):
+    value = params.get(name)
+    if not value:
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+    if not math.isfinite(number):
+        raise BadRequest(f"{name} must be a number")
+    return number
+
+
+class ScraperDaemon:
+    def __init__(
+        self,
+        workers=8,
+        max_queue=64,
+        timeout=120,
+        ticket_cache="ticket_cache.sqlite3",
+        serpapi_cache=".serpapi_cache",
+        hotels="hotels_mecca_medina.json",
+        priming_file="ticket_priming.json",
+        base_url="https://sar.hhr.sa",
+    ):
+        """
+        workers: upstream searches running at once (and connections per host).
+        max_queue: searches allowed to wait for a worker before 503s.
+        timeout: seconds a search may take once it has started.
+        base_url: railway site root (e.g. a replay server for load tests).
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.scraper = SimpleTicketScraper(
+            http=HttpEngine(max_connections_per_host=workers),
+            fast_path=True,
+            priming_file=priming_file,
+            cache=TicketCache(ticket_cache),
+            base_url=base_url,
+        )
+        self.flight_cache = SerpApiCache(serpapi_cache)
+        self.hotels = load_hotels(hotels) if os.path.exists(hotels) else []
+        self.hotel_index = HotelIndex(self.hotels)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.started = time.time()
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self._slots = None
+
+    async def submit(self, fn):
+        """Run blocking `fn` on a worker thread, queuing for a free slot"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if self.running + self.queued >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise Overloaded()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn)
+
+        def done(_):
+            # a timed-out search keeps its slot until its HTTP calls return
+            self.running -= 1
+            self._slots.release()
+
+        future.add_done_callback(done)
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+    async def trains(self, params):
+        query = (
+            station_id(params.get("from", "medina")),
+            station_id(params.get("to", "mecca")),
+            form_date(params.get("date")),
+        )
+        party = (
+            int_param(params, "adults", 2, minimum=1),
+            int_param(params, "children", 0, minimum=0),
+            int_param(params, "infants", 0, minimum=0),
+        )
+        if params.get("return"):
+            return_date = form_date(params["return"])
+            outbound, inbound = await self.submit(
+                lambda: self.scraper.get_round_trip(
+                    *query, return_date, *party, debug_file=None
+                )
+            )
+            return 200, {
+                "outbound": [t.to_dict() for t in outbound],
+                "return": [t.to_dict() for t in inbound],
+            }
+        tickets = await self.submit(
+            lambda: self.scraper.get_tickets(*query, *party, debug_file=None)
+        )
+        return 200, {"tickets": [t.to_dict() for t in tickets]}
+
+    async def flights(self, params):
+        try:
+            origin, destination = params["from"].upper(), params["to"].upper()
+            outbound, inbound = params["outbound"], params["return"]
+        except KeyError as e:
+            raise BadRequest(f"missing {e.args[0]}")
+        adults = int_param(params, "adults", 2, minimum=1)
+        results = await self.submit(
+            lambda: fetch_flights(
+                origin, destination, adults, outbound, inbound, cache=self.flight_cache
+            )
+        )
+        if "error" in results:
+            return 502, {"error": results["error"]}
+        return 200, {
+            "search_parameters": results.get("search_parameters", {}),
+            **{key: results[key] for key in FLIGHT_CATEGORIES if results.get(key)},
+        }
+
+    async def hotels_query(self, params):
+        city = params.get("city")
+        max_cents = to_cents(float_param(params, "max_price"))
+        min_stars = int_param(params, "min_stars", 0)
+        near = params.get("near")
+        if near and near not in LANDMARKS:
+            raise BadRequest(f"near must be one of {', '.join(LANDMARKS)}")
+        k = int_param(params, "k", 10, minimum=1)
+        radius = float_param(params, "radius")
+        # grid queries are CPU work: keep them off the event loop
+        found = await asyncio.to_thread(
+            self.find_hotels, city, max_cents, min_stars, near, k, radius
+        )
+        return 200, {"hotels": found}
+
+    def find_hotels(self, city, max_cents, min_stars, near, k, radius):
+        if near:
+            hits = self.hotel_index.near_landmark(near, k=k, radius=radius)
+        else:
+            hits = [(None, hotel) for hotel in self.hotels]
+        found = []
+        for distance, hotel in hits:
+            if city and hotel.city.lower() != city.lower():
+                continue
+            if hotel.star_rating < min_stars:
+                continue
+            if max_cents is not None and (
+                hotel.price_per_night_cents is None
+                or hotel.price_per_night_cents > max_cents
+            ):
+                continue
+            found.append(
+                {
+                    **hotel.to_dict(),
+                    "distance_m": round(distance) if distance is not None else None,
+                }
+            )
+        return found
+
+    def health(self):
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "hotels": len(self.hotels),
+            "ticket_cache": self.scraper.cache.stats(),
+            "serpapi_cache_hit_rate": round(self.flight_cache.hit_rate(), 3),
+            "singleflight": self.singleflight_stats(),
+        }
+
+    def singleflight_stats(self):
+        """Coalescing per scraper: `saved` counts upstream calls avoided"""
+        return {"trains": self.scraper.inflight.stats(), "flights": inflight.stats()}
+
+    def metrics_text(self):
+        lines = [
+            f"scraper_daemon_running {self.running}",
+            f"scraper_daemon_queued {self.queued}",
+            f"scraper_daemon_rejected_total {self.rejected}",
+        ]
+        for stats in rate_limit.all_stats():
+            labels = f'{{host="{stats["host"]}"}}'
+            lines.append(f"scraper_limiter_rate{labels} {stats['rate']}")
+            lines.append(f"scraper_limiter_requests_total{labels} {stats['requests']}")
+            lines.append(f"scraper_limiter_errors_total{labels} {stats['errors']}")
+        for scraper, stats in self.singleflight_stats().items():
+            labels = f'{{scraper="{scraper}"}}'
+            lines.append(f"scraper_singleflight_calls_total{labels} {stats['calls']}")
+            lines.append(
+                f"scraper_singleflight_upstream_total{labels} {stats['upstream']}"
+            )
+            lines.append(f"scraper_singleflight_saved_total{labels} {stats['saved']}")
+            lines.append(f"scraper_singleflight_in_flight{labels} {stats['in_flight']}")
+        return metrics.prometheus_text() + "\n".join(lines) + "\n"
+
+    async def route(self, path, params):
+        """(status, JSON body or text)"""
+        if path == "/health":
+            return 200, self.health()
+        if path == "/metrics":
+            return 200, self.metrics_text()
+        if path == "/trains":
+            return await self.trains(params)
+        if path == "/flights":
+            return await self.flights(params)
+        if path == "/hotels":
+            return await self.hotels_query(params)
+        return 404, {"error": f"no route {path}"}
+
+    async def respond(self, path, params):
+        # a fixed label set: client paths would make unbounded metric series
+        label = path if path in ROUTES else "unknown"
+        try:
+            with metrics.span("request", scraper="daemon", path=label):
+                return await self.route(path, params)
+        except BadRequest as e:
+            return 400, {"error": str(e)}
+        except Overloaded:
+            return 503, {"error": "too many queued searches, retry shortly"}
+        except asyncio.TimeoutError:
+            return 504, {"error": f"search took longer than {self.timeout}s"}
+        except Exception as e:
+            print(f"{path} failed: {e!r}")
+            return 500, {"error": str(e)}
+
+    async def handle(self, reader, writer):
+        """HTTP/1.1 with keep-alive; only GET (and HEAD) are served"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                length = int(headers.get("content-length") or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                url = urlsplit(target)
+                if method not in ("GET", "HEAD"):
+                    status, body = 405, {"error": "only GET is supported"}
+                else:
+                    status, body = await self.respond(
+                        url.path, dict(parse_qsl(url.query))
+                    )
+
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and version == "HTTP/1.1"
+                )
+                self._write(writer, status, body, keep_alive, method == "HEAD")
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _write(self, writer, status, body, keep_alive, head_only):
+        if isinstance(body, str):
+            content_type, payload = "text/plain; version=0.0.4", body.encode("utf-8")
+        else:
+            content_type = "application/json"
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(payload)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+        if not head_only:
+            writer.write(payload)
+
+    async def serve(self, host="127.0.0.1", port=8787, unix=None):
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+            where = unix
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            where = f"http://{host}:{port}"
+        print(f"Scraper daemon listening on {where}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.scraper.http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident scraper with a JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--unix", help="listen on this Unix socket instead")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--ticket-cache", default="ticket_cache.sqlite3")
+    parser.add_argument("--serpapi-cache", default=".serpapi_cache")
+    parser.add_argument("--hotels", default="hotels_mecca_medina.json")
+    parser.add_argument("--base-url", default="https://sar.hhr.sa")
+    parser.add_argument(
+        "--quiet", action="store_true", help="drop scraper progress output"
+    )
+    args = parser.parse_args()
+
+    if not metrics.enabled():
+        metrics.enable()
+    daemon = ScraperDaemon(
+        workers=args.workers,
+        max_queue=args.max_queue,
+        timeout=args.timeout,
+        ticket_cache=args.ticket_cache,
+        serpapi_cache=args.serpapi_cache,
+        hotels=args.hotels,
+        base_url=args.base_url,
+    )
+    if args.quiet:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        asyncio.run(daemon.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
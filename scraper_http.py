@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Pooled in-process HTTP engine shared by the scrapers.
+
+One ``HttpEngine`` owns a keep-alive connection pool (per-host connection
+limit, blocking when exhausted). Every search gets its own ``requests.Session``
+from ``engine.session()`` so cookies stay in memory and separate per search,
+while the TCP/TLS connections underneath are reused across all of them.
+Requests made with ``engine.request()`` go through the per-host rate
+limiter and retry policy in rate_limit.py.
+"""
+
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from rate_limit import RetryPolicy, call_with_retry, classify_response, limiter_for
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept-Language": "en-US,en;q=0.5",
+    "Connection": "keep-alive",
+}
+
+
+class HttpEngine:
+    def __init__(
+        self,
+        max_connections_per_host=8,
+        max_hosts=10,
+        timeout=30,
+        verify=False,
+        retry=None,
+    ):
+        """
+        max_connections_per_host: open connections kept per host; extra
+            requests wait for a free connection instead of opening a new one.
+        max_hosts: number of per-host pools kept alive.
+        verify: TLS verification (off by default, like the old ``curl -k``).
+        retry: rate_limit.RetryPolicy for request().
+        """
+        self.timeout = timeout
+        self.verify = verify
+        self.retry = retry or RetryPolicy()
+        self._adapter = HTTPAdapter(
+            pool_connections=max_hosts,
+            pool_maxsize=max_connections_per_host,
+            pool_block=True,
+            max_retries=0,
+        )
+        if not verify:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def session(self):
+        """Return a new session (own cookie jar) on the shared connection pool.
+
+        Don't call ``close()`` on it: that would close the shared pool. Just
+        drop the session when done.
+        """
+        session = requests.Session()
+        session.mount("https://", self._adapter)
+        session.mount("http://", self._adapter)
+        session.headers.update(DEFAULT_HEADERS)
+        session.verify = self.verify
+        return session
+
+    def request(self, session, method, url, **kwargs):
+        """session.request() through the host's shared rate limiter.
+
+        Connection errors, timeouts, 429 and 5xx are retried with backoff;
+        the last response is returned as-is, so callers still
+        raise_for_status().
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return call_with_retry(
+            limiter_for(urlsplit(url).hostname),
+            lambda: session.request(method, url, **kwargs),
+            classify=classify_response,
+            retry_on=(requests.ConnectionError, requests.Timeout),
+            policy=self.retry,
+        )
+
+    def close(self):
+        self._adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,18 +1,340 @@
 #!/usr/bin/env python3
 
-import subprocess
-import tempfile
-import os
+import asyncio
+import html
 import json
+import os
 from bs4 import BeautifulSoup
 import re
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import permutations
+
+import requests
+
+import metrics
+from change_feed import ChangeFeed, summarize
+
+try:
+    from lxml import etree
+except ImportError:  # BeautifulSoup fallback in parse_tickets
+    etree = None
+
+from rate_limit import CircuitOpenError
+from records import Ticket
+from scraper_http import HttpEngine
+from singleflight import SingleFlight
+
+PORTLET = "_ossportlet_WAR_ossliferay_"
+FORM_ID = f"{PORTLET}:formSearchTravel"
+RESULT_TABLE = "tableResult"
+RETURN_TABLE = "tableResultReturn"
+AJAX_PATH = (
+    "/web/booking/home?p_p_id=ossportlet_WAR_ossliferay&p_p_lifecycle=2&p_p_state=normal"
+    "&p_p_mode=view&p_p_cacheability=cacheLevelPage&p_p_col_id=column-2&p_p_col_count=1"
+    f"&{PORTLET}_jsfBridgeAjax=true"
+    f"&{PORTLET}_facesViewIdResource=%2FWEB-INF%2Fviews%2FsearchTravelResult.xhtml"
+)
+
+HOME_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+AJAX_HEADERS = {
+    "Accept": "application/xml, text/xml, */*; q=0.01",
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    "Faces-Request": "partial/ajax",
+    "X-Requested-With": "XMLHttpRequest",
+}
+
+# Station ids used by the booking form
+STATIONS = {
+    "1": "Makkah",
+    "2": "Jeddah",
+    "3": "Airport - Jeddah",
+    "4": "KAEC",
+    "5": "Madinah",
+}
+
+TicketQuery = namedtuple(
+    "TicketQuery",
+    "from_station to_station travel_date adults children infants",
+    defaults=(2, 0, 0),
+)
+
+# tickets is None when the query failed or timed out; error says why
+TicketResult = namedtuple("TicketResult", "query tickets error")
+
+
+def normalize_query(query):
+    """Canonical TicketQuery, so equal searches compare and hash equal"""
+    query = TicketQuery(*query)
+    return TicketQuery(
+        str(query.from_station).strip(),
+        str(query.to_station).strip(),
+        query.travel_date.strip(),
+        int(query.adults),
+        int(query.children),
+        int(query.infants),
+    )
+
+
+def season_queries(start, days, pairs=None, adults=2, children=0, infants=0):
+    """Queries for every station pair on each of `days` dates from `start`"""
+    pairs = pairs or list(permutations(STATIONS, 2))
+    return [
+        TicketQuery(
+            from_station,
+            to_station,
+            (start + timedelta(days=i)).strftime("%d/%m/%Y"),
+            adults,
+            children,
+            infants,
+        )
+        for i in range(days)
+        for from_station, to_station in pairs
+    ]
+
+
+VIEW_STATE_INPUT_RE = re.compile(
+    r"<input[^>]*name=[\"']javax\.faces\.ViewState[\"'][^>]*>", re.IGNORECASE
+)
+VALUE_ATTR_RE = re.compile(r"value=[\"']([^\"']*)[\"']", re.IGNORECASE)
+VIEW_STATE_UPDATE_RE = re.compile(
+    r"<update id=\"[^\"]*javax\.faces\.ViewState[^\"]*\"><!\[CDATA\[(.*?)\]\]></update>",
+    re.DOTALL,
+)
+EXPIRED_MARKERS = ("ViewExpiredException", "<redirect ")
+REJECTED_MARKERS = ("Validation Error", "ui-messages-error", "ui-message-error")
+
+UPDATE_CDATA_RE = re.compile(
+    r"<update id=\"([^\"]*)\"><!\[CDATA\[(.*?)\]\]></update>", re.DOTALL
+)
+TRAIN_NUMBER_RE = re.compile(r"\b\d{5}\b")
+STOPS_RE = re.compile(r"(\d+)\s+stop")
+TIME_RE = re.compile(r"\b\d{1,2}:\d{2}\b")
+
+# Priming calls made before the search POST, cheapest first
+FULL_PRIMING = ("from", "to")
+PRIMING_PLANS = ((), ("from",), FULL_PRIMING)
+
+
+def find_view_state(page):
+    """Pull javax.faces.ViewState out of the home page without a full parse"""
+    match = VIEW_STATE_INPUT_RE.search(page)
+    if match:
+        value = VALUE_ATTR_RE.search(match.group())
+        if value:
+            return html.unescape(value.group(1))
+    # Unusual markup: fall back to a real parser
+    soup = BeautifulSoup(page, "html.parser")
+    view_state_input = soup.find("input", {"name": "javax.faces.ViewState"})
+    return view_state_input.get("value") if view_state_input else None
+
+
+def view_expired(response):
+    """True when any JSF response says the view is gone (priming calls too)"""
+    return any(marker in response for marker in EXPIRED_MARKERS)
+
+
+def session_expired(response):
+    """True when a search response means the JSF view/session is gone"""
+    if view_expired(response):
+        return True
+    # A live view always re-renders the result table
+    return "tableResult" not in response
+
+
+def search_rejected(response):
+    """True when the server refused the search form (e.g. TO not primed)"""
+    return any(marker in response for marker in REJECTED_MARKERS)
+
+
+def extract_result_html(response, table=RESULT_TABLE):
+    """HTML of the <update> carrying the result table.
+
+    JSF partial responses wrap each re-rendered component in a CDATA
+    section, which html.parser skips entirely. Falls back to the whole
+    response when it isn't a partial response. With table=RETURN_TABLE
+    returns the return table's own <update>, or "" when there is none.
+    """
+    updates = UPDATE_CDATA_RE.findall(response)
+    for update_id, content in updates:
+        if update_id.endswith(f":{table}"):
+            return content.replace("]]><![CDATA[", "")
+    if table != RESULT_TABLE:
+        return ""
+    for update_id, content in updates:
+        if RESULT_TABLE in content or update_id.endswith(RESULT_TABLE):
+            return content.replace("]]><![CDATA[", "")
+    if updates:
+        return "".join(content for _, content in updates)
+    return response
+
+
+def split_round_trip(fragment):
+    """(outbound, return) HTML of a fragment holding both result tables.
+
+    The return table follows the outbound one in the form; everything
+    from the tag carrying its id onwards belongs to the return leg.
+    """
+    marker = fragment.find(f'id="{FORM_ID}:{RETURN_TABLE}"')
+    if marker < 0:
+        return fragment, ""
+    start = fragment.rfind("<", 0, marker)
+    return fragment[:start], fragment[start:]
+
+
+def iter_rows_lxml(fragment):
+    """Gridcell texts of each tr[data-ri], in one streaming lxml pass"""
+    parser = etree.HTMLPullParser(events=("end",), tag="tr")
+    parser.feed(fragment)
+    parser.close()
+    for _, row in parser.read_events():
+        if row.get("data-ri") is not None:
+            # same text as BeautifulSoup's get_text(strip=True)
+            yield [
+                "".join(t.strip() for t in cell.itertext())
+                for cell in row.iter("td")
+                if cell.get("role") == "gridcell"
+            ]
+        row.clear()
+
+
+def iter_rows_soup(fragment):
+    """BeautifulSoup fallback for iter_rows_lxml"""
+    soup = BeautifulSoup(fragment, "html.parser")
+    for row in soup.find_all("tr", {"data-ri": True}):
+        yield [
+            cell.get_text(strip=True)
+            for cell in row.find_all("td", {"role": "gridcell"})
+        ]
+
+
+def ticket_from_cells(cells):
+    """Ticket from one result row's cell texts, or None"""
+    if len(cells) < 5:
+        return None
+    ticket = {}
+
+    # Extract departure time (2nd cell)
+    departure_time = cells[1]
+    if departure_time and ":" in departure_time:
+        ticket["departure"] = departure_time
+
+    # Extract arrival time (3rd cell)
+    arrival_time = cells[2]
+    if arrival_time and ":" in arrival_time:
+        ticket["arrival"] = arrival_time
+
+    # Extract duration (4th cell)
+    duration = cells[3]
+    if duration and ("h" in duration or "min" in duration):
+        ticket["duration"] = duration
+
+    # Extract train number and stops (5th cell)
+    train_text = cells[4]
+
+    # Look for train number (usually 5 digits)
+    train_number_match = TRAIN_NUMBER_RE.search(train_text)
+    if train_number_match:
+        ticket["train_number"] = train_number_match.group()
+
+    # Look for stops information
+    train_text_lower = train_text.lower()
+    if "non-stop" in train_text_lower:
+        ticket["stops"] = "Non-stop"
+    elif "stop" in train_text_lower:
+        stops_match = STOPS_RE.search(train_text_lower)
+        if stops_match:
+            ticket["stops"] = f"{stops_match.group(1)} Stop"
+
+    # Only keep rows with meaningful data
+    return Ticket.from_dict(ticket) if len(ticket) >= 3 else None
+
+
+class JsfSession:
+    """A bootstrapped JSF session: cookie jar plus the current ViewState"""
+
+    def __init__(self, session, view_state):
+        self.session = session
+        self.view_state = view_state
+        self.fresh = True
+        self.last_used = time.monotonic()
+
+    def update(self, response):
+        match = VIEW_STATE_UPDATE_RE.search(response)
+        if match:
+            self.view_state = match.group(1)
+        self.last_used = time.monotonic()
+
+
+class JsfSessionPool:
+    """Idle JsfSessions waiting to be reused.
+
+    A search takes one session exclusively and gives it back when done, so
+    there are at most as many sessions as concurrent searches. Sessions idle
+    for longer than `max_idle` seconds are dropped rather than risking a
+    server-side timeout.
+    """
+
+    def __init__(self, max_idle=15 * 60):
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Most recently used live session, or None if a new one is needed"""
+        now = time.monotonic()
+        with self._lock:
+            self._idle = [s for s in self._idle if now - s.last_used < self.max_idle]
+            return self._idle.pop() if self._idle else None
+
+    def release(self, jsf):
+        with self._lock:
+            self._idle.append(jsf)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
 
 
 class SimpleTicketScraper:
-    def __init__(self):
-        self.base_url = "https://sar.hhr.sa"
+    def __init__(
+        self,
+        http=None,
+        session_max_idle=15 * 60,
+        fast_path=False,
+        priming_file=None,
+        parser="auto",
+        cache=None,
+        base_url="https://sar.hhr.sa",
+    ):
+        """
+        fast_path: skip the FROM/TO priming calls a station pair turns out
+            not to need (learned per pair, see _search).
+        priming_file: optional JSON file to remember learned plans across runs.
+        parser: "lxml", "soup" or "auto" (lxml when installed).
+        cache: optional ticket_cache.TicketCache in front of get_tickets.
+        base_url: site root; point it at a stand-in such as
+            benchmarks/replay_server.py for load tests.
+        """
+        self.base_url = base_url.rstrip("/")
         self.home_url = f"{self.base_url}/web/booking/home"
+        self.ajax_url = f"{self.base_url}{AJAX_PATH}"
+        self.http = http or HttpEngine()
+        self.sessions = JsfSessionPool(max_idle=session_max_idle)
+        self.fast_path = fast_path
+        self.priming_file = priming_file
+        self.priming = self._load_priming()
+        self._priming_lock = threading.Lock()
+        self.parser = parser
+        self.cache = cache
+        self.inflight = SingleFlight()
 
     def get_tickets(
         self,
@@ -22,245 +344,462 @@ class SimpleTicketScraper:
         adults=2,
         children=0,
         infants=0,
+        debug_file="ticket_search_response.html",
     ):
         """Get available train tickets"""
-
-        # Create a temporary cookie jar
-        cookie_file = tempfile.NamedTemporaryFile(
-            mode="w+", delete=False, suffix=".txt"
+        query = normalize_query(
+            TicketQuery(
+                from_station, to_station, travel_date, adults, children, infants
+            )
         )
-        cookie_file.close()
-
-        try:
-            # Step 1: Get the home page and establish session
-            print("1. Loading home page...")
-            home_cmd = [
-                "curl",
-                "-k",
-                "-s",
-                "-L",
-                "-c",
-                cookie_file.name,
-                "-H",
-                "User-Agent: Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "-H",
-                "Accept: text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                "-H",
-                "Accept-Language: en-US,en;q=0.5",
-                "-H",
-                "Connection: keep-alive",
-                "-H",
-                "Upgrade-Insecure-Requests: 1",
-                self.home_url,
-            ]
 
-            home_result = subprocess.run(
-                home_cmd, capture_output=True, text=True, timeout=30
+        # Identical concurrent searches share one upstream fetch
+        def fetch():
+            return self.inflight.do(
+                query, lambda: self._fetch_tickets(*query, debug_file)
             )
 
-            if home_result.returncode != 0:
-                print(f"Failed to get home page: {home_result.stderr}")
-                return []
-
-            # Parse ViewState and form details
-            soup = BeautifulSoup(home_result.stdout, "html.parser")
-            view_state_input = soup.find("input", {"name": "javax.faces.ViewState"})
-
-            if not view_state_input:
-                print("Could not find ViewState")
-                return []
-
-            view_state = view_state_input.get("value")
-            print(f"ViewState: {view_state[:50]}...")
-
-            # Step 2: Set the FROM station first
-            print("2. Setting FROM station...")
-            set_from_cmd = [
-                "curl",
-                "-k",
-                "-s",
-                "-L",
-                "-X",
-                "POST",
-                "-b",
-                cookie_file.name,
-                "-c",
-                cookie_file.name,
-                "-H",
-                "Accept: application/xml, text/xml, */*; q=0.01",
-                "-H",
-                "Content-Type: application/x-www-form-urlencoded; charset=UTF-8",
-                "-H",
-                "Faces-Request: partial/ajax",
-                "-H",
-                "Origin: https://sar.hhr.sa",
-                "-H",
-                "Referer: https://sar.hhr.sa/web/booking/home",
-                "-H",
-                "User-Agent: Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "-H",
-                "X-Requested-With: XMLHttpRequest",
-                "--data",
-                f"javax.faces.partial.ajax=true&javax.faces.source=_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationFrom&javax.faces.partial.execute=_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationFrom&javax.faces.partial.render=_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationTo _ossportlet_WAR_ossliferay_:formSearchTravel:yourSearch _ossportlet_WAR_ossliferay_:formSearchTravel:tableResult _ossportlet_WAR_ossliferay_:formSearchTravel:botoneraSearch&_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationFrom={from_station}&_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationTo=&_ossportlet_WAR_ossliferay_:formSearchTravel:choiceTravel=true&_ossportlet_WAR_ossliferay_:formSearchTravel:selectCalendar=gregorian&_ossportlet_WAR_ossliferay_:formSearchTravel:calendar={travel_date}&_ossportlet_WAR_ossliferay_:formSearchTravel:adults={adults}&_ossportlet_WAR_ossliferay_:formSearchTravel:children={children}&_ossportlet_WAR_ossliferay_:formSearchTravel:infants={infants}&javax.faces.ViewState={view_state}",
-                "https://sar.hhr.sa/web/booking/home?p_p_id=ossportlet_WAR_ossliferay&p_p_lifecycle=2&p_p_state=normal&p_p_mode=view&p_p_cacheability=cacheLevelPage&p_p_col_id=column-2&p_p_col_count=1&_ossportlet_WAR_ossliferay__jsfBridgeAjax=true&_ossportlet_WAR_ossliferay__facesViewIdResource=%2FWEB-INF%2Fviews%2FsearchTravelResult.xhtml",
-            ]
+        if self.cache is None:
+            return fetch()
+        return self.cache.get_or_fetch(query, fetch)
 
-            set_from_result = subprocess.run(
-                set_from_cmd, capture_output=True, text=True, timeout=30
+    def get_round_trip(
+        self,
+        from_station="5",
+        to_station="1",
+        travel_date="20/09/2025",
+        return_date="27/09/2025",
+        adults=2,
+        children=0,
+        infants=0,
+        debug_file="ticket_search_response.html",
+    ):
+        """Outbound and return tickets from one round-trip search.
+
+        Both result tables come back from a single search on one session,
+        instead of two full one-way searches. Returns (outbound, return_);
+        with a cache, both legs are served from and stored under their
+        one-way queries.
+        """
+        outbound = normalize_query(
+            TicketQuery(
+                from_station, to_station, travel_date, adults, children, infants
             )
-            print(f"Set FROM response length: {len(set_from_result.stdout)}")
-
-            # Step 3: Set the TO station
-            print("3. Setting TO station...")
-            set_to_cmd = [
-                "curl",
-                "-k",
-                "-s",
-                "-L",
-                "-X",
-                "POST",
-                "-b",
-                cookie_file.name,
-                "-c",
-                cookie_file.name,
-                "-H",
-                "Accept: application/xml, text/xml, */*; q=0.01",
-                "-H",
-                "Content-Type: application/x-www-form-urlencoded; charset=UTF-8",
-                "-H",
-                "Faces-Request: partial/ajax",
-                "-H",
-                "Origin: https://sar.hhr.sa",
-                "-H",
-                "Referer: https://sar.hhr.sa/web/booking/home",
-                "-H",
-                "User-Agent: Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "-H",
-                "X-Requested-With: XMLHttpRequest",
-                "--data",
-                f"javax.faces.partial.ajax=true&javax.faces.source=_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationTo&javax.faces.partial.execute=_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationTo&javax.faces.partial.render=_ossportlet_WAR_ossliferay_:formSearchTravel:yourSearch _ossportlet_WAR_ossliferay_:formSearchTravel:tableResult _ossportlet_WAR_ossliferay_:formSearchTravel:botoneraSearch&_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationFrom={from_station}&_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationTo={to_station}&_ossportlet_WAR_ossliferay_:formSearchTravel:choiceTravel=true&_ossportlet_WAR_ossliferay_:formSearchTravel:selectCalendar=gregorian&_ossportlet_WAR_ossliferay_:formSearchTravel:calendar={travel_date}&_ossportlet_WAR_ossliferay_:formSearchTravel:adults={adults}&_ossportlet_WAR_ossliferay_:formSearchTravel:children={children}&_ossportlet_WAR_ossliferay_:formSearchTravel:infants={infants}&javax.faces.ViewState={view_state}",
-                "https://sar.hhr.sa/web/booking/home?p_p_id=ossportlet_WAR_ossliferay&p_p_lifecycle=2&p_p_state=normal&p_p_mode=view&p_p_cacheability=cacheLevelPage&p_p_col_id=column-2&p_p_col_count=1&_ossportlet_WAR_ossliferay__jsfBridgeAjax=true&_ossportlet_WAR_ossliferay__facesViewIdResource=%2FWEB-INF%2Fviews%2FsearchTravelResult.xhtml",
-            ]
+        )
+        inbound = outbound._replace(
+            from_station=outbound.to_station,
+            to_station=outbound.from_station,
+            travel_date=return_date.strip(),
+        )
 
-            set_to_result = subprocess.run(
-                set_to_cmd, capture_output=True, text=True, timeout=30
-            )
-            print(f"Set TO response length: {len(set_to_result.stdout)}")
-
-            # Step 4: Perform the search
-            print("4. Searching for trains...")
-            search_cmd = [
-                "curl",
-                "-k",
-                "-s",
-                "-L",
-                "-X",
-                "POST",
-                "-b",
-                cookie_file.name,
-                "-H",
-                "Accept: application/xml, text/xml, */*; q=0.01",
-                "-H",
-                "Content-Type: application/x-www-form-urlencoded; charset=UTF-8",
-                "-H",
-                "Faces-Request: partial/ajax",
-                "-H",
-                "Origin: https://sar.hhr.sa",
-                "-H",
-                "Referer: https://sar.hhr.sa/web/booking/home",
-                "-H",
-                "User-Agent: Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "-H",
-                "X-Requested-With: XMLHttpRequest",
-                "--data",
-                f"javax.faces.partial.ajax=true&javax.faces.source=_ossportlet_WAR_ossliferay_:formSearchTravel:search&javax.faces.partial.execute=@all&javax.faces.partial.render=_ossportlet_WAR_ossliferay_:formSearchTravel _ossportlet_WAR_ossliferay_:dialogPromotionalCode&_ossportlet_WAR_ossliferay_:formSearchTravel:search=_ossportlet_WAR_ossliferay_:formSearchTravel:search&_ossportlet_WAR_ossliferay_:formSearchTravel=_ossportlet_WAR_ossliferay_:formSearchTravel&javax.faces.encodedURL=https://sar.hhr.sa/web/booking/home?p_p_id=ossportlet_WAR_ossliferay&p_p_lifecycle=2&p_p_state=normal&p_p_mode=view&p_p_cacheability=cacheLevelPage&p_p_col_id=column-2&p_p_col_count=1&_ossportlet_WAR_ossliferay__jsfBridgeAjax=true&_ossportlet_WAR_ossliferay__facesViewIdResource=%2FWEB-INF%2Fviews%2FsearchTravelResult.xhtml&_ossportlet_WAR_ossliferay_:formSearchTravel:choiceTravel=true&_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationFrom={from_station}&_ossportlet_WAR_ossliferay_:formSearchTravel:comboStationTo={to_station}&_ossportlet_WAR_ossliferay_:formSearchTravel:selectCalendar=gregorian&_ossportlet_WAR_ossliferay_:formSearchTravel:calendar={travel_date}&_ossportlet_WAR_ossliferay_:formSearchTravel:adults={adults}&_ossportlet_WAR_ossliferay_:formSearchTravel:children={children}&_ossportlet_WAR_ossliferay_:formSearchTravel:infants={infants}&_ossportlet_WAR_ossliferay_:formSearchTravel:selectedTariff=&_ossportlet_WAR_ossliferay_:formSearchTravel:selectedTariffReturn=&javax.faces.ViewState={view_state}",
-                "https://sar.hhr.sa/web/booking/home?p_p_id=ossportlet_WAR_ossliferay&p_p_lifecycle=2&p_p_state=normal&p_p_mode=view&p_p_cacheability=cacheLevelPage&p_p_col_id=column-2&p_p_col_count=1&_ossportlet_WAR_ossliferay__jsfBridgeAjax=true&_ossportlet_WAR_ossliferay__facesViewIdResource=%2FWEB-INF%2Fviews%2FsearchTravelResult.xhtml",
-            ]
+        if self.cache is not None:
+            cached = [self.cache.lookup(*query) for query in (outbound, inbound)]
+            if all(c is not None and c[1] <= c[2] for c in cached):
+                return cached[0][0], cached[1][0]
+
+        legs = self.inflight.do(
+            ("round-trip", outbound, inbound.travel_date),
+            lambda: self._fetch_round_trip(outbound, inbound.travel_date, debug_file),
+        )
+        if self.cache is not None:
+            for query, tickets in zip((outbound, inbound), legs):
+                if tickets:
+                    self.cache.put(query, tickets)
+        return legs
 
-            search_result = subprocess.run(
-                search_cmd, capture_output=True, text=True, timeout=30
+    def fetch_response(
+        self,
+        from_station="5",
+        to_station="1",
+        travel_date="20/09/2025",
+        adults=2,
+        children=0,
+        infants=0,
+    ):
+        """Raw search response for a query, or None on failure.
+
+        No cache, no coalescing and no parsing: for callers that parse
+        elsewhere, like pipeline.py's process pool.
+        """
+        query = normalize_query(
+            TicketQuery(
+                from_station, to_station, travel_date, adults, children, infants
             )
+        )
+        return self._run_search(self._form_fields(*query), None)
 
-            if search_result.returncode == 0:
-                print(f"Search response length: {len(search_result.stdout)}")
+    def _fetch_tickets(
+        self,
+        from_station,
+        to_station,
+        travel_date,
+        adults,
+        children,
+        infants,
+        debug_file,
+    ):
+        """Run the search against the site, bypassing the cache"""
+        form = self._form_fields(
+            from_station, to_station, travel_date, adults, children, infants
+        )
+        search = self._run_search(form, debug_file)
+        if search is None:
+            return []
 
-                # Save response for debugging
-                with open("ticket_search_response.html", "w", encoding="utf-8") as f:
-                    f.write(search_result.stdout)
-                print("Saved search response to ticket_search_response.html")
+        # Parse the results
+        return self.parse_tickets(search)
+
+    def _fetch_round_trip(self, query, return_date, debug_file):
+        form = self._form_fields(*query, return_date=return_date)
+        search = self._run_search(form, debug_file)
+        if search is None:
+            return [], []
+        return self.parse_round_trip(search)
+
+    def _run_search(self, form, debug_file):
+        """Search response for `form` on a warm or new session, or None"""
+        # Reuse a warm session (cookies + ViewState) when one is idle
+        jsf = self.sessions.acquire()
+        if jsf is not None:
+            metrics.count("sessions", scraper="trains", event="reused")
+        for attempt in range(2):
+            if jsf is None:
+                jsf = self._bootstrap()
+                if jsf is None:
+                    return None
+            try:
+                search = self._search(jsf, form)
+            except (requests.RequestException, CircuitOpenError) as e:
+                print(f"Search failed: {e}")
+                return None
+            if session_expired(search):
+                # never hand a dead session back to the pool
+                metrics.count("sessions", scraper="trains", event="expired")
+                if attempt == 1:
+                    print("Session expired again, giving up")
+                    return None
+                print("Session expired, bootstrapping a new one...")
+                jsf = None
+                continue
+            break
+        jsf.fresh = False
+        self.sessions.release(jsf)
+
+        print(f"Search response length: {len(search)}")
+
+        # Save response for debugging
+        if debug_file:
+            with open(debug_file, "w", encoding="utf-8") as f:
+                f.write(search)
+            print(f"Saved search response to {debug_file}")
+        return search
+
+    def _bootstrap(self):
+        """Load the home page and return a new JsfSession, or None"""
+        # Fresh in-memory cookie jar on the shared keep-alive pool
+        session = self.http.session()
+
+        # Step 1: Get the home page and establish session
+        print("1. Loading home page...")
+        metrics.count("sessions", scraper="trains", event="bootstrapped")
+        try:
+            with metrics.span("bootstrap", scraper="trains"):
+                home = self.http.request(
+                    session, "GET", self.home_url, headers=HOME_HEADERS
+                )
+                home.raise_for_status()
+        except (requests.RequestException, CircuitOpenError) as e:
+            print(f"Failed to get home page: {e}")
+            return None
+
+        with metrics.span("view_state", scraper="trains"):
+            view_state = find_view_state(home.text)
+        if not view_state:
+            print("Could not find ViewState")
+            return None
+
+        print(f"ViewState: {view_state[:50]}...")
+        return JsfSession(session, view_state)
+
+    def _search(self, jsf, form):
+        """Steps 2-4 on an established session; returns the search response.
+
+        In fast-path mode the FROM/TO priming calls are only made when the
+        station pair needs them. Unknown pairs start with no priming and
+        escalate until the server accepts the search; the plan that worked is
+        remembered for the pair.
+        """
+        fields = dict(form)
+        pair = (
+            str(fields[f"{FORM_ID}:comboStationFrom"]),
+            str(fields[f"{FORM_ID}:comboStationTo"]),
+        )
+        if not self.fast_path:
+            plans = [FULL_PRIMING]
+        else:
+            known = self.priming.get(pair, PRIMING_PLANS[0])
+            plans = PRIMING_PLANS[PRIMING_PLANS.index(known) :]
+
+        for step, plan in enumerate(plans):
+            search = self._prime(jsf, form, plan)
+            if search is None:
+                search = self._submit_search(jsf, form)
+            if session_expired(search):
+                # the caller re-bootstraps; the plans before this one were
+                # rejected, so the next session can start from here
+                if step:
+                    self._remember_priming(pair, plan)
+                return search
+            if plan == FULL_PRIMING or not search_rejected(search):
+                break
+
+        if self.fast_path:
+            self._remember_priming(pair, plan)
+        return search
+
+    def _prime(self, jsf, form, plan):
+        """Make the priming calls of `plan`; the response if the view expired"""
+        for step, call in (("from", self._set_from), ("to", self._set_to)):
+            if step in plan:
+                response = call(jsf, form)
+                if view_expired(response):
+                    return response
+        return None
+
+    def _remember_priming(self, pair, plan):
+        if self.priming.get(pair) != plan:
+            with self._priming_lock:
+                self.priming[pair] = plan
+                self._save_priming()
+
+    def _set_from(self, jsf, form):
+        # Step 2: Set the FROM station first
+        print("2. Setting FROM station...")
+        set_from = self._post_ajax(
+            jsf,
+            [
+                ("javax.faces.partial.ajax", "true"),
+                ("javax.faces.source", f"{FORM_ID}:comboStationFrom"),
+                ("javax.faces.partial.execute", f"{FORM_ID}:comboStationFrom"),
+                (
+                    "javax.faces.partial.render",
+                    f"{FORM_ID}:comboStationTo {FORM_ID}:yourSearch {FORM_ID}:tableResult {FORM_ID}:botoneraSearch",
+                ),
+                *[(k, "" if k == f"{FORM_ID}:comboStationTo" else v) for k, v in form],
+            ],
+            stage="set_from",
+        )
+        print(f"Set FROM response length: {len(set_from)}")
+        return set_from
+
+    def _set_to(self, jsf, form):
+        # Step 3: Set the TO station
+        print("3. Setting TO station...")
+        set_to = self._post_ajax(
+            jsf,
+            [
+                ("javax.faces.partial.ajax", "true"),
+                ("javax.faces.source", f"{FORM_ID}:comboStationTo"),
+                ("javax.faces.partial.execute", f"{FORM_ID}:comboStationTo"),
+                (
+                    "javax.faces.partial.render",
+                    f"{FORM_ID}:yourSearch {FORM_ID}:tableResult {FORM_ID}:botoneraSearch",
+                ),
+                *form,
+            ],
+            stage="set_to",
+        )
+        print(f"Set TO response length: {len(set_to)}")
+        return set_to
+
+    def _submit_search(self, jsf, form):
+        # Step 4: Perform the search
+        print("4. Searching for trains...")
+        return self._post_ajax(
+            jsf,
+            [
+                ("javax.faces.partial.ajax", "true"),
+                ("javax.faces.source", f"{FORM_ID}:search"),
+                ("javax.faces.partial.execute", "@all"),
+                (
+                    "javax.faces.partial.render",
+                    f"{FORM_ID} {PORTLET}:dialogPromotionalCode",
+                ),
+                (f"{FORM_ID}:search", f"{FORM_ID}:search"),
+                (FORM_ID, FORM_ID),
+                ("javax.faces.encodedURL", self.ajax_url),
+                *form,
+                (f"{FORM_ID}:selectedTariff", ""),
+                (f"{FORM_ID}:selectedTariffReturn", ""),
+            ],
+            stage="search",
+        )
 
-                # Parse the results
-                return self.parse_tickets(search_result.stdout)
-            else:
-                print(f"Search failed: {search_result.stderr}")
-                return []
+    def _load_priming(self):
+        if not self.priming_file or not os.path.exists(self.priming_file):
+            return {}
+        with open(self.priming_file, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        # skip plans from older or hand-edited files; those pairs are relearned
+        return {
+            tuple(pair.split("-")): tuple(plan)
+            for pair, plan in saved.items()
+            if isinstance(plan, list) and tuple(plan) in PRIMING_PLANS
+        }
+
+    def _save_priming(self):
+        if not self.priming_file:
+            return
+        with open(self.priming_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {"-".join(pair): list(plan) for pair, plan in self.priming.items()},
+                f,
+                indent=2,
+            )
 
-        finally:
-            # Clean up cookie file
+    async def get_tickets_many(self, queries, concurrency=8, timeout=120):
+        """Run many searches concurrently, yielding a TicketResult per query
+        as soon as it completes.
+
+        At most `concurrency` searches run at once; each gets `timeout`
+        seconds once it has started. A timed-out search keeps its slot until
+        its HTTP calls return, so the upstream never sees more than
+        `concurrency` sessions. Size the HttpEngine's per-host pool to at
+        least `concurrency`, otherwise searches queue for a connection.
+
+            async for result in scraper.get_tickets_many(queries):
+                ...
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(query):
+            await semaphore.acquire()
+            future = loop.run_in_executor(
+                executor,
+                lambda: self.get_tickets(*TicketQuery(*query), debug_file=None),
+            )
+            future.add_done_callback(lambda _: semaphore.release())
             try:
-                os.unlink(cookie_file.name)
-            except:
-                pass
+                tickets = await asyncio.wait_for(asyncio.shield(future), timeout)
+                return TicketResult(query, tickets, None)
+            except asyncio.TimeoutError:
+                return TicketResult(query, None, f"timed out after {timeout}s")
+            except Exception as e:
+                return TicketResult(query, None, str(e))
+
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        tasks = [asyncio.ensure_future(run(query)) for query in queries]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            # don't block the event loop on searches that timed out
+            executor.shutdown(wait=False)
+
+    def _form_fields(
+        self,
+        from_station,
+        to_station,
+        travel_date,
+        adults,
+        children,
+        infants,
+        return_date=None,
+    ):
+        """Search form values shared by every AJAX step.
+
+        choiceTravel is "true" for one way; a return_date makes it a
+        round trip with the return day in calendarReturn.
+        """
+        fields = [
+            (f"{FORM_ID}:comboStationFrom", from_station),
+            (f"{FORM_ID}:comboStationTo", to_station),
+            (f"{FORM_ID}:choiceTravel", "true" if return_date is None else "false"),
+            (f"{FORM_ID}:selectCalendar", "gregorian"),
+            (f"{FORM_ID}:calendar", travel_date),
+        ]
+        if return_date is not None:
+            fields.append((f"{FORM_ID}:calendarReturn", return_date))
+        return [
+            *fields,
+            (f"{FORM_ID}:adults", adults),
+            (f"{FORM_ID}:children", children),
+            (f"{FORM_ID}:infants", infants),
+        ]
+
+    def _post_ajax(self, jsf, data, stage):
+        """POST one JSF partial/ajax request and return the response body.
+
+        Sends the session's current ViewState and picks up the new one if the
+        server rotated it. `stage` names the metrics span.
+        """
+        with metrics.span(stage, scraper="trains"):
+            response = self.http.request(
+                jsf.session,
+                "POST",
+                self.ajax_url,
+                data=[*data, ("javax.faces.ViewState", jsf.view_state)],
+                headers={
+                    **AJAX_HEADERS,
+                    "Origin": self.base_url,
+                    "Referer": self.home_url,
+                },
+            )
+            response.raise_for_status()
+        jsf.update(response.text)
+        return response.text
 
     def parse_tickets(self, html_content):
-        """Parse the HTML to extract train ticket information"""
+        """Parse the HTML to extract train ticket information.
+
+        Returns Ticket records; use Ticket.to_dict() for the JSON shape.
+        """
+        with metrics.span("parse", scraper="trains"):
+            # Only the result table's <update> matters, not the whole response
+            fragment = extract_result_html(html_content)
+            outbound, _ = split_round_trip(fragment)
+            return self._parse_fragment(outbound)
+
+    def parse_round_trip(self, html_content):
+        """(outbound, return_) Ticket lists from a round-trip search response"""
+        with metrics.span("parse", scraper="trains", trip="round"):
+            outbound, inbound = split_round_trip(extract_result_html(html_content))
+            if not inbound:
+                # return table re-rendered as its own <update>
+                inbound = extract_result_html(html_content, RETURN_TABLE)
+            if not inbound:
+                print("No return table in the response")
+                return self._parse_fragment(outbound), []
+            return self._parse_fragment(outbound), self._parse_fragment(inbound)
+
+    def _parse_fragment(self, fragment):
         try:
-            soup = BeautifulSoup(html_content, "html.parser")
             tickets = []
 
             # Look for train data in various possible structures
             # Method 1: Look for table rows with data-ri attribute
-            train_rows = soup.find_all("tr", {"data-ri": True})
-            print(f"Found {len(train_rows)} train rows with data-ri")
-
-            for row in train_rows:
-                cells = row.find_all("td", {"role": "gridcell"})
-
-                if len(cells) >= 5:
-                    ticket = {}
-
-                    # Extract departure time (2nd cell)
-                    departure_cell = cells[1]
-                    departure_time = departure_cell.get_text(strip=True)
-                    if departure_time and ":" in departure_time:
-                        ticket["departure"] = departure_time
-
-                    # Extract arrival time (3rd cell)
-                    arrival_cell = cells[2]
-                    arrival_time = arrival_cell.get_text(strip=True)
-                    if arrival_time and ":" in arrival_time:
-                        ticket["arrival"] = arrival_time
-
-                    # Extract duration (4th cell)
-                    duration_cell = cells[3]
-                    duration = duration_cell.get_text(strip=True)
-                    if duration and ("h" in duration or "min" in duration):
-                        ticket["duration"] = duration
-
-                    # Extract train number and stops (5th cell)
-                    train_cell = cells[4]
-                    train_text = train_cell.get_text(strip=True)
-
-                    # Look for train number (usually 5 digits)
-                    train_number_match = re.search(r"\b\d{5}\b", train_text)
-                    if train_number_match:
-                        ticket["train_number"] = train_number_match.group()
-
-                    # Look for stops information
-                    if "non-stop" in train_text.lower():
-                        ticket["stops"] = "Non-stop"
-                    elif "stop" in train_text.lower():
-                        stops_match = re.search(r"(\d+)\s+stop", train_text.lower())
-                        if stops_match:
-                            ticket["stops"] = f"{stops_match.group(1)} Stop"
-
-                    # Only add if we have meaningful data
-                    if len(ticket) >= 3:
-                        tickets.append(ticket)
+            if self.parser == "lxml" or (self.parser == "auto" and etree):
+                method, rows = "rows_lxml", iter_rows_lxml(fragment)
+            else:
+                method, rows = "rows_soup", iter_rows_soup(fragment)
+
+            row_count = 0
+            for cells in rows:
+                row_count += 1
+                ticket = ticket_from_cells(cells)
+                # Only add if we have meaningful data
+                if ticket:
+                    tickets.append(ticket)
+            print(f"Found {row_count} train rows with data-ri")
 
             # Method 2: Look for any table with train-like data
             if not tickets:
                 print("Trying alternative parsing method...")
+                method = "table"
+                soup = BeautifulSoup(fragment, "html.parser")
                 tables = soup.find_all("table")
 
                 for table in tables:
@@ -291,18 +830,18 @@ class SimpleTicketScraper:
                                 # Look for train number in any cell
                                 for cell in cells:
                                     text = cell.get_text(strip=True)
-                                    train_match = re.search(r"\b\d{5}\b", text)
+                                    train_match = TRAIN_NUMBER_RE.search(text)
                                     if train_match:
                                         ticket["train_number"] = train_match.group()
                                         break
 
-                                tickets.append(ticket)
+                                tickets.append(Ticket.from_dict(ticket))
 
             # Method 3: Look for any text that looks like train times
             if not tickets:
                 print("Trying text-based parsing...")
-                time_pattern = r"\b\d{1,2}:\d{2}\b"
-                all_times = re.findall(time_pattern, html_content)
+                method = "text"
+                all_times = TIME_RE.findall(fragment)
 
                 if len(all_times) >= 2:
                     # Group times in pairs (departure, arrival)
@@ -313,13 +852,17 @@ class SimpleTicketScraper:
                                 "arrival": all_times[i + 1],
                                 "duration": "Unknown",
                             }
-                            tickets.append(ticket)
+                            tickets.append(Ticket.from_dict(ticket))
 
             print(f"Total tickets found: {len(tickets)}")
+            metrics.count(
+                "parse_method", scraper="trains", method=method if tickets else "none"
+            )
             return tickets
 
         except Exception as e:
             print(f"Error parsing tickets: {e}")
+            metrics.count("parse_method", scraper="trains", method="error")
             return []
 
 
@@ -330,7 +873,7 @@ def main():
     print("Getting available train tickets...")
 
     # Search for trains
-    tickets = scraper.get_tickets(
+    query = TicketQuery(
         from_station="3",  # AIRPORT - JEDDAH
         to_station="5",  # Madinah
         travel_date="26/09/2025",
@@ -338,12 +881,14 @@ def main():
         children=0,
         infants=0,
     )
+    tickets = scraper.get_tickets(*query)
 
     if tickets:
         print(f"\n🎫 Found {len(tickets)} available train tickets:")
         print("=" * 50)
 
         for i, ticket in enumerate(tickets, 1):
+            ticket = ticket.to_dict()
             print(f"\n{i}. Train {ticket.get('train_number', 'N/A')}")
             print(f"   Departure: {ticket.get('departure', 'N/A')}")
             print(f"   Arrival: {ticket.get('arrival', 'N/A')}")
@@ -352,9 +897,18 @@ def main():
 
         # Save to JSON
         with open("available_tickets.json", "w", encoding="utf-8") as f:
-            json.dump(tickets, f, indent=2, ensure_ascii=False)
+            json.dump(
+                [ticket.to_dict() for ticket in tickets],
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
         print(f"\n💾 Results saved to available_tickets.json")
 
+        # Only the differences with the previous run go to the change feed
+        events = ChangeFeed().publish_tickets(tickets, *query)
+        print(f"📰 Change feed: {summarize(events)}")
+
     else:
         print("❌ No train tickets found or error occurred")
         print("Check ticket_search_response.html for debugging info")
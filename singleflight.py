@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Request coalescing for the scrapers.
+
+Concurrent ``SingleFlight.do(key, fn)`` calls with the same key run ``fn``
+once; the other callers block until it finishes and get the same result
+(or exception). Callers share the returned object, so don't mutate it.
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.upstream = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.upstream += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """calls made, upstream calls run and saved by coalescing"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "upstream": self.upstream,
+                "saved": self.calls - self.upstream,
+                "in_flight": len(self._calls),
+            }
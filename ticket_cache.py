@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""On-disk TTL cache for train searches.
+
+Results of ``SimpleTicketScraper.get_tickets`` are stored in SQLite, keyed by
+(from_station, to_station, travel_date, adults, children, infants):
+
+- younger than ``ttl``: served as-is (hit)
+- younger than ``ttl + stale_ttl``: served as-is while a background refresh
+  runs (stale hit, stale-while-revalidate)
+- older or missing: fetched synchronously (miss)
+
+``put(..., ttl=)`` overrides ``ttl`` for one entry, e.g. for a writer that
+refreshes it on its own schedule (prewarm_scheduler.py).
+
+The store keeps at most ``max_entries`` rows, evicting the least recently
+read ones. WAL mode lets other processes read while a worker writes.
+
+    python ticket_cache.py 5 1 26/09/2025      # cached tickets as JSON
+    python ticket_cache.py --stats
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+from records import Ticket
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    key TEXT PRIMARY KEY,
+    tickets TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    ttl REAL
+);
+CREATE INDEX IF NOT EXISTS tickets_accessed_at ON tickets (accessed_at);
+"""
+
+
+def cache_key(from_station, to_station, travel_date, adults=2, children=0, infants=0):
+    return "|".join(
+        str(part)
+        for part in (
+            from_station,
+            to_station,
+            travel_date,
+            int(adults),
+            int(children),
+            int(infants),
+        )
+    )
+
+
+class TicketCache:
+    def __init__(
+        self,
+        path="ticket_cache.sqlite3",
+        ttl=15 * 60,
+        stale_ttl=6 * 60 * 60,
+        max_entries=10_000,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._db().executescript(SCHEMA)
+        columns = [row[1] for row in self._db().execute("PRAGMA table_info(tickets)")]
+        if "ttl" not in columns:  # caches written before per-entry TTLs
+            self._db().execute("ALTER TABLE tickets ADD COLUMN ttl REAL")
+
+    def _db(self):
+        """One connection per thread"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, *query):
+        """(tickets, age in seconds) for a cached query, or None"""
+        found = self.lookup(*query)
+        return found[:2] if found is not None else None
+
+    def lookup(self, *query):
+        """(tickets, age in seconds, the entry's ttl) for a cached query, or None"""
+        key = cache_key(*query)
+        row = (
+            self._db()
+            .execute(
+                "SELECT tickets, fetched_at, ttl FROM tickets WHERE key = ?", (key,)
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        self._db().execute(
+            "UPDATE tickets SET accessed_at = ? WHERE key = ?", (time.time(), key)
+        )
+        tickets, fetched_at, ttl = row
+        tickets = [Ticket.from_dict(t) for t in json.loads(tickets)]
+        return tickets, time.time() - fetched_at, self.ttl if ttl is None else ttl
+
+    def put(self, query, tickets, ttl=None):
+        """Store tickets; `ttl` overrides the cache's ttl for this entry"""
+        now = time.time()
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO tickets (key, tickets, fetched_at, accessed_at, ttl)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (
+                cache_key(*query),
+                json.dumps([t.to_dict() for t in tickets], ensure_ascii=False),
+                now,
+                now,
+                ttl,
+            ),
+        )
+        self._evict(db)
+
+    def _evict(self, db):
+        (count,) = db.execute("SELECT COUNT(*) FROM tickets").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            db.execute(
+                "DELETE FROM tickets WHERE key IN "
+                "(SELECT key FROM tickets ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            with self._lock:
+                self.evictions += excess
+
+    def get_or_fetch(self, query, fetch):
+        """Cached tickets for `query`, calling `fetch()` on a miss.
+
+        Empty results are not cached: get_tickets also returns [] on errors.
+        """
+        cached = self.lookup(*query)
+        if cached is not None:
+            tickets, age, ttl = cached
+            if age <= ttl:
+                with self._lock:
+                    self.hits += 1
+                return tickets
+            if age <= ttl + self.stale_ttl:
+                with self._lock:
+                    self.stale_hits += 1
+                self._refresh_in_background(query, fetch)
+                return tickets
+
+        with self._lock:
+            self.misses += 1
+        tickets = fetch()
+        if tickets:
+            self.put(query, tickets)
+        return tickets
+
+    def _refresh_in_background(self, query, fetch):
+        key = cache_key(*query)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                tickets = fetch()
+                if tickets:
+                    self.put(query, tickets)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        (entries,) = self._db().execute("SELECT COUNT(*) FROM tickets").fetchone()
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read cached train tickets")
+    parser.add_argument("from_station", nargs="?")
+    parser.add_argument("to_station", nargs="?")
+    parser.add_argument("travel_date", nargs="?", help="dd/mm/yyyy")
+    parser.add_argument("--adults", type=int, default=2)
+    parser.add_argument("--children", type=int, default=0)
+    parser.add_argument("--infants", type=int, default=0)
+    parser.add_argument("--db", default="ticket_cache.sqlite3")
+    parser.add_argument("--stats", action="store_true")
+    args = parser.parse_args()
+
+    cache = TicketCache(args.db)
+    if args.stats or not args.travel_date:
+        print(json.dumps(cache.stats(), indent=2))
+        return
+
+    cached = cache.get(
+        args.from_station,
+        args.to_station,
+        args.travel_date,
+        args.adults,
+        args.children,
+        args.infants,
+    )
+    tickets, age = cached if cached else ([], None)
+    print(
+        json.dumps(
+            {"age": age, "tickets": [t.to_dict() for t in tickets]},
+            indent=2,
+            ensure_ascii=False,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()